@@ -24,104 +24,218 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import os
-import copy
+import stat
 import math
 import csv
 import re
-from Crypto.Hash import SHA256
-from Crypto.Cipher import AES
-from Crypto import Random
+import bisect
+from collections import OrderedDict
+from dbformat import *
+from kdf import KdfParams, new_params, LEGACY
+from search import SearchIndex, FuzzyIndex, split_words
+from sortedview import DisplayOrder
+from sealed import Sealed, seal, seal_many, unseal
 
-# bytes to separate entries with
+# bytes to separate entries with in the original (version 1) file format
 TOKEN1 = chr(30)
 TOKEN2 = chr(29)
 BUFFER = chr(0)
 WEB_SPEED = 1e6
 LOCAL_SPEED = 1e12
 
+# entries handed over at a time when loading
+LOAD_BATCH = 500
+
+# a save rewrites the whole file instead of appending to the journal once the
+# journal is larger than this fraction of the snapshot
+JOURNAL_FRACTION = 0.5
+
+# flags for MoveFileEx on Windows
+MOVEFILE_REPLACE_EXISTING = 0x1
+MOVEFILE_WRITE_THROUGH = 0x8
+
 ###############################################################################
 class PasswordData(object):
     """
-    This class contains a list of entries which comprise the password database,
+    This class contains the entries which comprise the password database,
     stores the encryption key (only while running), and handles encryption and
-    decryption of the data.
+    decryption of the data. Entries are kept in insertion order keyed by their
+    tag, and should only be changed through the methods below so that changes
+    are tracked. Unless lazy is False, passwords are kept sealed in memory
+    (see sealed.py) and only unsealed when an entry's password is read.
+    
+    An existing file is loaded straight away unless defer is True, in which
+    case it is loaded through PrepareLoad, for instance on another thread.
     """
-    def __init__(self, password, dbFile, new=False):
+    def __init__(self, password, dbFile, new=False, lazy=True, defer=False):
         self.valid = True
         self.dbFile = dbFile
+        self.lazy = lazy
+        
+        # Where the journal at the end of the db file starts and ends, which
+        # saves append only the changes to when possible. These are None
+        # until the file is in the container format, older files get
+        # rewritten as a snapshot on their first save.
+        self._journalStart = None
+        self._journalEnd = None
+        
+        # The file_state of the db file when this last read or wrote it, to
+        # notice another program saving it in between
+        self._fileState = None
+        
+        # Tags are persistent ids stored in the db file. They start at 1 and
+        # are never reused, even after the entry is deleted.
+        self._nextTag = 1
+        
+        # Tags of entries whose snapshot record in _storedFile is still
+        # current, so a full save can copy it without encrypting it again
+        self._stored = set()
+        self._storedFile = None
+        
+        # Tags of entries changed since loading or since the last encrypted save
+        self._added = OrderedDict()
+        self._updated = {}
+        self._deleted = set()
+        
+        # Tags of the entries with each content key, for duplicate detection
+        self._contents = {}
         
-        # Use SHA256 to generate encryption key from user password
-        myhash = SHA256.new()
-        myhash.update(password)
-        self.key = myhash.digest()
+        # Tags of the entries with each name, lower case, for lookups by name
+        self._names = {}
+        
+        # Entries in each category keyed by tag, and the sorted categories
+        self._categories = {}
+        self._sortedCategories = []
+        
+        # Word prefix index for type-ahead search, only ever kept in memory.
+        # It is built by the first Filter, or while loading if asked.
+        self._search = None
+        
+        # Entries in the order the GUI shows them, built by the first Filter
+        self._order = None
+        
+        # Trigram index for fuzzy searches, built by the first one or while
+        # loading like the word index
+        self._fuzzy = None
+        
+        # How the encryption key is derived from the user password (see
+        # kdf.py), and the key itself. The key is kept for the whole session
+        # so that saving does not pay for the derivation again.
+        self._kdf = None
+        self.key = None
+        
+        # Derivation parameters and key to switch to on the next full save,
+        # once derived for a new password by a save that then failed
+        self._newKey = None
+        
+        # A new password whose key the next save derives, on its own thread.
+        # For an original format file this is the password it was read with,
+        # as the first save upgrades it to a salted key.
+        self._newPassword = None
+        
+        # The SaveJob prepared but not yet finished, if any
+        self._job = None
+        
+        # True until the file has been read in, through a LoadJob
+        self.loading = not new
+        self.entries = OrderedDict()
         
         if new:
             # Write an empty db to a new file
-            self.entries = []
+            self._kdf = new_params()
+            self.key = self._kdf.derive(password)
             self.Write()
-        else:
+            
+        elif not defer:
             # Read and decrypt the db file
-            try:
-                with open(dbFile,'rb') as df:
-                    raw = df.read()
-                    
-                decrypter = AES.new\
-                            (
-                                self.key, 
-                                AES.MODE_CBC, 
-                                raw[0:AES.block_size]
-                            )
-                            
-                dataStr = decrypter.decrypt(raw[AES.block_size:])
-                self.entries = []
-
-                try:
-                    if dataStr and TOKEN1 not in dataStr:
-                        raise IndexError
-                        
-                    strs = dataStr.split(TOKEN1)
-
-                    for s in strs:
-                        if s:
-                            # String 's' must either be all BUFFER characters
-                            # or be separable by TOKEN2 into 5 sub-strings
-                            ss = s.split(TOKEN2)
-                            if len(ss) == 5:
-                                self.entries.append\
-                                (
-                                    Entry(ss[0],ss[1],ss[2],ss[3],ss[4])
-                                )
-                                
-                            elif len(s) != s.count(BUFFER):
-                                raise IndexError
-
-                except IndexError:
-                    self.valid = False
-                    self.errMsg = 'File could not be decrypted, '+\
-                                  'possibly due to an incorrect password'
+            job = self.PrepareLoad(password)
+            job.Run(self.InsertLoaded)
+            self.FinishLoad(job)
 
-            except IOError:
-                self.errMsg = 'File could not be loaded'
-                self.valid = False
-                
-        # create self-contained copy
-        self.oldEntries = copy.deepcopy(self.entries)
+    #--------------------------------------------------------------------------
+    def PrepareLoad(self, password, searchable=False):
+        """
+        Make a LoadJob which reads and decrypts the db file. Its Run method
+        may be called from another thread, handing over batches of entries
+        which must be passed to InsertLoaded on this thread, in order.
+        FinishLoad must be called with the job once it is done. The entries
+        must not be changed or saved before then. If searchable, the job
+        also builds the search indexes as it goes, so that the first search
+        does not have to.
+        """
+        self.loading = True
+        return LoadJob(password, self.dbFile, self.lazy, searchable=searchable)
+        
+    #--------------------------------------------------------------------------
+    def Reopen(self):
+        """
+        A new PasswordData with the db file as it is now, for when another
+        program may have changed it. The key is reused rather than derived
+        again, which works as long as the file has the same key derivation
+        parameters. If it does not, the result is not valid.
+        """
+        data = PasswordData(None, self.dbFile, lazy=self.lazy, defer=True)
+        job = data.PrepareLoad(None)
+        job.knownKey = (self._kdf, self.key)
+        job.newKey = self._newKey
+        job.newPassword = self._newPassword
+        job.Run(data.InsertLoaded)
+        data.FinishLoad(job)
+        return data
+        
+    #--------------------------------------------------------------------------
+    def InsertLoaded(self, entries):
+        """ Add a batch of entries read by a LoadJob """
+        for entry in entries:
+            self._insert(entry)
+            
+    #--------------------------------------------------------------------------
+    def FinishLoad(self, job):
+        """
+        Take in what a finished LoadJob learned about the file. If it failed,
+        valid is cleared and errMsg says why.
+        """
+        self.loading = False
+        
+        if job.errMsg is not None:
+            self.valid = False
+            self.errMsg = job.errMsg
+            return
+            
+        self._kdf, self.key = job.kdf, job.key
+        self._newKey = job.newKey
+        self._newPassword = job.newPassword
+        self._journalStart = job.journalStart
+        self._journalEnd = job.journalEnd
+        self._fileState = job.fileState
+        self._nextTag = job.nextTag
+        self._stored = job.stored
+        self._storedFile = job.storedFile
+        
+        if job.search is not None:
+            self._search = job.search
+            self._fuzzy = job.fuzzy
         
     #--------------------------------------------------------------------------
     def ImportCSV(self, csvFile):
         """
         Read entries from an uncrypted CSV file and add to the current database,
-        excluding duplicates
+        excluding duplicates. The passwords of the entries added are sealed
+        together at the end, which costs about as much as sealing one.
         """
-        
+        added = []
         with open(csvFile,'r') as csvFile:
             reader = csv.reader(csvFile, delimiter=',', quotechar='"')
             
             for row in reader:
                 newEntry = Entry(row[0],row[1],row[2],row[3],row[4])
                 
-                if newEntry not in self.entries:
-                    self.entries.append(newEntry)
+                if not self.IsDuplicate(newEntry):
+                    self._add(newEntry)
+                    added.append(newEntry)
+                    
+        if self.lazy:
+            seal_entries(added)
 
     
     #-------------------------------------------------------------------------- 
@@ -130,19 +244,160 @@ class PasswordData(object):
         Save the database, either to its original file, to an unencrypted
         csv file, or to a new encrypted file
         """
-        if newpassword is not None:
-            myhash = SHA256.new()
-            myhash.update(newpassword)
-            self.key = myhash.digest()
-    
         if asCSV:
             self.Write(encrypt=False, dest=dest)
+        else:
+            self._save(self.PrepareSave(dest, newpassword))
             
+    #-------------------------------------------------------------------------- 
+    def Compact(self):
+        """
+        Fold the journal back into a single snapshot by rewriting the whole
+        db file. Any unsaved changes are saved along with it.
+        """
+        self._save(self.PrepareSave(compact=True))
+    
+    #-------------------------------------------------------------------------- 
+    def PrepareSave(self, dest=None, newpassword=None, compact=False):
+        """
+        Take a snapshot of the database for saving, as a SaveJob whose Run
+        method does the encryption and writing and may be called from another
+        thread. The changes it saves stop being tracked here, so the entries
+        can be edited while it runs. FinishSave must be called with the job
+        once it is done, on this thread, before another save is prepared.
+        
+        The changes are appended to the journal when possible. A new password
+        or destination file, or compact, rewrites the whole file, and so does
+        any save once the snapshot holds none of the entries as they are or
+        the journal has grown past JOURNAL_FRACTION of the snapshot. If
+        another program has saved the file since it was read, nothing in it
+        can be kept, so every entry is encrypted and written out again.
+        """
+        if self._job is not None:
+            raise RuntimeError('A save is already in progress')
+            
+        if self.loading:
+            raise RuntimeError('The database has not finished loading')
+            
+        if newpassword is None:
+            newpassword = self._newPassword
+            
+        rekey = self._newKey is not None or newpassword is not None
+        hasJournal = self._journalEnd is not None
+        unchanged = self._file_unchanged()
+        
+        # nothing left in the snapshot to keep, or too much in the journal
+        snapshotStale = not self._stored or (hasJournal and 
+                        self._journalEnd - self._journalStart > 
+                        self._journalStart * JOURNAL_FRACTION)
+                        
+        full = compact or dest is not None or rekey or not hasJournal or \
+               snapshotStale or not unchanged
+        
+        job = SaveJob(dest or self.dbFile, self._kdf, self.key, self._nextTag)
+        job.fileState = self._fileState
+        
+        if full:
+            # Stored records cannot be copied across a change of key
+            if newpassword is not None:
+                job.newPassword = newpassword
+            elif self._newKey is not None:
+                job.kdf, job.key = self._newKey
+                job.newKey = self._newKey
+            elif unchanged:
+                job.storedFile = self._storedFile
+                
+            job.records = [(tag, None if tag in self._stored and 
+                                 job.storedFile else e.col_keys())
+                           for tag, e in self.entries.iteritems()]
         else:
-            if dest is not None:
-                self.dbFile = dest
-            self.Write()
-            self.oldEntries = copy.deepcopy(self.entries)
+            job.journalEnd = self._journalEnd
+            job.ops = [(JOURNAL_DELETE, tag, ()) for tag in self._deleted]
+            
+            for tag, e in self._updated.items():
+                job.ops.append((JOURNAL_UPDATE, tag, e.col_keys()))
+            
+            for tag, e in self._added.items():
+                job.ops.append((JOURNAL_ADD, tag, e.col_keys()))
+            
+        job.changes = (self._added.copy(), self._updated.copy(), 
+                       self._deleted.copy())
+        self._clear_changes()
+        self._job = job
+        return job
+        
+    #-------------------------------------------------------------------------- 
+    def FinishSave(self, job):
+        """
+        Take in the result of a SaveJob from PrepareSave. If it did not
+        complete, its changes are tracked again so that they are saved next
+        time, merged with any made while it ran, and so is a new password for
+        this file (or the key already derived for it). A new password for
+        another file is dropped with the failed save, so that the next save
+        of this one keeps its own password. A pending password is kept
+        sealed.
+        """
+        self._job = None
+        
+        if not job.done:
+            if job.newPassword is not None and self._is_db_file(job.dbFile):
+                if job.newKey is not None:
+                    self._newPassword = None
+                    self._newKey = job.newKey
+                elif isinstance(job.newPassword, Sealed):
+                    self._newPassword = job.newPassword
+                else:
+                    self._newPassword = seal(job.newPassword)
+                    
+            self._restore_changes(*job.changes)
+            return
+            
+        self._journalEnd = job.journalEnd
+        self._fileState = job.fileState
+        
+        if job.records is not None:
+            self._journalStart = job.journalEnd
+            
+            # the file now has the new key, if any, and nothing is pending
+            if job.newKey is not None:
+                self._kdf, self.key = job.newKey
+            self._newPassword = None
+            self._newKey = None
+                
+            changed = set(self._added) | set(self._updated) | self._deleted
+            self._stored = set(t for t, f in job.records if t not in changed)
+            self._storedFile = job.dbFile
+            self.dbFile = job.dbFile
+            
+    #-------------------------------------------------------------------------- 
+    def _is_db_file(self, path):
+        """ Check whether a path names the db file """
+        return os.path.abspath(path) == os.path.abspath(self.dbFile)
+            
+    #-------------------------------------------------------------------------- 
+    def _file_unchanged(self):
+        """ Check that the db file is still as this last read or wrote it """
+        if self._fileState is None:
+            return False
+            
+        try:
+            with open(self.dbFile,'rb') as df:
+                return file_state(df) == self._fileState
+        except IOError:
+            return False
+            
+    #-------------------------------------------------------------------------- 
+    def IsSaving(self):
+        """ Check if a prepared save has not been finished yet """
+        return self._job is not None
+            
+    #-------------------------------------------------------------------------- 
+    def _save(self, job):
+        """ Run a save job on this thread """
+        try:
+            job.Run()
+        finally:
+            self.FinishSave(job)
     
     #-------------------------------------------------------------------------- 
     def HasChanged(self):
@@ -150,10 +405,36 @@ class PasswordData(object):
         Check if the data in the database has changed since either loading or
         since the last encrypted save (CSV exports are ignored).
         """
-        if len(self.entries) != len(self.oldEntries):
-            return True
-        else:
-            return any([i != j for i,j in zip(self.entries, self.oldEntries)])
+        return bool(self._added or self._updated or self._deleted)
+    
+    #-------------------------------------------------------------------------- 
+    def _clear_changes(self):
+        """ Forget the tracked changes once they have been saved """
+        self._added.clear()
+        self._updated.clear()
+        self._deleted.clear()
+        
+    #-------------------------------------------------------------------------- 
+    def _restore_changes(self, added, updated, deleted):
+        """
+        Track the changes of a failed save again, ahead of those made since.
+        Entries deleted since then are left out.
+        """
+        for tag in added:
+            if tag in self._deleted:
+                # never saved, so there is nothing to delete from the file
+                self._deleted.discard(tag)
+            elif tag in self.entries:
+                self._updated.pop(tag, None)
+                
+        restored = [(t, e) for t, e in added.items() if t in self.entries]
+        self._added = OrderedDict(restored + self._added.items())
+        
+        for tag in updated:
+            if tag in self.entries and tag not in self._added:
+                self._updated[tag] = self.entries[tag]
+                
+        self._deleted.update(deleted)
     
     
     #-------------------------------------------------------------------------- 
@@ -164,30 +445,7 @@ class PasswordData(object):
         """ 
         
         if encrypt:
-
-            # generate string of entries
-            es = TOKEN1.join\
-                 (
-                     [TOKEN2.join(e.col_strings()) for e in self.entries]
-                 ) + TOKEN1
-            
-            iv = Random.new().read(AES.block_size)
-            encrypter = AES.new(self.key, AES.MODE_CBC, iv)
-            
-            # make sure the string is a multiple of the block size by buffering
-            # the end with the BUFFER character, which will be ignored when 
-            # it is read
-            bs = AES.block_size
-            buff = (bs*(len(es) % bs > 0) - (len(es) % bs))*BUFFER
-            
-            # Encrypt the string
-            ciphertext = encrypter.encrypt(es+buff)
-            
-            # Write the encrypted string to the dabase file along with the
-            # initialization vector (iv)
-            with open(self.dbFile,'wb') as df:
-                df.write(iv)
-                df.write(ciphertext)
+            self.Compact()
                 
         else:
         
@@ -196,10 +454,35 @@ class PasswordData(object):
                 writer = csv.writer(csvFile, delimiter=',',quotechar='"',
                                     quoting=csv.QUOTE_MINIMAL)
                                     
-                for e in self.entries:
-                    writer.writerow(e.col_strings())
+                for e in self.entries.itervalues():
+                    writer.writerow(e.record_strings())
                 
+    #-------------------------------------------------------------------------- 
+    def ReadEntries(self, tags):
+        """
+        Read only the entries with the given tags from the db file as it was
+        last saved, without decrypting the rest of it. Files in the original
+        format have no index, so those are streamed until the entries have
+        been found.
+        """
+        with open(self.dbFile,'rb') as df:
+            if is_container(df):
+                reader = DbReader(df, self.key)
+                return [Entry(*f, tag=t) 
+                        for t, f in zip(tags, reader.read_records(tags))]
                 
+            wanted = set(tags)
+            found = {}
+            
+            for entry in stream_entries(df, self.key):
+                if len(found) == len(wanted):
+                    break
+                    
+                if entry.tag in wanted:
+                    found[entry.tag] = entry
+                    
+            return [found[t] for t in tags]
+        
     #-------------------------------------------------------------------------- 
     def UpdateEntry(self, tag, newEntry):
         """ 
@@ -207,59 +490,607 @@ class PasswordData(object):
         input 'newEntry'. This is done rather than simply using replace so
         that the entry's tag is retained.
         """
-        tags = [e.tag for e in self.entries]
-        idx = tags.index(tag)
-        self.entries[idx].Update(newEntry)
+        entry = self.entries[tag]
+        self._unindex(entry)
+        entry.Update(newEntry)
+        if self.lazy:
+            entry.seal()
+        self._index(entry)
+        self._stored.discard(tag)
+        
+        if tag not in self._added:
+            self._updated[tag] = entry
+    
+    #-------------------------------------------------------------------------- 
+    def AddEntry(self, entry):
+        """ Add a new entry to the database, giving it a new unique tag """
+        if self.lazy:
+            entry.seal()
+        self._add(entry)
+        
+    #-------------------------------------------------------------------------- 
+    def _add(self, entry):
+        """ Add a new entry as it is, giving it a new unique tag """
+        entry.tag = self._nextTag
+        self._nextTag += 1
+        self._insert(entry)
+        self._added[entry.tag] = entry
+    
+    #-------------------------------------------------------------------------- 
+    def DeleteEntry(self, tag):
+        """ Remove the entry with a specified tag from the database """
+        entry = self.entries.pop(tag)
+        self._unindex(entry)
+        self._stored.discard(tag)
+        
+        if tag in self._added:
+            del self._added[tag]
+        else:
+            self._updated.pop(tag, None)
+            self._deleted.add(tag)
+    
+    #-------------------------------------------------------------------------- 
+    def GetEntry(self, tag):
+        """ Get the entry with a specified tag """
+        return self.entries[tag]
+    
+    #-------------------------------------------------------------------------- 
+    def IsDuplicate(self, entry):
+        """ Check if an entry with the same contents is already stored """
+        tags = self._contents.get(entry.content_key(), ())
+        password = entry.reveal(False)
+        return any(self.entries[t].reveal(False) == password for t in tags)
+    
+    #-------------------------------------------------------------------------- 
+    def _insert(self, entry):
+        """ Store an entry and add it to the indexes """
+        self.entries[entry.tag] = entry
+        self._index(entry)
+        
+    #-------------------------------------------------------------------------- 
+    def _index(self, entry):
+        """ Add an entry's current contents to the lookup indexes """
+        key = entry.content_key()
+        if key in self._contents:
+            self._contents[key].append(entry.tag)
+        else:
+            self._contents[key] = [entry.tag]
+            
+        name = _name_key(entry.name)
+        if name in self._names:
+            self._names[name].append(entry.tag)
+        else:
+            self._names[name] = [entry.tag]
+        
+        cat = entry.category
+        if cat not in self._categories:
+            self._categories[cat] = OrderedDict()
+            bisect.insort(self._sortedCategories, cat)
+        self._categories[cat][entry.tag] = entry
+        
+        if self._search is not None:
+            self._search.add(entry.tag, entry.search_strings())
+        if self._order is not None:
+            self._order.add(entry)
+        if self._fuzzy is not None:
+            self._fuzzy.add(entry.tag, entry.sorting_name())
+        
+    #-------------------------------------------------------------------------- 
+    def _unindex(self, entry):
+        """ Remove an entry's current contents from the lookup indexes """
+        key = entry.content_key()
+        tags = self._contents[key]
+        tags.remove(entry.tag)
+        if not tags:
+            del self._contents[key]
+            
+        name = _name_key(entry.name)
+        tags = self._names[name]
+        tags.remove(entry.tag)
+        if not tags:
+            del self._names[name]
+            
+        cat = entry.category
+        del self._categories[cat][entry.tag]
+        if not self._categories[cat]:
+            del self._categories[cat]
+            i = bisect.bisect_left(self._sortedCategories, cat)
+            del self._sortedCategories[i]
+            
+        if self._search is not None:
+            self._search.remove(entry.tag)
+        if self._order is not None:
+            self._order.remove(entry)
+        if self._fuzzy is not None:
+            self._fuzzy.remove(entry.tag)
     
     #-------------------------------------------------------------------------- 
     def GetCategories(self):
         """ Get a list of category options for the GUI """
-        return ['All'] + sorted(list(set([e.category for e in self.entries])))
+        return ['All'] + self._sortedCategories
 
     #-------------------------------------------------------------------------- 
     def GetEntries(self, cat):
         """ Get all entries of a specified category """
         if cat == 'All':
-            return self.entries
+            return self.entries.values()
+        elif cat in self._categories:
+            return self._categories[cat].values()
         else:
-            return [e for e in self.entries if e.category == cat]
+            return []
+            
+    #-------------------------------------------------------------------------- 
+    def GetByName(self, name, cat='All'):
+        """ Get the entries of a category with a name, ignoring case """
+        return next(self.GetMany([name], cat))[1]
+        
+    #-------------------------------------------------------------------------- 
+    def GetMany(self, keys, cat='All'):
+        """
+        Look up many entries at once. Each key is either a tag or a name,
+        which matches the entries of the category with that name ignoring
+        case. Yields a (key, list of matching entries) pair for each key in
+        turn, so a long list of keys can be answered as it is worked through.
+        """
+        if cat == 'All':
+            entries = self.entries
+        else:
+            entries = self._categories.get(cat, {})
+            
+        for key in keys:
+            if isinstance(key, (int, long)):
+                found = [entries[key]] if key in entries else []
+            else:
+                tags = self._names.get(_name_key(key), ())
+                found = [entries[t] for t in tags if t in entries]
+                
+            yield key, found
+            
+    #-------------------------------------------------------------------------- 
+    def Filter(self, query, cat='All'):
+        """
+        Get the entries of a category where every word of a search query
+        starts a word in the name, username, category or comments (ignoring
+        case), for filtering as the query is typed. A query without words
+        matches every entry. They come in the order the GUI shows them in
+        (sorting_name then tag), which is kept up to date as entries change
+        so that each keystroke does not sort them again. The indexes this
+        uses are built on the first call and kept up to date after.
+        """
+        if cat == 'All':
+            entries = self.entries
+        else:
+            entries = self._categories.get(cat, {})
+            
+        if self._order is None:
+            self._order = DisplayOrder(self.entries.itervalues())
+        order = self._order.keys()
+        
+        if not split_words(query):
+            return [entries[t] for name, t in order if t in entries]
+            
+        if self._search is None:
+            self._search = SearchIndex()
+            for tag, entry in self.entries.iteritems():
+                self._search.add(tag, entry.search_strings())
+                
+        tags = self._search.find(query)
+        return [entries[t] for name, t in order if t in tags and t in entries]
+        
+    #-------------------------------------------------------------------------- 
+    def Search(self, query, limit=10):
+        """
+        Get up to limit entries whose category and name (sorting_name) best
+        match a possibly misspelled query, closest match first. The trigram
+        index this uses is built on the first call, unless the load job built
+        it, and kept up to date after.
+        """
+        if self._fuzzy is None:
+            self._fuzzy = FuzzyIndex()
+            for tag, entry in self.entries.iteritems():
+                self._fuzzy.add(tag, entry.sorting_name())
+                
+        return [self.entries[t] for d, t in self._fuzzy.search(query, limit)]
+            
+        
+###############################################################################
+class LoadJob(object):
+    """
+    Reading of a db file for PasswordData.PrepareLoad. Run decrypts and
+    parses the entries, seals their passwords if lazy, and hands them to a
+    callback in batches of batchSize as they become ready. It touches nothing
+    shared, so it can run on a worker thread with the callback passing the
+    batches back to the thread that owns the data. If searchable, it indexes
+    the entries for PasswordData.Filter and Search as they go past.
+    """
+    def __init__(self, password, dbFile, lazy=True, batchSize=LOAD_BATCH,
+                 searchable=False):
+        self.password = password
+        self.dbFile = dbFile
+        self.lazy = lazy
+        self.batchSize = batchSize
+        self.search = SearchIndex() if searchable else None
+        self.fuzzy = FuzzyIndex() if searchable else None
+        
+        # Progress, with total None until the number of records is known
+        # (or for original format files, which do not store it)
+        self.count = 0
+        self.total = None
+        self.cancelled = False
+        
+        # Derivation parameters and key to use instead of the password, if the
+        # file still has those parameters
+        self.knownKey = None
+        
+        # What PasswordData.FinishLoad takes in
+        self.kdf = None
+        self.key = None
+        self.newKey = None
+        self.newPassword = None
+        self.journalStart = None
+        self.journalEnd = None
+        self.fileState = None
+        self.nextTag = None
+        self.stored = set()
+        self.storedFile = None
+        self.errMsg = None
+        
+    #-------------------------------------------------------------------------- 
+    def Run(self, callback):
+        """
+        Read the file, calling callback with each batch of entries. A wrong
+        password, or a file that is damaged or can not be read, is kept in
+        errMsg rather than raised. Anything else is raised, and the caller
+        must still hand the job to FinishLoad.
+        """
+        try:
+            with open(self.dbFile,'rb') as df:
+                try:
+                    self._read(df, callback)
+                    
+                except WrongPasswordError:
+                    self.errMsg = 'Incorrect password'
+                    
+                except CorruptFileError:
+                    self.errMsg = 'File is damaged or has been altered'
+                    
+                except IndexError:
+                    # Original format files have no key check or MAC
+                    self.errMsg = 'File could not be decrypted, '+\
+                                  'possibly due to an incorrect password'
+                                  
+        except IOError:
+            self.errMsg = 'File could not be loaded'
+            
+        finally:
+            self.password = None
+        
+    #-------------------------------------------------------------------------- 
+    def Cancel(self):
+        """ Stop handing over entries, for when the data is not wanted """
+        self.cancelled = True
+        
+    #-------------------------------------------------------------------------- 
+    def _read(self, df, callback):
+        """ Read either file format """
+        if is_container(df):
+            self.fileState = file_state(df)
+            self.kdf = read_kdf(df)
+            self.key = self._derive(self.kdf)
+            reader = DbReader(df, self.key)
+            self.total = reader.current_count()
+            
+            self._hand_over(_container_entries(reader), callback)
+            
+            self.journalStart = reader.journalStart
+            self.journalEnd = reader.journalEnd
+            self.nextTag = reader.next_id()
+            self.stored = set(reader.unchanged_ids())
+            self.storedFile = self.dbFile
+            
+        else:
+            self.kdf = KdfParams(LEGACY)
+            self.key = self._derive(self.kdf)
+            
+            self._hand_over(stream_entries(df, self.key), callback)
+            self.nextTag = self.count + 1
+            
+            # The first save rewrites the file in the container format,
+            # which needs a salted key. Calibrating and deriving it is left
+            # to that save's job, so loading does not pay for it. The
+            # password is sealed until then, like the entries' passwords.
+            if self.newKey is None and self.newPassword is None:
+                self.newPassword = seal(self.password)
+            
+    #-------------------------------------------------------------------------- 
+    def _derive(self, kdf):
+        """ Key for the file, reusing knownKey if its parameters match """
+        if self.knownKey is not None and self.knownKey[0] == kdf:
+            return self.knownKey[1]
+            
+        if self.password is None:
+            raise WrongPasswordError('The key derivation parameters changed')
+            
+        return kdf.derive(self.password)
+        
+    #-------------------------------------------------------------------------- 
+    def _hand_over(self, entries, callback):
+        """ Pass entries to callback in batches, sealed if lazy """
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) == self.batchSize:
+                self._send(batch, callback)
+                batch = []
+                
+            if self.cancelled:
+                return
+                
+        if batch:
+            self._send(batch, callback)
+            
+    #-------------------------------------------------------------------------- 
+    def _send(self, batch, callback):
+        """ Seal the passwords of a batch, all at once, and hand it over """
+        if self.lazy:
+            seal_entries(batch)
+                
+        if self.search is not None:
+            for e in batch:
+                self.search.add(e.tag, e.search_strings())
+                self.fuzzy.add(e.tag, e.sorting_name())
+                
+        self.count += len(batch)
+        callback(batch)
+        
+        
+###############################################################################
+class SaveJob(object):
+    """
+    A save of the database as it was when PasswordData.PrepareSave made it.
+    It only holds immutable copies of what it writes (passwords still
+    sealed), so Run can be called on a worker thread while the entries are
+    edited. Either 'records' is set, for rewriting the whole file, or 'ops',
+    for appending them to the journal. Records are only copied from
+    storedFile, and ops only appended, while the db file still has the
+    file_state 'fileState', so that a save by another program is not
+    corrupted. The job fails with an IOError if it does not.
+    """
+    def __init__(self, dbFile, kdf, key, nextTag):
+        self.dbFile = dbFile
+        self.kdf = kdf
+        self.key = key
+        self.nextTag = nextTag
+        
+        # (tag, fields) for a full save, fields being None for records to
+        # copy from storedFile as they are
+        self.records = None
+        self.storedFile = None
+        self.newKey = None
+        
+        # a new password to derive newKey from, with a new salt and freshly
+        # calibrated cost, before writing with it (possibly Sealed)
+        self.newPassword = None
+        
+        # (operation, tag, fields) to append to the journal at journalEnd
+        self.ops = None
+        self.journalEnd = None
+        
+        # the file_state expected before writing, and the one left after
+        self.fileState = None
+        
+        # the changes saved, to be tracked again if the save fails
+        self.changes = None
+        
+        self.done = False
+        
+    #-------------------------------------------------------------------------- 
+    def Run(self):
+        """
+        Write the snapshot, first deriving the key for a new password if
+        there is one. A full save writes a new file next to the db file and
+        moves it into place once it is on disk, so the old file is left
+        whole if this fails part way.
+        """
+        if self.newPassword is not None and self.newKey is None:
+            password = self.newPassword
+            if isinstance(password, Sealed):
+                password = unseal(password, False)
+                
+            kdf = new_params()
+            self.newKey = (kdf, kdf.derive(password))
+            self.kdf, self.key = self.newKey
+            
+        if self.records is not None:
+            self._write_file()
+        else:
+            self._write_journal()
+            
+        self.done = True
+        
+    #-------------------------------------------------------------------------- 
+    def _write_file(self):
+        """
+        Write every record to a new file which replaces the db file. If the
+        db file is a symbolic link, the file it points to is the one
+        replaced (as a journal append would write to it), and the new file
+        gets the permissions of the one it replaces.
+        """
+        import tempfile
+        target = os.path.realpath(self.dbFile)
+        folder = os.path.dirname(target)
+        fd, tmpFile = tempfile.mkstemp(dir=folder)
+        
+        try:
+            if os.path.exists(target):
+                os.chmod(tmpFile, stat.S_IMODE(os.stat(target).st_mode))
+                
+            with os.fdopen(fd,'w+b') as df:
+                if self.storedFile is not None:
+                    with open(self.storedFile,'rb') as source:
+                        self._check_state(source)
+                        self._write_snapshot(df, DbReader(source, self.key))
+                else:
+                    self._write_snapshot(df, None)
+                    
+                df.flush()
+                os.fsync(df.fileno())
+                self.fileState = file_state(df)
+                    
+            replace_file(tmpFile, target)
+            
+        except:
+            if os.path.exists(tmpFile):
+                os.remove(tmpFile)
+            raise
+            
+        sync_folder(folder)
+            
+    #-------------------------------------------------------------------------- 
+    def _write_snapshot(self, df, source):
+        """
+        Write every record to a new db file. Records without fields are
+        copied as they are from the file open in the DbReader 'source', the
+        rest are encrypted.
+        """
+        def records():
+            for tag, fields in self.records:
+                if fields is None:
+                    yield tag, source.read_raw(tag)
+                else:
+                    yield tag, _unsealed(fields)
+                    
+        self.journalEnd = write_db(df, self.key, self.kdf, records(), 
+                                   self.nextTag)
+                
+    #-------------------------------------------------------------------------- 
+    def _write_journal(self):
+        """
+        Append only the entries added, updated or deleted since the last save
+        to the journal at the end of the db file, instead of rewriting it
+        """
+        if not self.ops:
+            return
+            
+        ops = [(op, tag, _unsealed(fields)) for op, tag, fields in self.ops]
+        
+        with open(self.dbFile,'r+b') as df:
+            self._check_state(df)
+            self.journalEnd = append_journal(df, self.key, ops, 
+                                             self.journalEnd)
+            df.flush()
+            os.fsync(df.fileno())
+            self.fileState = file_state(df)
+            
+    #-------------------------------------------------------------------------- 
+    def _check_state(self, df):
+        """ Refuse to build on a db file another program has saved since """
+        if file_state(df) != self.fileState:
+            raise IOError('The database file has been saved by another '+
+                          'program since it was opened')
             
         
 ###############################################################################
 class Entry(object):
     """
     This is a basic class for storing each entry in the password database. It
-    contains 5 strings, a unique tag, and some methods for displaying its
-    data in the GUI and exporting it to a file
+    contains 5 strings, a unique tag which PasswordData assigns when the
+    entry is added and which is stored in the db file, and some methods for
+    displaying its data in the GUI and exporting it to a file. Attributes are
+    kept in slots rather than a per-instance __dict__ since large databases
+    hold very many of these. The password may be kept sealed (see sealed.py),
+    in which case reading the password attribute unseals it.
     """
+    __slots__ = ('tag', 'name', 'username', '_password', 
+                 'category', 'comments')
+    
     #-------------------------------------------------------------------------- 
-    def __init__(self, name, username, password, category, comments):
-        self.tag = id(self)
+    def __init__(self, name, username, password, category, comments, 
+                 tag=None):
+        self.tag = tag
         self.name = name
         self.username = username
-        self.password = password
+        self._password = password
         self.comments = comments
         self.category = category
         
+    #-------------------------------------------------------------------------- 
+    @property
+    def password(self):
+        """ The password, for showing, editing or copying it """
+        return self.reveal()
+        
+    #-------------------------------------------------------------------------- 
+    @password.setter
+    def password(self, value):
+        self._password = value
+        
+    #-------------------------------------------------------------------------- 
+    def reveal(self, cache=True):
+        """
+        The password, unsealed if needed. Passing cache=False keeps it out of
+        the cache of recently unsealed values, for bulk use like saving.
+        """
+        if isinstance(self._password, Sealed):
+            return unseal(self._password, cache)
+        return self._password
+        
+    #-------------------------------------------------------------------------- 
+    def seal(self):
+        """ Keep the password sealed from now on """
+        if not isinstance(self._password, Sealed):
+            self._password = seal(self._password)
+        
     #-------------------------------------------------------------------------- 
     def col_strings(self):
-        """ List of data strings, for display in GUI and saving to files """
+        """ List of data strings, for display in GUI """
         return [self.name, self.username, self.password, 
                 self.category, self.comments]
         
+    #-------------------------------------------------------------------------- 
+    def record_strings(self):
+        """
+        List of data strings for saving to files, unsealing the password
+        without caching it
+        """
+        return [self.name, self.username, self.reveal(False), 
+                self.category, self.comments]
+        
+    #-------------------------------------------------------------------------- 
+    def col_keys(self):
+        """
+        Like col_strings, but with the password as it is stored. Equal keys
+        mean equal strings, so changes can be found without unsealing.
+        """
+        return (self.name, self.username, self._password, 
+                self.category, self.comments)
+        
     #-------------------------------------------------------------------------- 
     def sorting_name(self):
         """ String used for sorting the display in the GUI """
         return self.category +' '+ self.name
         
+    #-------------------------------------------------------------------------- 
+    def search_strings(self):
+        """ Fields matched by searches, which excludes the password """
+        return [self.name, self.username, self.category, self.comments]
+        
+    #-------------------------------------------------------------------------- 
+    def content_key(self):
+        """
+        Hashable key of all fields except tag and password, equal for equal
+        entries. The password is left out so it does not have to be unsealed.
+        """
+        return (self.name, self.username, self.category, self.comments)
+        
     #-------------------------------------------------------------------------- 
     def __eq__(self, other):
         """ Equality defined by all entries except tag """
         return self.name     == other.name     and \
-               self.password == other.password and \
                self.comments == other.comments and \
                self.category == other.category and \
-               self.username == other.username
+               self.username == other.username and \
+               self.reveal(False) == other.reveal(False)
          
     #--------------------------------------------------------------------------       
     def __ne__(self, other):
@@ -271,10 +1102,155 @@ class Entry(object):
         """ Update the stored values from newEntry except tag """
         self.name = newEntry.name
         self.username = newEntry.username
-        self.password = newEntry.password
+        self._password = newEntry._password
         self.comments = newEntry.comments
         self.category = newEntry.category
     
+###############################################################################
+def replace_file(src, dst):
+    """ Move file src over dst, as atomically as the platform allows """
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+        
+    elif os.name == 'nt':
+        # rename does not overwrite on Windows, but MoveFileEx does
+        import ctypes
+        flags = MOVEFILE_REPLACE_EXISTING | MOVEFILE_WRITE_THROUGH
+        if not ctypes.windll.kernel32.MoveFileExW(unicode(src), unicode(dst), 
+                                                  flags):
+            raise ctypes.WinError()
+            
+    else:
+        os.rename(src, dst)
+        
+#------------------------------------------------------------------------------
+def sync_folder(folder):
+    """
+    Flush a folder's entries to disk, so a file just moved into it is still
+    there after a crash. Windows cannot open folders, and MoveFileEx has
+    already written its change through.
+    """
+    if os.name == 'nt':
+        return
+        
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+        
+#------------------------------------------------------------------------------
+def _name_key(name):
+    """
+    Name as it is looked up, in lower case. Names that are not utf-8 text
+    (which CSV imports can hold) are kept as bytes, only lowering ASCII.
+    """
+    if isinstance(name, bytes):
+        try:
+            name = name.decode('utf-8')
+        except UnicodeDecodeError:
+            return name.lower()
+    return name.lower()
+    
+#------------------------------------------------------------------------------
+def seal_entries(entries):
+    """ Seal the passwords of a list of entries, all at once """
+    sealed = seal_many([e.reveal(False) for e in entries])
+    for e, value in zip(entries, sealed):
+        e.password = value
+        
+#------------------------------------------------------------------------------
+def _unsealed(fields):
+    """ Record fields from Entry.col_keys(), with the password unsealed """
+    return [unseal(f, False) if isinstance(f, Sealed) else f for f in fields]
+    
+#------------------------------------------------------------------------------
+def stream_entries(df, key, chunkSize=CHUNK_SIZE):
+    """
+    Generator which decrypts an open db file in fixed-size chunks and yields
+    each Entry as soon as its record has been decrypted, so only one chunk
+    plus a partial record is ever held in memory. For container files a
+    wrong key raises WrongPasswordError and damaged data CorruptFileError.
+    Original format files can only raise IndexError for either, when the
+    decrypted data does not parse.
+    """
+    if is_container(df):
+        for entry in _container_entries(DbReader(df, key), chunkSize):
+            yield entry
+            
+    else:
+        for entry in _stream_legacy(df, key, chunkSize):
+            yield entry
+            
+#------------------------------------------------------------------------------
+def _container_entries(reader, chunkSize=CHUNK_SIZE):
+    """ Generator over the entries in a container file, journal applied """
+    for tag, fields in reader.iter_current(chunkSize):
+        if len(fields) != 5:
+            raise CorruptFileError('Record %d has the wrong fields' % tag)
+            
+        yield Entry(*fields, tag=tag)
+        
+#------------------------------------------------------------------------------
+def _stream_legacy(df, key, chunkSize):
+    """
+    Stream entries from the original single-blob format, in which records
+    are separated by TOKEN1, fields by TOKEN2, and the end is padded with
+    BUFFER. The CBC state carries over between chunks. These files have no
+    stored ids, so entries are tagged by their position starting at 1.
+    """
+    bs = BLOCK_SIZE
+    chunkSize = max(bs, chunkSize - chunkSize % bs)
+    
+    decrypter = cbc(key, df.read(bs))
+    
+    tail = ''
+    foundToken = False
+    tag = 1
+    
+    while True:
+        raw = df.read(chunkSize)
+        if not raw:
+            break
+            
+        strs = (tail + decrypter.decrypt(raw)).split(TOKEN1)
+        
+        # The last piece may be a record cut off by the chunk boundary
+        tail = strs.pop()
+        
+        for s in strs:
+            foundToken = True
+            entry = _parse_record(s)
+            if entry is not None:
+                entry.tag = tag
+                tag += 1
+                yield entry
+                
+    if tail:
+        if not foundToken:
+            raise IndexError
+            
+        entry = _parse_record(tail)
+        if entry is not None:
+            entry.tag = tag
+            yield entry
+        
+#------------------------------------------------------------------------------
+def _parse_record(s):
+    """
+    String 's' must either be empty, be all BUFFER characters, or be
+    separable by TOKEN2 into 5 sub-strings. Returns an Entry for the latter.
+    """
+    if s:
+        ss = s.split(TOKEN2)
+        if len(ss) == 5:
+            return Entry(ss[0],ss[1],ss[2],ss[3],ss[4])
+            
+        elif len(s) != s.count(BUFFER):
+            raise IndexError
+            
+    return None
+
 ###############################################################################
 def calc_password_strength(password, speed=LOCAL_SPEED):
     """
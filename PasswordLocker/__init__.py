@@ -23,4 +23,14 @@ ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from mainFrame import *
+from PasswordData import PasswordData, Entry, calc_password_strength, \
+                         WEB_SPEED, LOCAL_SPEED
+
+#------------------------------------------------------------------------------
+def MainFrame(*args, **kwargs):
+    """
+    Open the main window. The GUI modules are imported here rather than with
+    the package, so that the command line interface can run without wx.
+    """
+    from mainFrame import MainFrame
+    return MainFrame(*args, **kwargs)
@@ -0,0 +1,389 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Agent which keeps a database unlocked in memory and answers lookups over a
+Unix domain socket, like ssh-agent does for keys, so that scripts making many
+lookups do not each pay for deriving the key and decrypting the file. Start
+it with
+
+    python -m PasswordLocker --db FILE agent
+
+which prints the socket path to put in PASSWORDLOCKER_AGENT. The command
+line interface sends get and list to the agent when that is set.
+
+Requests and responses are single lines of JSON. A request names an 'op'
+and the db file it is meant for, and a response has 'ok' and either
+'value' or 'error'. Fields are byte strings that need not be utf-8 (CSV
+imports and the original file format can hold any bytes), so every string
+is sent as the text that decodes it as latin-1, which keeps each byte.
+
+  ping                    whether the agent is locked
+  get name [field] [category]
+  get_many keys [field] [category]
+                          for each key (a name, or an entry id as a number)
+                          in one go, a dict with either the 'value' or the
+                          'error' for it
+  list [query] [category] [ids]
+                          rows of name, username and category, after the
+                          entry id if ids is true
+  search query [limit]    closest names to a possibly misspelled query
+  lock                    forget the database until unlocked
+  unlock password         load the database again
+  stop                    lock and exit
+
+After idleTimeout seconds without a request the agent locks itself. The
+file is read again whenever it has changed on disk since it was loaded.
+Passwords are kept sealed in memory (see sealed.py) while it runs. The
+socket is created in a new folder only the user can open, which is removed
+again when the agent stops.
+"""
+
+import os
+import json
+import stat
+import time
+import socket
+import tempfile
+import threading
+import SocketServer
+from lookup import FIELDS, EntryNotFound, find_one, lookup_many, field_value
+from sealed import clear_cache
+
+# Seconds without a request after which the agent locks
+IDLE_TIMEOUT = 15*60
+
+# Seconds between checks for the idle timeout
+POLL_INTERVAL = 1.0
+
+###############################################################################
+class AgentError(Exception):
+    """ The agent could not be reached, or refused a request """
+    pass
+
+###############################################################################
+class Agent(object):
+    """
+    Holds one unlocked PasswordData and answers requests for it. Requests
+    from different connections may arrive on different threads, so they are
+    answered one at a time.
+    """
+    def __init__(self, data, idleTimeout=IDLE_TIMEOUT):
+        self.dbFile = os.path.realpath(data.dbFile)
+        self.idleTimeout = idleTimeout
+        self.stopped = False
+        
+        self._data = data
+        self._mtime = _mtime(data.dbFile)
+        self._lastUsed = time.time()
+        self._lock = threading.Lock()
+        
+    #--------------------------------------------------------------------------
+    def handle(self, request):
+        """ Response to a request, as a dict """
+        with self._lock:
+            self._lastUsed = time.time()
+            try:
+                value = self._answer(request)
+            except (AgentError, EntryNotFound) as e:
+                return {'ok': False, 'error': str(e)}
+            except (KeyError, TypeError, ValueError):
+                return {'ok': False, 'error': 'Bad request'}
+                
+            return {'ok': True, 'value': value}
+            
+    #--------------------------------------------------------------------------
+    def check_idle(self):
+        """ Lock if no request has come in for idleTimeout seconds """
+        with self._lock:
+            if self._data is not None and \
+               time.time() - self._lastUsed > self.idleTimeout:
+                self._forget()
+                
+    #--------------------------------------------------------------------------
+    def _answer(self, request):
+        """ Value for a request, raising AgentError if it cannot be given """
+        op = request.get('op')
+        
+        if request.get('db') is not None and \
+           os.path.realpath(_string(request, 'db')) != self.dbFile:
+            raise AgentError('The agent serves %s' % self.dbFile)
+        
+        if op == 'ping':
+            return {'locked': self._data is None, 'db': self.dbFile}
+            
+        if op == 'lock':
+            self._forget()
+            return None
+            
+        if op == 'stop':
+            self._forget()
+            self.stopped = True
+            return None
+            
+        if op == 'unlock':
+            from PasswordData import PasswordData
+            data = PasswordData(_string(request, 'password', ''), 
+                                self.dbFile, lazy=True)
+            if not data.valid:
+                raise AgentError(data.errMsg)
+            self._data = data
+            self._mtime = _mtime(self.dbFile)
+            return None
+            
+        data = self._current()
+        category = _string(request, 'category', 'All')
+        
+        if op in ('get', 'get_many'):
+            field = _string(request, 'field', 'password')
+            if field not in FIELDS:
+                raise AgentError('Unknown field %s' % field)
+                
+            if op == 'get':
+                return field_value(find_one(data, _string(request, 'name'), 
+                                            category), field)
+                                   
+            keys = request['keys']
+            if not isinstance(keys, list) or \
+               not all(isinstance(k, (bytes, int, long)) for k in keys):
+                raise ValueError('Bad keys')
+            return list(lookup_many(data, keys, field, category))
+            
+        if op == 'list':
+            query = _string(request, 'query', '')
+            if query:
+                entries = data.Filter(query, category)
+            else:
+                entries = data.GetEntries(category)
+            return _rows(sorted(entries, 
+                                key=lambda e: (e.sorting_name(), e.tag)),
+                         bool(request.get('ids')))
+            
+        if op == 'search':
+            return _rows(data.Search(_string(request, 'query'), 
+                                     int(request.get('limit', 10))))
+                                     
+        raise AgentError('Unknown request %s' % op)
+        
+    #--------------------------------------------------------------------------
+    def _current(self):
+        """
+        The unlocked data, read again first if the file has changed. If it
+        cannot be read with the same key any more, or is gone, the agent
+        locks.
+        """
+        if self._data is None:
+            raise AgentError('The agent is locked')
+            
+        try:
+            mtime = _mtime(self.dbFile)
+        except (IOError, OSError) as e:
+            self._forget()
+            raise AgentError('The database cannot be read any more (%s), '%
+                             e.strerror + 'the agent is locked')
+            
+        if mtime != self._mtime:
+            data = self._data.Reopen()
+            if not data.valid:
+                self._forget()
+                raise AgentError('The database changed and could not be '+
+                                 'read again, the agent is locked')
+            self._data = data
+            self._mtime = mtime
+            
+        return self._data
+        
+    #--------------------------------------------------------------------------
+    def _forget(self):
+        """ Lock, dropping the data and any passwords unsealed for it """
+        self._data = None
+        clear_cache()
+        
+        
+###############################################################################
+class _Handler(SocketServer.StreamRequestHandler):
+    """ Answers each line of a connection as a request """
+    def handle(self):
+        agent = self.server.agent
+        
+        for line in self.rfile:
+            try:
+                request = _from_wire(json.loads(line))
+                if not isinstance(request, dict):
+                    raise ValueError
+            except ValueError:
+                response = {'ok': False, 'error': 'Bad request'}
+            else:
+                response = agent.handle(request)
+                
+            self.wfile.write(json.dumps(_to_wire(response)) + '\n')
+            self.wfile.flush()
+            
+            if agent.stopped:
+                break
+            
+            
+###############################################################################
+class _Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+    
+    
+#------------------------------------------------------------------------------
+def make_server(agent, path=None):
+    """
+    Listening server for an agent, at path or in a new private folder. An
+    existing socket at path is replaced if no agent answers on it, but
+    anything else there is left alone.
+    """
+    folder = None
+    if path is None:
+        folder = tempfile.mkdtemp(prefix='pwlocker-')
+        path = os.path.join(folder, 'agent')
+        
+    elif os.path.lexists(path):
+        if not _is_socket(path):
+            raise AgentError('%s already exists and is not a socket' % path)
+            
+        try:
+            request(path, {'op': 'ping'})
+        except AgentError:
+            os.remove(path)   # left behind by an agent that died
+        else:
+            raise AgentError('An agent is already running at %s' % path)
+            
+    old = os.umask(0o077)
+    try:
+        server = _Server(path, _Handler)
+    finally:
+        os.umask(old)
+        
+    server.agent = agent
+    server.path = path
+    server.folder = folder
+    server.timeout = POLL_INTERVAL
+    return server
+    
+#------------------------------------------------------------------------------
+def run_server(server):
+    """ Handle requests until the agent is stopped, locking when idle """
+    while not server.agent.stopped:
+        server.handle_request()
+        server.agent.check_idle()
+        
+#------------------------------------------------------------------------------
+def close_server(server):
+    """ Stop listening and remove the socket, and the folder made for it """
+    server.server_close()
+    if _is_socket(server.path):
+        os.remove(server.path)
+        
+    if server.folder is not None and os.path.isdir(server.folder):
+        os.rmdir(server.folder)
+        
+#------------------------------------------------------------------------------
+def request(path, req):
+    """
+    Send one request to the agent listening at path and return its value,
+    raising AgentError if it cannot be reached or refuses
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        f = sock.makefile('rwb')
+        f.write(json.dumps(_to_wire(req)) + '\n')
+        f.flush()
+        line = f.readline()
+        f.close()
+    except socket.error as e:
+        raise AgentError('Cannot reach the agent at %s: %s' % (path, e))
+    finally:
+        sock.close()
+        
+    try:
+        response = _from_wire(json.loads(line))
+    except ValueError:
+        raise AgentError('The agent at %s did not answer' % path)
+        
+    if not response.get('ok'):
+        raise AgentError(response.get('error', 'Request failed'))
+        
+    return response.get('value')
+    
+#------------------------------------------------------------------------------
+def _rows(entries, ids=False):
+    """ Name, username and category of some entries, after the id if ids """
+    if ids:
+        return [[e.tag, e.name, e.username, e.category] for e in entries]
+    return [[e.name, e.username, e.category] for e in entries]
+    
+#------------------------------------------------------------------------------
+def _string(request, key, default=None):
+    """
+    String value of a request, or default if it has none. A value of another
+    type, or a missing one without a default, is a bad request.
+    """
+    value = request.get(key, default)
+    if not isinstance(value, bytes):
+        raise ValueError('%s must be a string' % key)
+    return value
+    
+#------------------------------------------------------------------------------
+def _is_socket(path):
+    """ Check if path is a socket, not following symbolic links """
+    try:
+        return stat.S_ISSOCK(os.lstat(path).st_mode)
+    except OSError:
+        return False
+    
+#------------------------------------------------------------------------------
+def _mtime(path):
+    """ Modification time and size of a file, to notice it changing """
+    st = os.stat(path)
+    return (st.st_mtime, st.st_size)
+    
+#------------------------------------------------------------------------------
+def _to_wire(value):
+    """
+    A request or response with its strings made into text for JSON: unicode
+    as utf-8, and then every byte string as latin-1
+    """
+    if isinstance(value, (list, tuple)):
+        return [_to_wire(v) for v in value]
+    if isinstance(value, dict):
+        return dict((_to_wire(k), _to_wire(v)) for k, v in value.items())
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    return value
+    
+#------------------------------------------------------------------------------
+def _from_wire(value):
+    """ A request or response from JSON with its strings back as bytes """
+    if isinstance(value, list):
+        return [_from_wire(v) for v in value]
+    if isinstance(value, dict):
+        return dict((_from_wire(k), _from_wire(v)) for k, v in value.items())
+    if isinstance(value, unicode):
+        value = value.encode('latin-1')
+    return value
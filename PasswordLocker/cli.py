@@ -0,0 +1,417 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Command line interface for scripts and terminals, run with
+
+    python -m PasswordLocker --db FILE COMMAND [options]
+
+It works on PasswordData directly and never imports wx, so it needs no
+display. The master password is taken from the PASSWORDLOCKER_PASSWORD
+environment variable if it is set, otherwise it is prompted for. Commands:
+
+  list        names, usernames and categories of the entries, optionally
+              only those matching a search query or in one category, and
+              with --ids each entry's id first
+  get         one field (the password by default) of the entry with a name
+  get-many    that field for each of many names, or with --ids entry ids,
+              given as arguments or one per line on stdin, written as one
+              line of JSON per name or id
+  add         add an entry, prompting for its password unless given
+  import-csv  add the entries of a CSV file, skipping duplicates
+  export-csv  write every entry to an unencrypted CSV file
+  rekey       change the master password
+  agent       keep the database unlocked in a background agent (agent.py)
+  lock        make the agent forget the database
+  unlock      make the agent load the database again
+
+When PASSWORDLOCKER_AGENT is set, get, get-many and list are answered by the
+agent listening there, without deriving the key or decrypting the file. The
+agent module is only imported then, or for the agent commands.
+
+Results go to stdout and errors to stderr. The exit status is 0 on success,
+1 if the database or an entry could not be used, and 2 for bad arguments.
+"""
+
+import os
+import sys
+import json
+import base64
+import getpass
+import argparse
+from lookup import FIELDS, EntryNotFound, find_one, lookup_many, field_value
+
+PASSWORD_VARIABLE = 'PASSWORDLOCKER_PASSWORD'
+NEW_PASSWORD_VARIABLE = 'PASSWORDLOCKER_NEW_PASSWORD'
+DB_VARIABLE = 'PASSWORDLOCKER_DB'
+AGENT_VARIABLE = 'PASSWORDLOCKER_AGENT'
+
+###############################################################################
+class CommandError(Exception):
+    """ A command could not be carried out, with a message for the user """
+    pass
+
+#------------------------------------------------------------------------------
+def main(argv=None):
+    """ Run one command, returning the exit status """
+    args = _parser().parse_args(argv)
+    
+    if not args.db:
+        sys.stderr.write('No database given, use --db or %s\n' % DB_VARIABLE)
+        return 2
+        
+    try:
+        args.run(args)
+    except (CommandError, EntryNotFound) as e:
+        sys.stderr.write('%s\n' % e)
+        return 1
+    except (IOError, OSError) as e:
+        sys.stderr.write('%s\n' % e)
+        return 1
+        
+    return 0
+
+#------------------------------------------------------------------------------
+def do_list(args):
+    """ Print the name, username and category of matching entries """
+    if _agent_socket():
+        for row in _ask_agent(args, op='list', query=args.query or '', 
+                              category=args.category, ids=args.ids):
+            _print('\t'.join(str(f) for f in row))
+        return
+        
+    data = _open(args)
+    
+    if args.query:
+        entries = data.Filter(args.query, args.category)
+    else:
+        entries = data.GetEntries(args.category)
+        
+    for e in sorted(entries, key=lambda e: (e.sorting_name(), e.tag)):
+        row = (e.name, e.username, e.category)
+        if args.ids:
+            row = (str(e.tag),) + row
+        _print('\t'.join(row))
+        
+#------------------------------------------------------------------------------
+def do_get(args):
+    """ Print one field of the entry with a given name """
+    if _agent_socket():
+        _print(_ask_agent(args, op='get', name=args.name, field=args.field,
+                          category=args.category))
+        return
+        
+    entry = find_one(_open(args), args.name, args.category)
+    _print(field_value(entry, args.field))
+    
+#------------------------------------------------------------------------------
+def do_get_many(args):
+    """
+    Print one field for each of many names, or entry ids if args.ids, as
+    lines of JSON objects with the name or id as "key" and either "value" or
+    "error" (see _json_line). It is an error if any name does not match
+    exactly one entry, but every name is answered.
+    """
+    names = args.names
+    if not names:
+        names = [line.rstrip('\r\n') for line in sys.stdin if line.strip()]
+        
+    if args.ids:
+        try:
+            names = [int(n) for n in names]
+        except ValueError:
+            raise CommandError('Entry ids must be whole numbers, as shown '+
+                               'by list --ids')
+        
+    if _agent_socket():
+        results = _ask_agent(args, op='get_many', keys=names, 
+                             field=args.field, category=args.category)
+    else:
+        results = lookup_many(_open(args), names, args.field, args.category)
+                                    
+    missing = 0
+    for r in results:
+        _print(_json_line(r))
+        missing += 'error' in r
+        
+    if missing:
+        raise CommandError('%d of %d %s did not match one entry' % 
+                           (missing, len(names), 
+                            'ids' if args.ids else 'names'))
+        
+#------------------------------------------------------------------------------
+def do_add(args):
+    """ Add an entry, refusing exact duplicates """
+    from PasswordData import Entry
+    data = _open(args)
+    
+    password = args.password
+    if password is None:
+        password = getpass.getpass('Password for %s: ' % args.name)
+        
+    entry = Entry(args.name, args.username, password, args.category, 
+                  args.comments)
+                  
+    if data.IsDuplicate(entry):
+        raise CommandError('An identical entry already exists')
+        
+    data.AddEntry(entry)
+    data.SaveChanges()
+    
+#------------------------------------------------------------------------------
+def do_import_csv(args):
+    """ Add the entries of a CSV file """
+    data = _open(args)
+    count = len(data.entries)
+    
+    data.ImportCSV(args.file)
+    if data.HasChanged():
+        data.SaveChanges()
+        
+    sys.stderr.write('Imported %d entries\n' % (len(data.entries) - count))
+    
+#------------------------------------------------------------------------------
+def do_export_csv(args):
+    """ Write every entry to an unencrypted CSV file """
+    _open(args).SaveChanges(asCSV=True, dest=args.file)
+    
+#------------------------------------------------------------------------------
+def do_rekey(args):
+    """ Save the database again under a new master password """
+    data = _open(args)
+    
+    password = os.environ.get(NEW_PASSWORD_VARIABLE)
+    if password is None:
+        password = getpass.getpass('New master password: ')
+        if getpass.getpass('Repeat new master password: ') != password:
+            raise CommandError('Passwords do not match')
+            
+    if not password:
+        raise CommandError('The new password is empty')
+        
+    data.SaveChanges(newpassword=password)
+    
+#------------------------------------------------------------------------------
+def do_agent(args):
+    """
+    Unlock the database and serve it from an agent. Unless told to stay in
+    the foreground, the agent carries on in the background once it has
+    printed the shell commands that point PASSWORDLOCKER_AGENT at it.
+    """
+    import signal
+    import agent
+    
+    idle = agent.IDLE_TIMEOUT if args.idle is None else args.idle
+    try:
+        server = agent.make_server(agent.Agent(_open(args, lazy=True), idle),
+                                   args.socket)
+    except agent.AgentError as e:
+        raise CommandError(str(e))
+        
+    _print('%s=%s; export %s;' % (AGENT_VARIABLE, server.path, 
+                                  AGENT_VARIABLE))
+    sys.stdout.flush()
+    
+    if not args.foreground:
+        if os.fork():
+            os._exit(0)
+        _detach()
+        
+    def stop(signum, frame):
+        server.agent.stopped = True
+    signal.signal(signal.SIGTERM, stop)
+    
+    try:
+        agent.run_server(server)
+    finally:
+        agent.close_server(server)
+        
+#------------------------------------------------------------------------------
+def do_lock(args):
+    """ Make the agent forget the database """
+    _ask_agent(args, op='lock')
+    
+#------------------------------------------------------------------------------
+def do_unlock(args):
+    """ Make the agent load the database again """
+    _ask_agent(args, op='unlock', password=_master_password())
+    
+#------------------------------------------------------------------------------
+def _agent_socket():
+    """ Socket path of the agent to use, if any """
+    return os.environ.get(AGENT_VARIABLE)
+    
+#------------------------------------------------------------------------------
+def _ask_agent(args, **req):
+    """ Value of a request to the agent about the database in args """
+    path = _agent_socket()
+    if not path:
+        raise CommandError('No agent, set %s' % AGENT_VARIABLE)
+        
+    import agent
+    req['db'] = os.path.abspath(args.db)
+    try:
+        return agent.request(path, req)
+    except agent.AgentError as e:
+        raise CommandError(str(e))
+    
+#------------------------------------------------------------------------------
+def _detach():
+    """ Carry on as a background process with no terminal or output """
+    os.setsid()
+    null = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(null, fd)
+    os.close(null)
+    
+#------------------------------------------------------------------------------
+def _master_password():
+    """ Master password from the environment, or prompted for """
+    password = os.environ.get(PASSWORD_VARIABLE)
+    if password is None:
+        password = getpass.getpass('Master password: ')
+    return password
+    
+#------------------------------------------------------------------------------
+def _open(args, lazy=False):
+    """
+    Load the database, raising CommandError if it cannot be read. Passwords
+    are only kept sealed if lazy, as a command that exits once done has no
+    use for that.
+    """
+    from PasswordData import PasswordData
+    data = PasswordData(_master_password(), args.db, lazy=lazy)
+    if not data.valid:
+        raise CommandError(data.errMsg)
+        
+    return data
+    
+#------------------------------------------------------------------------------
+def _json_line(result):
+    """
+    A get-many result as a line of JSON. A value that is not utf-8 text,
+    which CSV imports and the original file format can hold, is given in
+    base64 with "base64" set, and names in the key or error are shown with
+    such bytes replaced.
+    """
+    result = dict(result)
+    for k in ('key', 'error'):
+        if isinstance(result.get(k), bytes):
+            result[k] = result[k].decode('utf-8', 'replace')
+            
+    value = result.get('value')
+    if isinstance(value, bytes):
+        try:
+            value.decode('utf-8')
+        except UnicodeDecodeError:
+            result['value'] = base64.b64encode(value).decode('ascii')
+            result['base64'] = True
+            
+    return json.dumps(result, sort_keys=True)
+    
+#------------------------------------------------------------------------------
+def _print(s):
+    """ Write a field to stdout as utf-8, on a line of its own """
+    if not isinstance(s, bytes):
+        s = s.encode('utf-8')
+    out = getattr(sys.stdout, 'buffer', sys.stdout)
+    out.write(s + b'\n')
+    
+#------------------------------------------------------------------------------
+def _parser():
+    """ Argument parser for all the commands """
+    parser = argparse.ArgumentParser\
+             (
+                 prog='python -m PasswordLocker',
+                 description='Read and change a Password Locker database '+
+                             'without the GUI'
+             )
+    parser.add_argument('--db', default=os.environ.get(DB_VARIABLE),
+                        help='database file (default $%s)' % DB_VARIABLE)
+                        
+    commands = parser.add_subparsers(title='commands')
+    
+    cmd = commands.add_parser('list', help='list entries')
+    cmd.add_argument('query', nargs='?', help='only entries matching this')
+    cmd.add_argument('-c', '--category', default='All')
+    cmd.add_argument('--ids', action='store_true', 
+                     help='show the id of each entry first')
+    cmd.set_defaults(run=do_list)
+    
+    cmd = commands.add_parser('get', help='print a field of an entry')
+    cmd.add_argument('name', help='name of the entry')
+    cmd.add_argument('-f', '--field', choices=FIELDS, default='password')
+    cmd.add_argument('-c', '--category', default='All')
+    cmd.set_defaults(run=do_get)
+    
+    cmd = commands.add_parser('get-many', 
+                              help='print a field of many entries as JSON')
+    cmd.add_argument('names', nargs='*', 
+                     help='names of the entries (default: read from stdin)')
+    cmd.add_argument('-f', '--field', choices=FIELDS, default='password')
+    cmd.add_argument('-c', '--category', default='All')
+    cmd.add_argument('--ids', action='store_true',
+                     help='look the entries up by the ids list --ids shows '+
+                          'rather than by name')
+    cmd.set_defaults(run=do_get_many)
+    
+    cmd = commands.add_parser('add', help='add an entry')
+    cmd.add_argument('name')
+    cmd.add_argument('username')
+    cmd.add_argument('-p', '--password', 
+                     help='password of the entry (prompted for if not given)')
+    cmd.add_argument('-c', '--category', default='')
+    cmd.add_argument('--comments', default='')
+    cmd.set_defaults(run=do_add)
+    
+    cmd = commands.add_parser('import-csv', help='add entries from a CSV file')
+    cmd.add_argument('file')
+    cmd.set_defaults(run=do_import_csv)
+    
+    cmd = commands.add_parser('export-csv', 
+                              help='write entries to an unencrypted CSV file')
+    cmd.add_argument('file')
+    cmd.set_defaults(run=do_export_csv)
+    
+    cmd = commands.add_parser('rekey', help='change the master password')
+    cmd.set_defaults(run=do_rekey)
+    
+    cmd = commands.add_parser('agent', 
+                              help='serve the database from a local agent')
+    cmd.add_argument('-s', '--socket', 
+                     help='socket path (default: in a new private folder)')
+    cmd.add_argument('-i', '--idle', type=float, 
+                     help='seconds without requests before the agent locks '+
+                          '(default: 15 minutes)')
+    cmd.add_argument('-f', '--foreground', action='store_true',
+                     help='stay in the foreground')
+    cmd.set_defaults(run=do_agent)
+    
+    cmd = commands.add_parser('lock', help='make the agent forget the database')
+    cmd.set_defaults(run=do_lock)
+    
+    cmd = commands.add_parser('unlock', 
+                              help='make the agent load the database again')
+    cmd.set_defaults(run=do_unlock)
+    
+    return parser
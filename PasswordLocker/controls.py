@@ -25,6 +25,7 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import wx
 import math
 import wx.lib.agw.pygauge as PG
+from sortedview import SortedView
 
 ###############################################################################
 class StrengthGauge(PG.PyGauge):
@@ -68,14 +69,17 @@ class StrengthGauge(PG.PyGauge):
 ###############################################################################
 class ObjectListCtrl(wx.ListCtrl):
     """
-    A wx.ListCtrl object that can have objects associated with it
-    more easily than a standard ListCtrl.
+    A virtual wx.ListCtrl which displays a list of objects. Rows are not
+    stored in the control, their text is requested through OnGetItemText
+    only for the rows that are actually visible.
     """
     def __init__(self, *args, **kwargs):
         cols = kwargs.get('cols')
         del kwargs['cols']
+        kwargs['style'] = kwargs.get('style', 0) | wx.LC_REPORT | \
+                          wx.LC_VIRTUAL | wx.LC_SINGLE_SEL
         wx.ListCtrl.__init__(self, *args, **kwargs)
-        self._map = {}
+        self._view = SortedView()
 
         for i, col in enumerate(cols):
             self.InsertColumn(i, col[0], width=col[1])
@@ -84,57 +88,72 @@ class ObjectListCtrl(wx.ListCtrl):
         
 
     #-------------------------------------------------------------------------- 
-    def update_objects(self, objects):
+    def update_objects(self, objects, presorted=False):
         """
         In this case, 'objects' is a list of objects. Each object must
         have a unique attribute 'tag', must provide a list of strings for all
-        columns with the col_strings() function, and must provide a sorting
-        name with the sorting_name() function
+        columns with the col_strings() function, a tuple that changes when
+        they do with col_keys(), and must provide a sorting name made from
+        the columns with the sorting_name() function. Pass presorted if they
+        are sorted by that name (then tag) already, which saves sorting a
+        long list again.
         
-        If a single entry is changed, this just looks up that entry and 
-        re-writes its columns. If entries are deleted, it rebuilds the list.
+        Only the added, removed and changed objects are diffed into the
+        sorted view, and only the visible rows affected by them are redrawn.
+        The selection follows the selected object to its new row, and the
+        row it was in is deselected.
         """
+        old = self.GetFirstSelected()
+        try:
+            selected = self.GetCurrentObject().tag
+        except IndexError:
+            selected = None
+            
+        count = len(self._view)
+        first, changed = self._view.update(objects, presorted)
         
-        # Deal with deleted objects still in the ListCtrl
-        objkeys = [obj.tag for obj in objects]
+        if len(self._view) != count:
+            self.SetItemCount(len(self._view))
+            
+        row = self._view.row_of(selected)
+        if row != old:
+            if 0 <= old < len(self._view):
+                self.Select(old, False)
+            if row >= 0:
+                self.Select(row)
+                self.Focus(row)
+            
+        # Redraw the visible rows from the first moved one down, and any
+        # visible rows changed in place
+        if len(self._view):
+            top = self.GetTopItem()
+            bottom = min(top + self.GetCountPerPage(), len(self._view) - 1)
+            
+            if first is not None and first <= bottom:
+                self.RefreshItems(max(top, first), bottom)
                 
-        if sorted(objkeys) != sorted(self._map.keys()):
-            self.DeleteAllItems()
-            self._map.clear()
-        
-        # Sort objects alphabetically by sorting_name()
-        sortedObjects = sorted(objects, key=lambda k: k.sorting_name())
-        
-        for obj in sortedObjects:
-            # Check if obj is already in the list
-            if obj.tag in self._map:
-                # Find obj's row in the table
-                self._map[obj.tag] = obj
-                keys = [self.GetItemData(x) for x in range(self.GetItemCount())]
-                row = keys.index(obj.tag)
-
-            else:
-                # Add obj at the end of the list and get its row
-                self._map[obj.tag] = obj
-                row = self.InsertStringItem(self.GetItemCount(), str(obj.tag))
-                self.SetItemData(row, obj.tag)
-
-            # Update values in specified row, all columns
-            for i,s in enumerate(obj.col_strings()):
-                self.SetStringItem(row, i, s)
+            for row in changed:
+                if top <= row <= bottom:
+                    self.RefreshItem(row)
                 
+    #-------------------------------------------------------------------------- 
+    def OnGetItemText(self, item, col):
+        """ Text of one cell, requested by wx when the row is drawn """
+        return self._view[item].col_strings()[col]
+    
     #-------------------------------------------------------------------------- 
     def GetCurrentObject(self):
-        tag = self.GetItemData(self.GetFirstSelected())
-        return self._map[tag]
+        """ Selected object, raising IndexError if there is none """
+        return self._view[self.GetFirstSelected()]
+        
         
 
         
 ###############################################################################
 class EntryMenu(wx.Menu):
     """ 
-    Right click context menu for entries in the list panel with Edit and Delete
-    options
+    Right click context menu for entries in the list panel with Edit, Copy
+    Password and Delete options
     """
     def __init__(self, parent, entry):
         wx.Menu.__init__(self)
@@ -143,6 +162,10 @@ class EntryMenu(wx.Menu):
         self.AppendItem(mi)
         self.Bind(wx.EVT_MENU, lambda event: parent._edit_entry(entry), mi)
         
+        mi = wx.MenuItem(self, wx.NewId(), 'Copy Password')
+        self.AppendItem(mi)
+        self.Bind(wx.EVT_MENU, lambda event: parent._copy_password(entry), mi)
+        
         mi = wx.MenuItem(self, wx.NewId(), 'Delete')
         self.AppendItem(mi)
         self.Bind(wx.EVT_MENU, lambda event: parent._delete_entry(entry), mi)
@@ -0,0 +1,779 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Layout of a version 2 database file. Files without the magic string are the
+original single-blob format (version 1) and are read by PasswordData.
+
+  header   MAGIC, version, index offset, index length, key derivation
+           method, salt and cost (see kdf.py), key check value, index iv,
+           and the header MAC (not encrypted)
+  records  each record is its own iv followed by its AES-CBC encrypted
+           payload. The payload is a 4 byte length and then a list of
+           fields, each a 4 byte length followed by the field bytes,
+           zero-padded to a multiple of the AES block size.
+  index    encrypted with the index iv: a 4 byte record count and the 8 byte
+           next unused id, followed by the 8 byte id, 8 byte file offset,
+           4 byte length and 16 byte MAC of every record
+  journal  zero or more segments appended by later saves, each a 4 byte
+           ciphertext length, an iv, the encrypted journal records and
+           their MAC
+
+Every record is encrypted separately, so any one of them can be checked and
+decrypted without the rest, and a new snapshot can copy the records that did
+not change without decrypting or encrypting them again. The records follow
+each other without gaps, and since each iv sits right before its ciphertext,
+a run of records also decrypts correctly as one CBC stream (the iv blocks
+decrypt to garbage, which is skipped). Loading uses this to decrypt in large
+chunks.
+
+Encryption is authenticated with encrypt-then-MAC, since pyCrypto 2.6 has no
+AEAD mode. The key derived from the password is only used to derive separate
+encryption, MAC and key check keys (HMAC-SHA256 of a label for each). The key
+check value lets a wrong password be rejected from the header alone, compared
+in constant time.
+  - A record's MAC covers its id, iv and ciphertext, truncated to 16 bytes.
+  - The header MAC covers the rest of the header and the encrypted index,
+    which holds every record MAC.
+  - Each journal segment's MAC covers the header MAC, the segment's offset,
+    its iv and its ciphertext, so segments cannot be moved or spliced in from
+    another file.
+
+Record ids are assigned once and never reused, so they stay the same across
+loads, saves and compaction. Each journal record has the same layout as a
+record payload, with an operation and the id as its first two fields.
+Writing a new snapshot folds the journal back in.
+"""
+
+import os
+import struct
+import hmac
+import hashlib
+from collections import OrderedDict, deque
+from kdf import KdfParams, SALT_SIZE, to_bytes
+
+MAGIC = 'PWLK'
+FORMAT_VERSION = 2
+
+# bytes of ciphertext decrypted at a time when streaming a db file
+CHUNK_SIZE = 64*1024
+
+# Snapshots with at least this many bytes of records are decrypted by a pool
+# of worker processes, below that starting the pool costs more than it saves
+PARALLEL_MIN = 4*1024*1024
+
+# Chunks handed out to each worker ahead of the one being read back
+PARALLEL_AHEAD = 2
+
+# AES block size, known here so that Crypto.Cipher need not be imported
+# until there is something to encrypt or decrypt
+BLOCK_SIZE = 16
+
+MAC_SIZE = hashlib.sha256().digest_size
+RECORD_MAC_SIZE = 16
+CHECK_SIZE = 16
+
+# The header is HEADER followed by the header MAC, which covers HEADER
+HEADER = struct.Struct('>4sBQIB%dsIII%ds%ds' % (SALT_SIZE, CHECK_SIZE,
+                                                BLOCK_SIZE))
+HEADER_SIZE = HEADER.size + MAC_SIZE
+LENGTH = struct.Struct('>I')
+INDEX_HEAD = struct.Struct('>IQ')
+INDEX_ITEM = struct.Struct('>QQI%ds' % RECORD_MAC_SIZE)
+RECORD_ID = struct.Struct('>Q')
+SEGMENT_HEAD = struct.Struct('>Q')
+
+# journal operations
+JOURNAL_ADD = 'A'
+JOURNAL_UPDATE = 'U'
+JOURNAL_DELETE = 'D'
+
+###############################################################################
+class WrongPasswordError(Exception):
+    """ The key does not match the key check value in the header """
+    pass
+
+###############################################################################
+class CorruptFileError(Exception):
+    """ Part of the file does not match its MAC, or does not parse """
+    pass
+
+###############################################################################
+class StoredRecord(object):
+    """
+    A record exactly as stored in a db file (iv and ciphertext) with its MAC,
+    which write_db copies into a new snapshot as it is
+    """
+    __slots__ = ('blob', 'mac')
+
+    def __init__(self, blob, mac):
+        self.blob = blob
+        self.mac = mac
+
+###############################################################################
+class DbReader(object):
+    """
+    Reads records from an open database file in the current version. Records
+    are returned as (id, fields) and can either be streamed in order or read
+    individually by id through the index. A wrong key raises
+    WrongPasswordError straight away, and data that fails authentication
+    or does not parse raises CorruptFileError.
+    """
+    def __init__(self, df, key):
+        self.df = df
+
+        df.seek(0)
+        self.indexOffset, self.indexLength, self.kdf, check, self.iv, \
+            self.mac, self._signed = _read_header(df)
+
+        self.key, self._macKey, keyCheck = _subkeys(key)
+        if not _equal(keyCheck, check):
+            raise WrongPasswordError('Incorrect password')
+
+        self._mac = hmac.new(self._macKey, digestmod=hashlib.sha256)
+
+        bs = BLOCK_SIZE
+        if self.indexOffset < HEADER_SIZE or self.indexLength % bs or \
+           self.indexLength < bs:
+            raise CorruptFileError('Database header is corrupt')
+
+        self._index = None
+        self._journal = None
+        self._merged = None
+
+        # the journal starts right after the snapshot index
+        self.journalStart = self.indexOffset + self.indexLength
+        self.journalEnd = self.journalStart
+
+        df.seek(0, 2)
+        if self.journalEnd > df.tell():
+            raise CorruptFileError('Database is truncated')
+
+    #--------------------------------------------------------------------------
+    def __len__(self):
+        return len(self.read_index())
+
+    #--------------------------------------------------------------------------
+    def current_count(self):
+        """ Number of records as of the last save, with the journal applied """
+        changes, adds = self._merge_journal()
+        deleted = len([f for f in changes.values() if f is None])
+        return len(self.read_index()) - deleted + len(adds)
+
+    #--------------------------------------------------------------------------
+    def next_id(self):
+        """ Smallest id that has never been used in this file """
+        self.read_index()
+        ids = [i for op, i, fields in self.read_journal()]
+        return max([self._nextId] + [i+1 for i in ids])
+
+    #--------------------------------------------------------------------------
+    def read_index(self):
+        """
+        Check the header MAC, then decrypt the index (only once) and return
+        it as an OrderedDict of id to (offset, length, MAC) in file order
+        """
+        if self._index is None:
+            self.df.seek(self.indexOffset)
+            raw = self.df.read(self.indexLength)
+
+            mac = self._mac.copy()
+            mac.update(self._signed)
+            mac.update(raw)
+            if len(raw) != self.indexLength or \
+               not _equal(mac.digest(), self.mac):
+                raise CorruptFileError('Database failed authentication')
+
+            data = cbc(self.key, self.iv).decrypt(raw)
+            count, self._nextId = INDEX_HEAD.unpack_from(data)
+            if INDEX_HEAD.size + count*INDEX_ITEM.size > len(data):
+                raise CorruptFileError
+
+            index = OrderedDict()
+            end = HEADER_SIZE
+            for i in range(count):
+                recId, offset, length, recMac = INDEX_ITEM.unpack_from\
+                                                (
+                                                    data,
+                                                    INDEX_HEAD.size +
+                                                    i*INDEX_ITEM.size
+                                                )
+
+                # records must follow each other for chunked decryption
+                if offset != end or length % BLOCK_SIZE or \
+                   length < 2*BLOCK_SIZE:
+                    raise CorruptFileError
+
+                index[recId] = (offset, length, recMac)
+                end += length
+
+            if end != self.indexOffset:
+                raise CorruptFileError
+
+            self._index = index
+
+        return self._index
+
+    #--------------------------------------------------------------------------
+    def read_record(self, recId):
+        """
+        Decrypt and return the fields of only one record as of the last save,
+        using the journal version of it if there is one
+        """
+        changes, adds = self._merge_journal()
+
+        if recId in adds:
+            return adds[recId]
+
+        if recId in changes:
+            if changes[recId] is None:
+                raise KeyError(recId)
+            return changes[recId]
+
+        stored = self.read_raw(recId)
+        bs = BLOCK_SIZE
+        decrypter = cbc(self.key, stored.blob[:bs])
+        return _parse_payload(decrypter.decrypt(stored.blob[bs:]))
+
+    #--------------------------------------------------------------------------
+    def read_records(self, ids):
+        """ Generator over the fields of a subset of records, in given order """
+        for recId in ids:
+            yield self.read_record(recId)
+
+    #--------------------------------------------------------------------------
+    def read_raw(self, recId):
+        """
+        StoredRecord of a snapshot record, checked against its MAC but not
+        decrypted. The journal is not looked at.
+        """
+        offset, length, recMac = self.read_index()[recId]
+
+        self.df.seek(offset)
+        blob = self.df.read(length)
+        self._check_record(recId, blob, recMac)
+
+        return StoredRecord(blob, recMac)
+
+    #--------------------------------------------------------------------------
+    def unchanged_ids(self):
+        """ Ids of the snapshot records the journal has not changed """
+        changes, adds = self._merge_journal()
+        return [i for i in self.read_index() if i not in changes]
+
+    #--------------------------------------------------------------------------
+    def iter_current(self, chunkSize=CHUNK_SIZE, workers=None):
+        """
+        Generator over (id, fields) for every record as of the last save. The
+        snapshot is streamed and the journal applied on the fly since the
+        journal is read (and kept) before the first record.
+        """
+        changes, adds = self._merge_journal()
+
+        for recId, fields in self.iter_records(chunkSize, workers):
+            if recId in changes:
+                fields = changes[recId]
+                if fields is None:
+                    continue
+
+            yield recId, fields
+
+        for recId, fields in adds.items():
+            yield recId, fields
+
+    #--------------------------------------------------------------------------
+    def iter_records(self, chunkSize=CHUNK_SIZE, workers=None):
+        """
+        Generator over (id, fields) of every snapshot record in file order.
+        Runs of records of about chunkSize bytes are read and decrypted at
+        once, and each record is checked against its MAC. The journal is not
+        applied, see iter_current for that.
+
+        Runs are decrypted and parsed by a pool of 'workers' processes (one
+        per CPU by default) if the snapshot holds at least PARALLEL_MIN bytes
+        of records. Records still come out in file order.
+        """
+        runs = self._read_runs(chunkSize)
+        keys = (self.key, self._macKey)
+
+        if self.indexOffset - HEADER_SIZE < PARALLEL_MIN:
+            workers = 1
+        elif workers is None:
+            workers = _cpu_count()
+
+        if workers > 1:
+            for ids, counts, fields in _open_parallel(runs, keys, workers):
+                pos = 0
+                for recId, n in zip(ids, counts):
+                    yield recId, fields[pos:pos+n]
+                    pos += n
+        else:
+            for start, raw, items in runs:
+                for r in _open_run(keys, start, raw, items):
+                    yield r
+
+    #--------------------------------------------------------------------------
+    def _read_runs(self, chunkSize):
+        """
+        Generator over (file offset, ciphertext, index items) for runs of
+        consecutive snapshot records of about chunkSize bytes
+        """
+        items = self.read_index().items()
+        first = 0
+
+        while first < len(items):
+            start = items[first][1][0]
+            last = first + 1
+            while last < len(items) and items[last][1][0] - start < chunkSize:
+                last += 1
+
+            offset, length, recMac = items[last-1][1]
+            size = offset + length - start
+
+            # seek every time in case read_record was called in between
+            self.df.seek(start)
+            raw = self.df.read(size)
+            if len(raw) != size:
+                raise CorruptFileError('Database is truncated')
+
+            yield start, raw, items[first:last]
+            first = last
+
+    #--------------------------------------------------------------------------
+    def read_journal(self):
+        """
+        Decrypt the journal (only once) and return it as a list of
+        (operation, id, fields). A segment cut short by an interrupted save
+        is ignored, and journalEnd is left pointing at the end of the last
+        complete one so the next save overwrites it. Complete segments must
+        match their MAC.
+        """
+        if self._journal is None:
+            bs = BLOCK_SIZE
+            ops = []
+            pos = self.journalEnd
+
+            while True:
+                self.df.seek(pos)
+                head = self.df.read(LENGTH.size + bs)
+                if len(head) < LENGTH.size + bs:
+                    break
+
+                n, = LENGTH.unpack_from(head)
+                data = self.df.read(n)
+                tag = self.df.read(MAC_SIZE)
+                if len(data) < n or len(tag) < MAC_SIZE:
+                    break
+
+                iv = head[LENGTH.size:]
+                if n % bs or not _equal(tag, _segment_mac(self._mac, self.mac,
+                                                          pos, iv, data)):
+                    raise CorruptFileError('Journal failed authentication')
+
+                decrypter = cbc(self.key, iv)
+                ops.extend(_unpack_journal(decrypter.decrypt(data)))
+                pos += len(head) + n + MAC_SIZE
+
+            self.journalEnd = pos
+            self._journal = ops
+
+        return self._journal
+
+    #--------------------------------------------------------------------------
+    def _merge_journal(self):
+        """
+        Collapse the journal into the changed snapshot records (None where
+        deleted) and the records added since the snapshot, in order
+        """
+        if self._merged is None:
+            changes = {}
+            adds = OrderedDict()
+
+            for op, recId, fields in self.read_journal():
+                if op == JOURNAL_ADD or (op == JOURNAL_UPDATE and
+                                         recId in adds):
+                    adds[recId] = fields
+                elif op == JOURNAL_UPDATE:
+                    changes[recId] = fields
+                elif op == JOURNAL_DELETE and recId in adds:
+                    del adds[recId]
+                elif op == JOURNAL_DELETE:
+                    changes[recId] = None
+                else:
+                    raise CorruptFileError
+
+            self._merged = (changes, adds)
+
+        return self._merged
+
+    #--------------------------------------------------------------------------
+    def _check_record(self, recId, blob, recMac):
+        """ Compare a stored record against the MAC from the index """
+        _check_record(self._mac, recId, blob, recMac)
+
+
+###############################################################################
+def write_db(df, key, kdf, records, nextId, chunkSize=CHUNK_SIZE):
+    """
+    Write an iterable of (id, fields) records to the open file 'df' in the
+    current format, along with the next unused id. Each record is encrypted
+    on its own, unless its fields are a StoredRecord from a file with the
+    same key, which is copied as it is. The key must have been derived with
+    the KdfParams 'kdf', which go in the header. The file must be seekable
+    since the header is rewritten once the index location and MAC are
+    known. Returns the end of the snapshot, which is where the journal
+    starts.
+    """
+    bs = BLOCK_SIZE
+    encKey, macKey, check = _subkeys(key)
+    mac = hmac.new(macKey, digestmod=hashlib.sha256)
+
+    df.write('\0' * HEADER_SIZE)
+
+    index = []
+    pending = []
+    pendingSize = 0
+    pos = HEADER_SIZE
+
+    for recId, fields in records:
+        if isinstance(fields, StoredRecord):
+            blob, recMac = fields.blob, fields.mac
+        else:
+            iv = os.urandom(bs)
+            encrypter = cbc(encKey, iv)
+            blob = iv + encrypter.encrypt(pack_record(fields))
+            recMac = _record_mac(mac, recId, blob)
+
+        index.append(INDEX_ITEM.pack(recId, pos, len(blob), recMac))
+        pos += len(blob)
+
+        pending.append(blob)
+        pendingSize += len(blob)
+
+        if pendingSize >= chunkSize:
+            df.write(''.join(pending))
+            pending = []
+            pendingSize = 0
+
+    if pending:
+        df.write(''.join(pending))
+
+    iv = os.urandom(bs)
+    index = pad(INDEX_HEAD.pack(len(index), nextId) + ''.join(index))
+    index = cbc(encKey, iv).encrypt(index)
+    df.write(index)
+
+    signed = HEADER.pack(*((MAGIC, FORMAT_VERSION, pos, len(index),
+                            kdf.method, kdf.salt) + kdf.cost + (check, iv)))
+    mac.update(signed)
+    mac.update(index)
+
+    df.seek(0)
+    df.write(signed + mac.digest())
+
+    return pos + len(index)
+
+#------------------------------------------------------------------------------
+def _open_run(keys, start, raw, items):
+    """
+    Check and decrypt a run of consecutive records read from file offset
+    'start', returning a list of (id, fields). The run is decrypted as one CBC
+    stream, which leaves each record's plaintext right after its iv block.
+    This runs in the worker processes, so it only takes picklable arguments:
+    the encryption and MAC subkeys rather than cipher or HMAC objects.
+    """
+    bs = BLOCK_SIZE
+    key, macKey = keys
+    mac = hmac.new(macKey, digestmod=hashlib.sha256)
+    data = cbc(key, '\0'*bs).decrypt(raw)
+
+    records = []
+    for recId, (offset, length, recMac) in items:
+        pos = offset - start
+        _check_record(mac, recId, raw[pos:pos+length], recMac)
+        records.append((recId, _parse_payload(data[pos+bs:pos+length])))
+
+    return records
+
+#------------------------------------------------------------------------------
+def _open_flat(keys, start, raw, items):
+    """
+    _open_run for the worker processes, returning the ids, the number of
+    fields of each record, and all the fields in one flat list. Unpickling
+    that in the main process is several times faster than a list of records.
+    """
+    records = _open_run(keys, start, raw, items)
+    ids = [recId for recId, fields in records]
+    counts = [len(fields) for recId, fields in records]
+    flat = [f for recId, fields in records for f in fields]
+    return ids, counts, flat
+
+#------------------------------------------------------------------------------
+def _open_parallel(runs, keys, workers):
+    """
+    Generator over the results of _open_flat for each run, in order, with the
+    runs spread over a pool of worker processes. Only a few runs per worker
+    are in flight at once so a large file is never all held in memory.
+    """
+    # imported here since most files are too small to need it
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = deque()
+        for start, raw, items in runs:
+            pending.append(pool.apply_async(_open_flat,
+                                            (keys, start, raw, items)))
+            if len(pending) >= workers * PARALLEL_AHEAD:
+                yield pending.popleft().get()
+
+        while pending:
+            yield pending.popleft().get()
+
+    finally:
+        pool.terminate()
+        pool.join()
+
+#------------------------------------------------------------------------------
+def _cpu_count():
+    """ Number of CPUs, or 1 if that cannot be found """
+    import multiprocessing
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+#------------------------------------------------------------------------------
+def append_journal(df, key, ops, journalEnd):
+    """
+    Encrypt a list of (operation, id, fields) as one journal segment and
+    write it at 'journalEnd' in the open file 'df', dropping anything after
+    it. Returns the new end of the journal. The caller must make sure that
+    journalEnd is still in the journal of the snapshot in the file (see
+    file_state), or the segment lands in the middle of another one.
+    """
+    encKey, macKey, check = _subkeys(key)
+    iv = os.urandom(BLOCK_SIZE)
+    encrypter = cbc(encKey, iv)
+
+    data = encrypter.encrypt(''.join(pack_record([op, str(recId)] + fields)
+                                     for op, recId, fields in ops))
+
+    df.seek(0)
+    headerMac = _read_header(df)[5]
+    tag = _segment_mac(hmac.new(macKey, digestmod=hashlib.sha256), headerMac,
+                       journalEnd, iv, data)
+
+    df.seek(journalEnd)
+    df.write(LENGTH.pack(len(data)) + iv + data + tag)
+    df.truncate()
+
+    return df.tell()
+
+#------------------------------------------------------------------------------
+def file_state(df):
+    """
+    (header MAC, journal start, file size) of an open container file. Every
+    save changes at least one of these, so comparing them with what they were
+    when the file was read tells if another program has saved it since.
+    """
+    df.seek(0)
+    indexOffset, indexLength, kdf, check, iv, mac, signed = _read_header(df)
+    df.seek(0, 2)
+    return mac, indexOffset + indexLength, df.tell()
+
+#------------------------------------------------------------------------------
+def read_kdf(df):
+    """
+    KdfParams needed to derive the key of an open container file, leaving
+    its position alone
+    """
+    start = df.tell()
+    df.seek(0)
+    try:
+        return _read_header(df)[2]
+    finally:
+        df.seek(start)
+
+#------------------------------------------------------------------------------
+def _read_header(df):
+    """
+    Read and check the header at the current position of 'df', returning
+    (index offset, index length, KdfParams, key check value, index iv,
+    header MAC, the header bytes covered by the MAC)
+    """
+    signed = df.read(HEADER.size)
+    mac = df.read(MAC_SIZE)
+
+    try:
+        fields = HEADER.unpack(signed)
+    except struct.error:
+        raise IOError('File is too short to be a password database')
+
+    magic, version, indexOffset, indexLength = fields[:4]
+    kdf = KdfParams(fields[4], fields[5], fields[6:9])
+    check, iv = fields[9:]
+
+    if magic != MAGIC:
+        raise IOError('File is not a password database')
+
+    if version != FORMAT_VERSION:
+        raise IOError('Unsupported database version %d' % version)
+
+    if len(mac) < MAC_SIZE:
+        raise IOError('File is too short to be a password database')
+
+    return indexOffset, indexLength, kdf, check, iv, mac, signed
+
+#------------------------------------------------------------------------------
+def _subkeys(key):
+    """
+    Separate keys for encryption, for MACs, and for checking the password,
+    all derived from the key given by the KDF
+    """
+    sub = lambda label: hmac.new(key, label, hashlib.sha256).digest()
+    return sub('encrypt'), sub('authenticate'), sub('check')[:CHECK_SIZE]
+
+#------------------------------------------------------------------------------
+def _record_mac(mac, recId, blob):
+    """ MAC of a stored record, from a copy of a keyed but empty HMAC """
+    mac = mac.copy()
+    mac.update(RECORD_ID.pack(recId))
+    mac.update(blob)
+    return mac.digest()[:RECORD_MAC_SIZE]
+
+#------------------------------------------------------------------------------
+def _check_record(mac, recId, blob, recMac):
+    """ Compare a stored record against the MAC from the index """
+    if not _equal(_record_mac(mac, recId, blob), recMac):
+        raise CorruptFileError('Record %d failed authentication' % recId)
+
+#------------------------------------------------------------------------------
+def _segment_mac(mac, headerMac, offset, iv, data):
+    """ MAC of a journal segment, tied to its snapshot and position """
+    mac = mac.copy()
+    mac.update(headerMac)
+    mac.update(SEGMENT_HEAD.pack(offset) + iv)
+    mac.update(data)
+    return mac.digest()
+
+#------------------------------------------------------------------------------
+def _equal(a, b):
+    """ Compare two MACs in time independent of where they differ """
+    if hasattr(hmac, 'compare_digest'):
+        return hmac.compare_digest(a, b)
+
+    # Python before 2.7.7
+    if len(a) != len(b):
+        return False
+    diff = 0
+    for x, y in zip(a, b):
+        diff |= ord(x) ^ ord(y)
+    return diff == 0
+
+#------------------------------------------------------------------------------
+def is_container(df):
+    """ Check if an open file starts with MAGIC, leaving its position alone """
+    start = df.tell()
+    magic = df.read(len(MAGIC))
+    df.seek(start)
+    return magic == MAGIC
+
+#------------------------------------------------------------------------------
+def pack_record(fields):
+    """ Length-prefixed, block-padded record for a list of field strings """
+    payload = ''.join(LENGTH.pack(len(f)) + f for f in map(to_bytes, fields))
+    return pad(LENGTH.pack(len(payload)) + payload)
+
+#------------------------------------------------------------------------------
+def unpack_fields(payload):
+    """ Split a record payload back into its list of field strings """
+    fields = []
+    pos = 0
+
+    while pos < len(payload):
+        if pos + LENGTH.size > len(payload):
+            raise CorruptFileError
+
+        n, = LENGTH.unpack_from(payload, pos)
+        pos += LENGTH.size
+
+        if pos + n > len(payload):
+            raise CorruptFileError
+
+        fields.append(payload[pos:pos+n])
+        pos += n
+
+    return fields
+
+#------------------------------------------------------------------------------
+def _parse_payload(data):
+    """ Fields of a decrypted record, with its length and padding removed """
+    if len(data) < LENGTH.size:
+        raise CorruptFileError
+
+    n, = LENGTH.unpack_from(data)
+    if LENGTH.size + n > len(data):
+        raise CorruptFileError
+
+    return unpack_fields(data[LENGTH.size:LENGTH.size+n])
+
+#------------------------------------------------------------------------------
+def _unpack_journal(data):
+    """ Parse a decrypted journal segment into (operation, id, fields) """
+    ops = []
+    pos = 0
+
+    while pos < len(data):
+        n, = LENGTH.unpack_from(data, pos)
+        size = padded_size(LENGTH.size + n)
+        if pos + size > len(data):
+            raise CorruptFileError
+
+        fields = unpack_fields(data[pos+LENGTH.size:pos+LENGTH.size+n])
+        if len(fields) < 2 or not fields[1].isdigit():
+            raise CorruptFileError
+
+        ops.append((fields[0], int(fields[1]), fields[2:]))
+        pos += size
+
+    return ops
+
+#------------------------------------------------------------------------------
+def cbc(key, iv):
+    """
+    AES-CBC cipher. Crypto.Cipher is imported here rather than with the
+    module, as it brings ctypes and more along with it.
+    """
+    from Crypto.Cipher import AES
+    return AES.new(key, AES.MODE_CBC, iv)
+
+#------------------------------------------------------------------------------
+def padded_size(n):
+    """ Smallest multiple of the AES block size that holds n bytes """
+    bs = BLOCK_SIZE
+    return n + (bs - n % bs) % bs
+
+#------------------------------------------------------------------------------
+def pad(s):
+    """ Zero-pad a string to a multiple of the AES block size """
+    return s + chr(0)*(padded_size(len(s)) - len(s))
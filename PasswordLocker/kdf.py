@@ -0,0 +1,192 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Derivation of the AES key from the user's password. Each db file stores the
+method it was written with, a random salt and up to three cost parameters in
+its header, so the cost can be raised for new files without breaking old ones.
+
+  LEGACY  one unsalted SHA256 of the password, only for reading the original
+          file format
+  PBKDF2  PBKDF2-HMAC-SHA256, cost is (iterations, 0, 0)
+  SCRYPT  scrypt, cost is (log2 N, r, p). Only available where hashlib
+          provides it (Python 3.6+ built against OpenSSL 1.1).
+"""
+
+import os
+import time
+import hashlib
+
+LEGACY = 0
+PBKDF2 = 1
+SCRYPT = 2
+
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+# Seconds a new file should take to unlock on the machine that creates it
+TARGET_TIME = 0.5
+
+# Cost never calibrated below this, however slow the machine
+MIN_ITERATIONS = 100000
+MIN_SCRYPT_LOG2N = 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+
+# calibrated cost for each (method, target time), so it is only measured once
+_calibrated = {}
+
+###############################################################################
+class KdfParams(object):
+    """
+    A key derivation method together with the salt and cost parameters that
+    were used for one db file
+    """
+    def __init__(self, method, salt='', cost=(0, 0, 0)):
+        if method not in _DERIVE:
+            raise IOError('Unsupported key derivation method %d' % method)
+
+        self.method = method
+        self.salt = salt
+        self.cost = tuple(cost)
+
+    #--------------------------------------------------------------------------
+    def derive(self, password):
+        """ Derive the AES key for this file from a password """
+        return _DERIVE[self.method](to_bytes(password), self.salt, self.cost)
+
+    #--------------------------------------------------------------------------
+    def __eq__(self, other):
+        """ Equal parameters derive equal keys from equal passwords """
+        return self.method == other.method and self.salt == other.salt and \
+               self.cost == other.cost
+
+    #--------------------------------------------------------------------------
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+#------------------------------------------------------------------------------
+def new_params(method=None, target=None):
+    """
+    Parameters for a new file, with a fresh salt and the cost calibrated to
+    take about 'target' seconds (TARGET_TIME by default). The best available
+    method is used if none is given.
+    """
+    if method is None:
+        method = available()[-1]
+
+    return KdfParams(method, os.urandom(SALT_SIZE), calibrate(method, target))
+
+#------------------------------------------------------------------------------
+def available():
+    """ Methods usable for new files on this Python, weakest first """
+    methods = [PBKDF2]
+    if hasattr(hashlib, 'scrypt'):
+        methods.append(SCRYPT)
+    return methods
+
+#------------------------------------------------------------------------------
+def calibrate(method=PBKDF2, target=None):
+    """
+    Cost parameters for which deriving a key takes about 'target' seconds
+    (TARGET_TIME by default) on this machine. A cheap setting is timed and
+    scaled up, doubling it first until it takes long enough to time reliably.
+    """
+    if target is None:
+        target = TARGET_TIME
+
+    if (method, target) in _calibrated:
+        return _calibrated[(method, target)]
+
+    if method == PBKDF2:
+        n = 1000
+        while True:
+            spent = _time(PBKDF2, (n, 0, 0))
+            if spent > 0.05 or spent * 2 > target:
+                break
+            n *= 2
+
+        n = int(n * target / max(spent, 1e-6))
+        cost = (max(MIN_ITERATIONS, n), 0, 0)
+
+    elif method == SCRYPT:
+        # memory use doubles with each step, so this stops at the first
+        # setting that is slow enough rather than scaling
+        log2n = 10
+        while log2n < 24 and \
+              _time(SCRYPT, (log2n, SCRYPT_R, SCRYPT_P)) * 2 < target:
+            log2n += 1
+
+        cost = (max(MIN_SCRYPT_LOG2N, log2n), SCRYPT_R, SCRYPT_P)
+
+    else:
+        raise ValueError('Cannot calibrate key derivation method %d' % method)
+
+    _calibrated[(method, target)] = cost
+    return cost
+
+#------------------------------------------------------------------------------
+def _time(method, cost):
+    """ Seconds taken to derive one key with some cost parameters """
+    start = time.time()
+    _DERIVE[method]('password', '\0'*SALT_SIZE, cost)
+    return time.time() - start
+
+#------------------------------------------------------------------------------
+def _sha256(password, salt, cost):
+    return hashlib.sha256(password).digest()
+
+#------------------------------------------------------------------------------
+def _pbkdf2(password, salt, cost):
+    if hasattr(hashlib, 'pbkdf2_hmac'):
+        return hashlib.pbkdf2_hmac('sha256', password, salt, cost[0], KEY_SIZE)
+
+    # Python before 2.7.8 only has the much slower pure python version, which
+    # calibration accounts for
+    from Crypto.Hash import SHA256, HMAC
+    from Crypto.Protocol.KDF import PBKDF2 as _slow_pbkdf2
+    prf = lambda p, s: HMAC.new(p, s, SHA256).digest()
+    return _slow_pbkdf2(password, salt, KEY_SIZE, cost[0], prf)
+
+#------------------------------------------------------------------------------
+def _scrypt(password, salt, cost):
+    if not hasattr(hashlib, 'scrypt'):
+        raise IOError('This file needs scrypt, which this Python does not have')
+
+    log2n, r, p = cost
+    return hashlib.scrypt(password, salt=salt, n=2**log2n, r=r, p=p,
+                          maxmem=256*r*2**log2n, dklen=KEY_SIZE)
+
+#------------------------------------------------------------------------------
+def to_bytes(s):
+    """
+    Strings typed into the GUI may be unicode, passwords are derived from,
+    and fields sealed and stored as, their utf-8 bytes
+    """
+    if not isinstance(s, bytes):
+        s = s.encode('utf-8')
+    return s
+
+
+_DERIVE = {LEGACY: _sha256, PBKDF2: _pbkdf2, SCRYPT: _scrypt}
@@ -0,0 +1,77 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+Looking up one field of entries by name, shared by the command line interface
+and the agent. A name has to match exactly one entry, ignoring case, and the
+error for one that does not says how many it matched.
+"""
+
+FIELDS = ('name', 'username', 'password', 'category', 'comments')
+
+###############################################################################
+class EntryNotFound(Exception):
+    """ A name does not match exactly one entry """
+    pass
+
+#------------------------------------------------------------------------------
+def find_one(data, name, category='All'):
+    """ The one entry with a name, raising EntryNotFound if there is not one """
+    found = data.GetByName(name, category)
+    if len(found) != 1:
+        raise EntryNotFound(_not_one(name, found))
+    return found[0]
+    
+#------------------------------------------------------------------------------
+def lookup_many(data, keys, field='password', category='All'):
+    """
+    Look up one field for each of a list of names or ids (entry tags, given
+    as ints). Yields a dict for each key with the key and either the 'value'
+    of the one entry it matches, or an 'error' saying why there is none.
+    """
+    for key, found in data.GetMany(keys, category):
+        if len(found) == 1:
+            yield {'key': key, 'value': field_value(found[0], field)}
+        else:
+            yield {'key': key, 'error': _not_one(key, found)}
+            
+#------------------------------------------------------------------------------
+def field_value(entry, field):
+    """ A field of an entry, not keeping its password in the cache """
+    if field == 'password':
+        return entry.reveal(False)
+    return getattr(entry, field)
+    
+#------------------------------------------------------------------------------
+def _not_one(key, found):
+    """ Why a key matching the entries found does not name one entry """
+    if isinstance(key, (int, long)):
+        return 'No entry with id %d' % key
+        
+    if not found:
+        return 'No entry named %s' % key
+        
+    cats = ', '.join(sorted(set(e.category for e in found)))
+    return '%d entries are named %s (categories: %s)' % (len(found), key, 
+                                                         cats)
@@ -25,9 +25,15 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import wx
 import os
+import threading
 from PasswordData import *
 from controls import *
 from dialogs import *
+from sealed import clear_cache
+
+# While loading, the entry list is redrawn each time the number of entries
+# has grown by this factor
+LOAD_REDRAW_GROWTH = 1.5
                      
 ###############################################################################
 class MainFrame(wx.Frame):
@@ -48,22 +54,9 @@ class MainFrame(wx.Frame):
             
         dlg.Destroy()
 
-        #Attempt to decrypt and load the password database
-        self.data = PasswordData(password, dbFile)
-        
-        # Die here if password or file were invalid
-        if not self.data.valid:
-            dlg = wx.MessageDialog\
-                  (
-                      None, 
-                      self.data.errMsg,
-                      'Decryption Error', 
-                      wx.OK|wx.ICON_ERROR
-                  )
-
-            dlg.ShowModal()
-            dlg.Destroy()
-            quit()
+        # The password database is decrypted and loaded on a worker thread
+        # once the frame is showing (see StartLoad)
+        self.data = PasswordData(password, dbFile, defer=True)
         
         #Create Menu bar and menus
         self.topMenu = wx.MenuBar()
@@ -79,6 +72,8 @@ class MainFrame(wx.Frame):
                                              'Save unencrypted copy')
         self.mImportCSV = self.fileMenu.Append(-1, '&Import Unencrypted CSV',
                                                'Load unencrypted copy')
+        self.mCompact = self.fileMenu.Append(-1, '&Compact Database',
+                                             'Rewrite database without journal')
         self.fileMenu.AppendSeparator()
         self.mQuit = self.fileMenu.Append(-1, '&Exit', 'Quit program')
         
@@ -90,6 +85,7 @@ class MainFrame(wx.Frame):
         self.topMenu.Append(self.fileMenu, '&File')
         self.topMenu.Append(self.aboutMenu, '&Help')
         self.SetMenuBar(self.topMenu)
+        self.CreateStatusBar()
                                           
         # Create the main display panel
         self.panel = MainPanel(self)
@@ -101,9 +97,18 @@ class MainFrame(wx.Frame):
         self.Bind(wx.EVT_MENU, self.DoSaveAs, self.mSaveAs)
         self.Bind(wx.EVT_MENU, self.DoSaveCSV, self.mSaveCSV)
         self.Bind(wx.EVT_MENU, self.DoImportCSV, self.mImportCSV)
-        self.Bind(wx.EVT_MENU, self.ShutDown, self.mQuit)
+        self.Bind(wx.EVT_MENU, self.DoCompact, self.mCompact)
+        self.Bind(wx.EVT_MENU, self.DoQuit, self.mQuit)
         self.Bind(wx.EVT_MENU, self.ShowAbout, self.mAbout)
         self.mSave.Enable(False)
+        
+        # Saves run on a worker thread, one at a time
+        self._saveThread = None
+        self._saveJob = None
+        self._saveError = None
+        
+        self._loadJob = None
+        self.StartLoad(password)
        
     #----------------------------------------------------------------------
     def ShowAbout(self, event):
@@ -159,14 +164,154 @@ POSSIBILITY OF SUCH DAMAGE."""
     #----------------------------------------------------------------------
     def CheckSave(self):
         """ Check if the save button should be enabled or disabled """
-        self.mSave.Enable(self.data.HasChanged())
+        busy = self._saveJob is not None or self.data.loading
+        self.mSave.Enable(self.data.HasChanged() and not busy)
+        self.mSaveAs.Enable(not busy)
+        self.mCompact.Enable(not busy)
+        self.mSaveCSV.Enable(not self.data.loading)
+        self.mImportCSV.Enable(not self.data.loading)
+        
+    #----------------------------------------------------------------------
+    def StartLoad(self, password):
+        """
+        Decrypt and read the database on a worker thread. Entries are shown
+        in batches as they arrive, and cannot be changed until all are in.
+        """
+        job = self.data.PrepareLoad(password, searchable=True)
+        self._loadJob = job
+        
+        thread = threading.Thread(target=self._run_load, args=(job,))
+        thread.daemon = True
+        thread.start()
+        
+        self.SetStatusText('Opening database...')
+        self.panel.set_loading(True)
+        self.CheckSave()
+        
+    #----------------------------------------------------------------------
+    def _run_load(self, job):
+        """
+        Body of the load thread, which hands batches to the GUI thread. The
+        GUI thread is always told when it ends, so that it does not wait on
+        a load that failed in a way the job did not expect.
+        """
+        try:
+            job.Run(lambda entries: 
+                    wx.CallAfter(self._load_batch, job, entries))
+        except Exception as e:
+            job.errMsg = 'File could not be loaded: %s' % e
+        finally:
+            wx.CallAfter(self._load_done, job)
+        
+    #----------------------------------------------------------------------
+    def _load_batch(self, job, entries):
+        """ Add a batch of loaded entries and show the progress """
+        if job is not self._loadJob:
+            return
+            
+        self.data.InsertLoaded(entries)
+        self.panel.entries_loaded()
+        
+        if job.total:
+            self.SetStatusText('Loading entries... %d%%' % 
+                               min(100, 100 * job.count // job.total))
+        else:
+            self.SetStatusText('Loading entries... %d' % job.count)
+        
+    #----------------------------------------------------------------------
+    def _load_done(self, job):
+        """ Finish loading, or give up on the file if it could not be read """
+        if job is not self._loadJob:
+            return
+            
+        self._loadJob = None
+        self.data.FinishLoad(job)
+        
+        # Die here if password or file were invalid
+        if not self.data.valid:
+            dlg = wx.MessageDialog\
+                  (
+                      None, 
+                      self.data.errMsg,
+                      'Decryption Error', 
+                      wx.OK|wx.ICON_ERROR
+                  )
+
+            dlg.ShowModal()
+            dlg.Destroy()
+            self.Destroy()
+            return
+            
+        self.SetStatusText('%d entries' % len(self.data.entries))
+        self.panel.set_loading(False)
+        self.panel.update()
+        self.CheckSave()
 
     #----------------------------------------------------------------------
     def DoSave(self, event):
         """ Save the data using standard encryption """
-        self.data.SaveChanges()
+        self.StartSave(self.data.PrepareSave())
+        
+    #----------------------------------------------------------------------
+    def DoQuit(self, event):
+        """ Close the window, which goes through ShutDown """
+        self.Close()
+        
+    #----------------------------------------------------------------------
+    def DoCompact(self, event):
+        """ Rewrite the database file with the journal folded back in """
+        self.StartSave(self.data.PrepareSave(compact=True))
+        
+    #----------------------------------------------------------------------
+    def StartSave(self, job):
+        """
+        Run a save job from the data on a worker thread, so the entries can
+        still be edited while a large file is written
+        """
+        self._saveJob = job
+        self._saveThread = threading.Thread(target=self._run_save, args=(job,))
+        self._saveThread.start()
         self.CheckSave()
         
+    #----------------------------------------------------------------------
+    def _run_save(self, job):
+        """ Body of the save thread, which reports back to the GUI thread """
+        try:
+            job.Run()
+            error = None
+        except Exception as e:
+            error = e
+            
+        self._saveError = error
+        wx.CallAfter(self._save_done, job, error)
+        
+    #----------------------------------------------------------------------
+    def _save_done(self, job, error):
+        """ Take in a finished save job, unless that was done already """
+        if job is not self._saveJob:
+            return
+            
+        self._saveJob = None
+        self._saveThread = None
+        self.data.FinishSave(job)
+        self.CheckSave()
+        
+        if error is not None:
+            dlg = wx.MessageDialog(None, 
+                                   'The database could not be saved: %s' % 
+                                   error,
+                                   'Save Error', 
+                                   wx.OK|wx.ICON_ERROR)
+            dlg.ShowModal()
+            dlg.Destroy()
+        
+    #----------------------------------------------------------------------
+    def WaitForSave(self):
+        """ Block until a running save has finished, and take it in """
+        if self._saveThread is not None:
+            self._saveThread.join()
+            self._save_done(self._saveJob, self._saveError)
+        
     #----------------------------------------------------------------------
     def DoSaveAs(self, event):
         """ Save the data to a new file using standard encryption """
@@ -177,8 +322,8 @@ POSSIBILITY OF SUCH DAMAGE."""
             dbFile = dlg.dbFile.GetValue()
         
             # Associate the currently loaded data with the new file
-            self.data.SaveChanges(dest=dbFile, newpassword=password)
-            self.CheckSave()
+            self.StartSave(self.data.PrepareSave(dest=dbFile, 
+                                                 newpassword=password))
 
         dlg.Destroy()
         
@@ -232,9 +377,12 @@ POSSIBILITY OF SUCH DAMAGE."""
     #----------------------------------------------------------------------
     def ShutDown(self, event):
         """
-        First checks if there are unsaved changes, then allows shutdown
+        First checks if there are unsaved changes, then allows shutdown. A
+        load still running is only cancelled once the window is sure to
+        close, so that the rest of it is shown if it does not.
         """
         closeWindow = True
+        self.WaitForSave()
         
         if self.data.HasChanged():
             dlg = wx.MessageDialog(None,'Save changes to database?',
@@ -248,6 +396,11 @@ POSSIBILITY OF SUCH DAMAGE."""
             closeWindow = (ans == wx.ID_YES or ans == wx.ID_NO)
         
         if closeWindow:
+            if self._loadJob is not None:
+                self._loadJob.Cancel()
+                self._loadJob = None
+                
+            clear_cache()
             event.Skip()
 
 
@@ -283,6 +436,9 @@ class MainPanel(wx.Panel):
                                           choices=self.data.GetCategories())
         self.categorySelect.SetSelection(0)
         
+        self.search = wx.SearchCtrl(self, wx.ID_ANY, size=(250,-1))
+        self.search.ShowCancelButton(True)
+        
         self.entryList = ObjectListCtrl(self, id=wx.ID_ANY, 
                          style=wx.LC_REPORT | wx.LC_HRULES | wx.SUNKEN_BORDER,
                          size=(900,440), 
@@ -308,6 +464,7 @@ class MainPanel(wx.Panel):
         
         hBoxes[-1].Add(catLabel, 0, wx.ALL|wx.ALIGN_CENTER_VERTICAL, 5)
         hBoxes[-1].Add(self.categorySelect, 1, wx.EXPAND|wx.ALL, 5)
+        hBoxes[-1].Add(self.search, 0, wx.ALL|wx.ALIGN_CENTER_VERTICAL, 5)
         hBoxes[-1].Add(self.addEntry, 0, wx.ALL|wx.ALIGN_CENTER_VERTICAL, 5)
 
         self.vBox =  wx.BoxSizer(wx.VERTICAL)
@@ -320,12 +477,38 @@ class MainPanel(wx.Panel):
         # Bind events
         self.Bind(wx.EVT_BUTTON, self._add_entry, self.addEntry)
         self.Bind(wx.EVT_COMBOBOX, self._change_category, self.categorySelect)
+        self.Bind(wx.EVT_TEXT, self._change_search, self.search)
+        self.Bind(wx.EVT_SEARCHCTRL_CANCEL_BTN, self._clear_search, self.search)
         self.entryList.Bind(wx.EVT_LEFT_DCLICK, self._edit_entry)
         self.entryList.Bind(wx.EVT_CONTEXT_MENU, self._call_entry_menu)
         self.Bind(wx.EVT_LIST_KEY_DOWN, self._check_keypress, self.entryList)
         
+        # Number of entries shown when the list was last redrawn during a
+        # load, and whether entries can be changed
+        self._shownCount = 0
+        self._loading = False
+        
         self.update()
         
+    #-------------------------------------------------------------------------- 
+    def set_loading(self, loading):
+        """ Block changes to the entries while the database is loading """
+        self._loading = loading
+        self._shownCount = 0
+        self.addEntry.Enable(not loading)
+        
+    #-------------------------------------------------------------------------- 
+    def entries_loaded(self):
+        """
+        Show newly loaded entries. The list is only redrawn once the number
+        of entries has grown by LOAD_REDRAW_GROWTH, so a large load costs
+        about as much as a few redraws rather than one per batch.
+        """
+        count = len(self.data.entries)
+        if count >= self._shownCount * LOAD_REDRAW_GROWTH:
+            self._shownCount = count
+            self.update()
+        
     #-------------------------------------------------------------------------- 
     def _check_keypress(self, event):
         """ Check for enter or delete, otherwise ignore """
@@ -341,6 +524,35 @@ class MainPanel(wx.Panel):
         """ Update panel display if the selected category is changed """
         self.update()
         
+    #-------------------------------------------------------------------------- 
+    def _change_search(self, event):
+        """ Filter the displayed entries as the search text is typed """
+        self._show_entries()
+        
+    #-------------------------------------------------------------------------- 
+    def _clear_search(self, event):
+        """ Clear the search text, which shows all entries again """
+        self.search.SetValue('')
+        
+    #-------------------------------------------------------------------------- 
+    def _show_entries(self):
+        """ 
+        Show the entries in the selected category matching the search text,
+        or the closest fuzzy matches if none do
+        """
+        cat = self.categorySelect.GetValue()
+        query = self.search.GetValue()
+        
+        # Filter gives the entries in display order already
+        entries = self.data.Filter(query, cat)
+        if entries or not query.strip():
+            self.entryList.update_objects(entries, presorted=True)
+            return
+            
+        # Nothing starts with what was typed, so show the closest matches
+        self.entryList.update_objects([e for e in self.data.Search(query) 
+                                       if cat == 'All' or e.category == cat])
+        
     #-------------------------------------------------------------------------- 
     def _call_entry_menu(self, event):
         """ 
@@ -357,6 +569,9 @@ class MainPanel(wx.Panel):
     def _edit_entry(self, event):
         """ Open a popup display to edit an entry """
         
+        if self._loading:
+            return
+            
         entry = self.entryList.GetCurrentObject()
         
         dlg = EditEntryDialog(self, 'Update', entry)
@@ -370,10 +585,23 @@ class MainPanel(wx.Panel):
             
         dlg.Destroy()
         
+    #-------------------------------------------------------------------------- 
+    def _copy_password(self, event):
+        """ Copy an entry's password to the clipboard """
+        
+        entry = self.entryList.GetCurrentObject()
+        
+        if wx.TheClipboard.Open():
+            wx.TheClipboard.SetData(wx.TextDataObject(entry.password))
+            wx.TheClipboard.Close()
+        
     #-------------------------------------------------------------------------- 
     def _delete_entry(self, event):
         """ Confirm, then delete an entry """
         
+        if self._loading:
+            return
+            
         dlg = wx.MessageDialog(None, 
                                'Are you sure you want to delete this entry?',
                                'Confirm Delete',
@@ -381,7 +609,7 @@ class MainPanel(wx.Panel):
                                    
         if dlg.ShowModal() == wx.ID_YES:
             entry = self.entryList.GetCurrentObject()
-            self.data.entries.remove(entry)
+            self.data.DeleteEntry(entry.tag)
             self.update()
             self.parent.CheckSave()
                 
@@ -397,8 +625,8 @@ class MainPanel(wx.Panel):
         if dlg.ShowModal() == wx.ID_OK:
             newEntry = dlg.GetNewItem()
             
-            if newEntry not in self.data.entries:
-                self.data.entries.append(newEntry)
+            if not self.data.IsDuplicate(newEntry):
+                self.data.AddEntry(newEntry)
                 self.update()
                 self.parent.CheckSave()
                 
@@ -429,5 +657,5 @@ class MainPanel(wx.Panel):
         self.categorySelect.AppendItems(cats)
         self.categorySelect.SetSelection(idx)
         
-        self.entryList.update_objects(self.data.GetEntries(cat))
+        self._show_entries()
         
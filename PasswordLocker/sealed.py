@@ -0,0 +1,151 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Passwords kept encrypted in memory while the program runs. They are sealed
+with AES-CTR under a random key made for each session (never the file key) and
+only unsealed when shown, edited or copied. A small cache keeps the most
+recently unsealed values so that redrawing the list does not decrypt them over
+and over.
+"""
+
+import os
+import struct
+from collections import OrderedDict
+from kdf import to_bytes
+
+# Number of unsealed values kept in the cache
+CACHE_SIZE = 32
+
+NONCE_SIZE = 8
+
+# AES block size, the unit of the keystream
+BLOCK_SIZE = 16
+
+# block number and offset into that block where a value's keystream starts
+POSITION = struct.Struct('>IB')
+
+###############################################################################
+class Sealed(str):
+    """
+    A sealed value: the nonce, the position in its batch's keystream and the
+    ciphertext. It is a str so it takes no more memory than one.
+    """
+    __slots__ = ()
+
+###############################################################################
+class SecretStore(object):
+    """
+    Seals and unseals values with one session key. Values are sealed in
+    batches, each a single CTR stream with its own nonce, which makes sealing
+    every password of a large db little more than one AES call.
+    """
+    def __init__(self, cacheSize=CACHE_SIZE):
+        self._key = os.urandom(32)
+        self._cacheSize = cacheSize
+        self._cache = OrderedDict()
+
+    #--------------------------------------------------------------------------
+    def seal_many(self, values):
+        """ List of Sealed values for a list of strings """
+        values = [to_bytes(v) for v in values]
+        nonce = os.urandom(NONCE_SIZE)
+        stream = self._cipher(nonce, 0).encrypt(''.join(values))
+
+        bs = BLOCK_SIZE
+        sealed = []
+        pos = 0
+
+        for v in values:
+            head = nonce + POSITION.pack(pos // bs, pos % bs)
+            sealed.append(Sealed(head + stream[pos:pos+len(v)]))
+            pos += len(v)
+
+        return sealed
+
+    #--------------------------------------------------------------------------
+    def unseal(self, value, cache=True):
+        """
+        Original string of a Sealed value. Unless cache is False it goes
+        through the cache, which then holds it as the most recent. The cache
+        is not locked, so it must only be used from one thread (the GUI's),
+        while cache=False never touches it and is safe on any thread.
+        """
+        if not cache:
+            return self._decrypt(value)
+
+        if value in self._cache:
+            plain = self._cache.pop(value)
+        else:
+            plain = self._decrypt(value)
+
+        self._cache[value] = plain
+        if len(self._cache) > self._cacheSize:
+            self._cache.popitem(last=False)
+
+        return plain
+
+    #--------------------------------------------------------------------------
+    def clear(self):
+        """ Forget every unsealed value """
+        self._cache.clear()
+
+    #--------------------------------------------------------------------------
+    def _decrypt(self, value):
+        """ Unseal a value without the cache """
+        block, skip = POSITION.unpack_from(value, NONCE_SIZE)
+        cipher = self._cipher(value[:NONCE_SIZE], block)
+        data = value[NONCE_SIZE+POSITION.size:]
+        return cipher.decrypt('\0'*skip + data)[skip:]
+
+    #--------------------------------------------------------------------------
+    def _cipher(self, nonce, block):
+        """ AES-CTR cipher for a batch, starting at one of its blocks """
+        from Crypto.Cipher import AES
+        from Crypto.Util import Counter
+        counter = Counter.new(64, prefix=nonce, initial_value=block)
+        return AES.new(self._key, AES.MODE_CTR, counter=counter)
+
+
+# The store for this session
+_store = SecretStore()
+
+#------------------------------------------------------------------------------
+def seal(value):
+    """ Seal one string """
+    return _store.seal_many([value])[0]
+
+#------------------------------------------------------------------------------
+def seal_many(values):
+    """ Seal a list of strings at once """
+    return _store.seal_many(values)
+
+#------------------------------------------------------------------------------
+def unseal(value, cache=True):
+    """ Original string of a Sealed value """
+    return _store.unseal(value, cache)
+
+#------------------------------------------------------------------------------
+def clear_cache():
+    """ Forget every recently unsealed value """
+    _store.clear()
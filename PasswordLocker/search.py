@@ -0,0 +1,305 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import re
+import bisect
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+# Length of the substrings indexed for fuzzy searches
+GRAM = 3
+
+# Fuzzy matches may have one edit per this many characters of the query
+EDIT_RATIO = 3
+
+# Trigrams found in more than this fraction of entries (like ".co") only add to
+# the score of candidates found through rarer ones
+COMMON = 0.05
+
+# Fuzzy candidates scored exactly for every result asked for
+CANDIDATES = 3
+
+# Up to this many new words are inserted into the sorted word list one at a
+# time before a search, more than that and the list is sorted again
+MERGE_LIMIT = 256
+
+# Trigrams seen so far, each with its characters sorted, as sorting them
+# costs several times more than looking them up
+_SORTED = {}
+
+###############################################################################
+class SearchIndex(object):
+    """
+    In-memory prefix index over some text fields of each entry, keyed by tag.
+    A query matches an entry if every word of it is the start of a word in
+    one of the entry's fields, ignoring case. Words are looked up by bisecting
+    a sorted list of every indexed word. The index is never written to disk.
+    """
+    def __init__(self):
+        self._postings = {}
+        self._words = {}
+
+        # Sorted list of indexed words, which may still hold words whose
+        # entries were removed, and words not yet merged into it
+        self._sorted = []
+        self._unsorted = []
+        self._stale = 0
+
+    #--------------------------------------------------------------------------
+    def add(self, tag, fields):
+        """ Index the words in the text fields of an entry """
+        words = set()
+        for f in fields:
+            words.update(split_words(f))
+        self._words[tag] = words
+
+        for w in words:
+            if w in self._postings:
+                self._postings[w].add(tag)
+            else:
+                self._postings[w] = set([tag])
+                self._unsorted.append(w)
+
+    #--------------------------------------------------------------------------
+    def remove(self, tag):
+        """ Remove an entry from the index """
+        for w in self._words.pop(tag):
+            tags = self._postings[w]
+            tags.discard(tag)
+            if not tags:
+                del self._postings[w]
+                self._stale += 1
+
+    #--------------------------------------------------------------------------
+    def find(self, query):
+        """ Set of tags of the entries matching the query """
+        terms = split_words(query)
+        if not terms:
+            return set(self._words)
+
+        self._merge()
+        result = None
+
+        # longer words usually match fewer entries, so start with those
+        for t in sorted(set(terms), key=len, reverse=True):
+            matches = self._prefixed(t)
+            if result is None:
+                result = matches
+            else:
+                result &= matches
+
+            if not result:
+                break
+
+        return result
+
+    #--------------------------------------------------------------------------
+    def _prefixed(self, prefix):
+        """ Set of tags of the entries with a word starting with prefix """
+        tags = set()
+        i = bisect.bisect_left(self._sorted, prefix)
+
+        while i < len(self._sorted) and self._sorted[i].startswith(prefix):
+            tags.update(self._postings.get(self._sorted[i], ()))
+            i += 1
+
+        return tags
+
+    #--------------------------------------------------------------------------
+    def _merge(self):
+        """ Bring the sorted word list up to date before a search """
+        if len(self._unsorted) > MERGE_LIMIT or \
+           self._stale > len(self._sorted) // 4:
+            self._sorted = sorted(self._postings)
+            self._stale = 0
+
+        else:
+            for w in self._unsorted:
+                i = bisect.bisect_left(self._sorted, w)
+                if i == len(self._sorted) or self._sorted[i] != w:
+                    self._sorted.insert(i, w)
+
+        self._unsorted = []
+
+
+###############################################################################
+class FuzzyIndex(object):
+    """
+    In-memory trigram index over one text string per entry, keyed by tag, for
+    ranking entries by how closely they match a mistyped query. Candidates
+    sharing enough trigrams with the query are found from the postings, and
+    only the best of those are scored by edit distance.
+    """
+    def __init__(self):
+        self._postings = {}
+        self._text = {}
+
+    #--------------------------------------------------------------------------
+    def add(self, tag, text):
+        """ Index the trigrams of an entry's text """
+        text = normalize(text)
+        self._text[tag] = text
+
+        for g in grams(text):
+            if g in self._postings:
+                self._postings[g].add(tag)
+            else:
+                self._postings[g] = set([tag])
+
+    #--------------------------------------------------------------------------
+    def remove(self, tag):
+        """ Remove an entry from the index """
+        for g in grams(self._text.pop(tag)):
+            tags = self._postings[g]
+            tags.discard(tag)
+            if not tags:
+                del self._postings[g]
+
+    #--------------------------------------------------------------------------
+    def search(self, query, limit):
+        """
+        List of up to limit (distance, tag) pairs, closest first, where
+        distance is the number of edits needed for the query to appear in the
+        entry's text. Queries shorter than a trigram find nothing.
+        """
+        query = normalize(query).strip()
+        qgrams = grams(query)
+        need = max(1, len(qgrams) // EDIT_RATIO)
+
+        # Trigrams no entry has can not help find one
+        postings = sorted((self._postings[g] for g in qgrams
+                           if g in self._postings), key=len)
+        if len(postings) < need:
+            return []
+
+        # An entry with at least need of the query's trigrams must have one
+        # of the rarest len - need + 1, so only those postings are walked.
+        # Common ones are skipped at first, and only walked if that finds
+        # nothing close enough.
+        rare = len(postings) - need + 1
+        common = max(1, int(len(self._text) * COMMON))
+        capped = max(1, min(rare, len([p for p in postings
+                                       if len(p) <= common])))
+
+        scored = self._score(query, postings, capped, need, limit)
+        if not scored and capped < rare:
+            scored = self._score(query, postings, rare, need, limit)
+
+        return scored
+
+    #--------------------------------------------------------------------------
+    def _score(self, query, postings, rare, need, limit):
+        """
+        Search results among the entries in the first rare postings, of
+        those that have at least need of the query's trigrams
+        """
+        counts = dict.fromkeys(postings[0], 1)
+        for tags in postings[1:rare]:
+            for t in tags:
+                counts[t] = counts.get(t, 0) + 1
+
+        for tags in postings[rare:]:
+            for t in tags.intersection(counts):
+                counts[t] += 1
+
+        shortlist = sorted((t for t in counts if counts[t] >= need),
+                           key=counts.get, reverse=True)[:limit * CANDIDATES]
+
+        maxEdits = max(1, len(query) // EDIT_RATIO)
+        scored = []
+        for t in shortlist:
+            d = substring_distance(query, self._text[t], maxEdits)
+            if d <= maxEdits:
+                scored.append((d, -counts[t], len(self._text[t]), t))
+
+        scored.sort()
+        return [(s[0], s[3]) for s in scored[:limit]]
+
+
+#------------------------------------------------------------------------------
+def grams(text):
+    """
+    Set of the distinct substrings of length GRAM in a string, each with its
+    characters sorted so that swapping two neighbours keeps most of them
+    """
+    sort = _SORTED.get
+    return set([sort(g) or _sort_gram(g)
+                for g in set([text[i:i+GRAM]
+                              for i in range(len(text) - GRAM + 1)])])
+
+#------------------------------------------------------------------------------
+def _sort_gram(g):
+    """ Sort the characters of a trigram, remembering the result """
+    s = _SORTED[g] = ''.join(sorted(g))
+    return s
+
+#------------------------------------------------------------------------------
+def substring_distance(pattern, text, limit=None):
+    """
+    Smallest number of single character insertions, deletions,
+    substitutions or swaps of neighbouring characters that make pattern a
+    substring of text. If that is more than limit, some number above limit
+    is returned as soon as that is certain.
+    """
+    if pattern in text:
+        return 0
+
+    before = None
+    prev = [0] * (len(text) + 1)
+    for i, p in enumerate(pattern):
+        left = i + 1
+        cur = [left]
+        for j, c in enumerate(text):
+            # cheapest of substituting (or matching) c, deleting p or
+            # inserting c
+            left = min(prev[j] + (p != c), prev[j+1] + 1, left + 1)
+
+            # or of swapping c with the text character before it
+            if before is not None and j and p == text[j-1] and \
+               c == pattern[i-1]:
+                left = min(left, before[j-1] + 1)
+            cur.append(left)
+        before, prev = prev, cur
+
+        # later rows can not do better than this one, or one more than the
+        # row before it
+        if limit is not None and min(prev) > limit and \
+           min(before) >= limit:
+            break
+
+    return min(prev)
+
+#------------------------------------------------------------------------------
+def normalize(s):
+    """ Lower case unicode version of a field or query """
+    if isinstance(s, bytes):
+        s = s.decode('utf-8', 'replace')
+    return s.lower()
+
+#------------------------------------------------------------------------------
+def split_words(s):
+    """ List of the lower case words in a field or query """
+    return WORD.findall(normalize(s))
+
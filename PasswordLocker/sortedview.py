@@ -0,0 +1,236 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import bisect
+from itertools import izip
+
+# A diff with more added, removed or moved objects than this fraction of the
+# view (or REBUILD_MIN, whichever is larger) is applied by filling the view
+# again, since that is cheaper than that many list insertions
+REBUILD_FRACTION = 8
+REBUILD_MIN = 64
+
+# Up to this many keys added to a DisplayOrder are inserted one at a time
+# before it is next read, more than that and it is sorted again
+MERGE_LIMIT = 256
+
+###############################################################################
+class SortedView(object):
+    """
+    The rows shown by a virtual ObjectListCtrl: a list of objects sorted by
+    sorting_name() (then tag), with a lookup from an object's tag to its row.
+    Updates are applied as a diff against what was last shown, so unchanged
+    rows keep their place. The sorting name must only depend on the columns,
+    so that an object with the same col_keys() is known to keep its place.
+    It does not depend on wx so it can be used and timed without a display.
+    """
+    def __init__(self):
+        self._keys = []
+        self._objects = []
+        self._shown = set()
+
+        # tag -> (sort key, column keys, object) as last shown, also for
+        # objects a large update has hidden since, so that showing them
+        # again (like clearing a search) does not work every cell out anew
+        self._cells = {}
+
+    #--------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._objects)
+
+    #--------------------------------------------------------------------------
+    def __getitem__(self, row):
+        """ Object in a row, raising IndexError for rows outside the view """
+        if row < 0 or row >= len(self._objects):
+            raise IndexError('No object in row %d' % row)
+        return self._objects[row]
+
+    #--------------------------------------------------------------------------
+    def set_objects(self, objects, presorted=False):
+        """
+        Replace the contents of the view with a new list of objects. If they
+        are in display order already (like DisplayOrder keeps them), passing
+        presorted saves sorting them again.
+        """
+        self._fill([_cell(obj) for obj in objects], presorted)
+
+    #--------------------------------------------------------------------------
+    def update(self, objects, presorted=False):
+        """
+        Bring the view in line with a new list of objects, which may be
+        presorted as for set_objects. Returns the first row from which rows
+        were inserted, removed or moved (None if no rows moved) and a list of
+        rows whose contents changed in place.
+        """
+        objects = list(objects)
+        cells = []
+        added = []
+        moved = []
+        changed = []
+
+        for obj in objects:
+            shown = obj.tag in self._shown
+            cell = self._cells.get(obj.tag)
+            if cell is not None and cell[2] is obj and \
+               cell[1] == obj.col_keys():
+                cells.append(cell)
+                if not shown:
+                    added.append(obj)
+                continue
+
+            new = _cell(obj)
+            cells.append(new)
+            if not shown:
+                added.append(obj)
+            elif cell[0] != new[0]:
+                moved.append(obj)
+            else:
+                changed.append(obj)
+
+        nRemoved = len(self._shown) - len(objects) + len(added)
+        nMoves = len(added) + nRemoved + len(moved)
+        if nMoves > max(REBUILD_MIN, len(self._keys) // REBUILD_FRACTION):
+            self._fill(cells, presorted)
+            return 0, []
+
+        tags = set(obj.tag for obj in objects)
+        removed = [tag for tag in self._shown if tag not in tags]
+        first = len(self._keys)
+
+        for tag in removed + [obj.tag for obj in moved]:
+            row = self.row_of(tag)
+            del self._keys[row]
+            del self._objects[row]
+            del self._cells[tag]
+            self._shown.discard(tag)
+            first = min(first, row)
+
+        for obj in added + moved:
+            cell = _cell(obj)
+            row = bisect.bisect_left(self._keys, cell[0])
+            self._keys.insert(row, cell[0])
+            self._objects.insert(row, obj)
+            self._cells[obj.tag] = cell
+            self._shown.add(obj.tag)
+            first = min(first, row)
+
+        rows = []
+        for obj in changed:
+            row = self.row_of(obj.tag)
+            self._objects[row] = obj
+            self._cells[obj.tag] = _cell(obj)
+            rows.append(row)
+
+        if not nMoves:
+            first = None
+
+        return first, rows
+
+    #--------------------------------------------------------------------------
+    def row_of(self, tag):
+        """ Row of the object with a given tag, or -1 if it is not shown """
+        if tag not in self._shown:
+            return -1
+        return bisect.bisect_left(self._keys, self._cells[tag][0])
+
+    #--------------------------------------------------------------------------
+    def _fill(self, cells, presorted):
+        """
+        Show the objects of a list of cells, sorting them unless told not.
+        The cells of hidden objects are kept until the view is filled with
+        at least half as many as it holds, which drops those of objects that
+        no longer exist.
+        """
+        if not presorted:
+            cells.sort(key=lambda c: c[0])
+
+        self._keys = [c[0] for c in cells]
+        self._objects = [c[2] for c in cells]
+        tags = [obj.tag for obj in self._objects]
+        self._shown = set(tags)
+
+        if len(cells) * 2 >= len(self._cells):
+            self._cells = dict(izip(tags, cells))
+        else:
+            self._cells.update(izip(tags, cells))
+
+
+###############################################################################
+class DisplayOrder(object):
+    """
+    Display order keys (sorting_name() then tag) of a changing set of
+    objects, kept sorted. Keys added are merged in when the order is next
+    read, one at a time for a few or by sorting again for many, so filling
+    it with a large number of objects costs one sort.
+    """
+    def __init__(self, objects=()):
+        self._keys = []
+        self._added = [_sort_key(obj) for obj in objects]
+
+    #--------------------------------------------------------------------------
+    def add(self, obj):
+        """ Add an object """
+        self._added.append(_sort_key(obj))
+
+    #--------------------------------------------------------------------------
+    def remove(self, obj):
+        """ Remove an object, which must not have changed since it was added """
+        key = _sort_key(obj)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+        else:
+            self._added.remove(key)
+
+    #--------------------------------------------------------------------------
+    def keys(self):
+        """
+        Sorted list of the (sorting name, tag) keys of every object, which
+        must not be changed
+        """
+        if len(self._added) > MERGE_LIMIT:
+            self._keys.extend(self._added)
+            self._keys.sort()
+        else:
+            for key in self._added:
+                bisect.insort(self._keys, key)
+
+        self._added = []
+        return self._keys
+
+
+#------------------------------------------------------------------------------
+def _sort_key(obj):
+    """ Display order, with the tag breaking ties between equal names """
+    return (obj.sorting_name(), obj.tag)
+
+#------------------------------------------------------------------------------
+def _cell(obj):
+    """
+    What the view remembers about an object to detect changes later. Column
+    keys are compared rather than strings so sealed passwords stay sealed.
+    """
+    return (_sort_key(obj), obj.col_keys(), obj)
+
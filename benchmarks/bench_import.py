@@ -0,0 +1,127 @@
+#!/usr/bin/python
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+Report how long importing the package takes for a headless program (one
+that only uses PasswordData) and for the command line interface, against
+importing the modules the original package loaded up front, which were wx
+and Crypto.Random among others. The original could not be imported at all
+without wx, so that row is timed without it where wx is not installed.
+Each import runs in a fresh interpreter, after one untimed run so that
+compiled .pyc files exist. The run fails if importing the package or the
+command line interface loads any of the heavy modules. Usage:
+
+    python benchmarks/bench_import.py [number of runs]
+"""
+
+import os
+import sys
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+# Modules the original package imported, apart from wx
+ORIGINAL = ['os', 'copy', 'math', 'csv', 're', 'random', 'string',
+            'Crypto.Hash.SHA256', 'Crypto.Cipher.AES', 'Crypto.Random']
+
+# Modules a headless program should not end up loading
+HEAVY = ['wx', 'Crypto.Cipher.AES', 'Crypto.Random', 'Crypto.Protocol.KDF',
+         'Crypto.Util.Counter', 'multiprocessing', 'tempfile', 'ctypes',
+         'threading', 'SocketServer']
+
+# Program timed in the child process, printing the seconds taken by the
+# imports followed by the heavy modules that were loaded
+CHILD = """
+import sys, time
+start = time.time()
+%s
+spent = time.time() - start
+print(spent)
+print(' '.join(m for m in %r if m in sys.modules))
+"""
+
+#------------------------------------------------------------------------------
+def time_import(statements, runs):
+    """
+    Median seconds taken by some import statements in a fresh interpreter,
+    and the heavy modules they loaded
+    """
+    code = CHILD % ('\n'.join(statements), HEAVY)
+    times = []
+    loaded = ''
+
+    for i in range(runs + 1):
+        out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+        lines = out.decode().splitlines() + ['']
+        if i > 0:
+            times.append(float(lines[0]))
+        loaded = lines[1]
+
+    times.sort()
+    return times[len(times) // 2], loaded
+
+#------------------------------------------------------------------------------
+def has_wx():
+    """ Check if wx can be imported, for timing the old eager layout """
+    try:
+        subprocess.check_call([sys.executable, '-c', 'import wx'],
+                              stderr=open(os.devnull, 'w'))
+        return True
+    except subprocess.CalledProcessError:
+        return False
+
+#------------------------------------------------------------------------------
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    original = ['import %s' % m for m in ORIGINAL]
+    if has_wx():
+        original += ['import wx', 'import wx.lib.agw.pygauge', 
+                     'import wx.lib.intctrl']
+    else:
+        print('wx is not installed, the original imports are timed '+
+              'without it')
+
+    print('%d runs each, median' % runs)
+    print('%-26s %10s  %s' % ('import', 'ms', 'heavy modules loaded'))
+
+    failed = []
+    for label, statements in (('original imports', original),
+                              ('PasswordLocker', ['import PasswordLocker']),
+                              ('PasswordLocker.cli', 
+                               ['import PasswordLocker.cli'])):
+        spent, loaded = time_import(statements, runs)
+        print('%-26s %10.1f  %s' % (label, spent * 1000, loaded or '-'))
+        
+        if loaded and statements is not original:
+            failed.append(label)
+            
+    if failed:
+        sys.exit('Heavy modules were loaded by importing %s' % 
+                 ' and '.join(failed))
+
+
+if __name__ == '__main__':
+    main()
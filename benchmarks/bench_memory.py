@@ -0,0 +1,115 @@
+#!/usr/bin/python
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Report the memory used per Entry, comparing the slotted Entry class against
+the original __dict__ based layout. Usage:
+
+    python benchmarks/bench_memory.py [number of entries]
+"""
+
+import os
+import sys
+import gc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+from PasswordData import Entry
+
+###############################################################################
+class DictEntry(object):
+    """ Entry as it was before __slots__, with every field in __dict__ """
+    def __init__(self, name, username, password, category, comments):
+        self.tag = id(self)
+        self.name = name
+        self.username = username
+        self.password = password
+        self.comments = comments
+        self.category = category
+
+#------------------------------------------------------------------------------
+def object_size(obj):
+    """ Size of the object itself and its __dict__, excluding field values """
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+#------------------------------------------------------------------------------
+def resident_size():
+    """ Resident memory of this process in bytes, or None if unknown """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError):
+        return None
+
+#------------------------------------------------------------------------------
+def measure(cls, n):
+    """
+    Create n entries of class cls and return (object bytes per entry, resident
+    bytes per entry, entries). Field strings are shared between entries so
+    that only the per-object overhead is compared. The entries are returned
+    so that later measurements cannot reuse their memory.
+    """
+    fields = ('example.com', 'someone@example.com', 'hunter2', 'Web', '')
+
+    gc.collect()
+    before = resident_size()
+    entries = [cls(*fields) for i in range(n)]
+    after = resident_size()
+
+    perObject = object_size(entries[0])
+    if before is None or after is None:
+        perResident = None
+    else:
+        perResident = (after - before) / float(n)
+
+    return perObject, perResident, entries
+
+#------------------------------------------------------------------------------
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    print('%d entries' % n)
+    print('%-22s %14s %16s' % ('layout', 'object bytes', 'resident bytes'))
+
+    keep = []
+    for label, cls in (('__dict__ (before)', DictEntry),
+                       ('__slots__ (after)', Entry)):
+        perObject, perResident, entries = measure(cls, n)
+        keep.append(entries)
+
+        if perResident is None:
+            resident = 'n/a'
+        else:
+            resident = '%.1f' % perResident
+
+        print('%-22s %14d %16s' % (label, perObject, resident))
+
+
+if __name__ == '__main__':
+    main()
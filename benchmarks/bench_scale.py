@@ -0,0 +1,587 @@
+#!/usr/bin/python
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+Time the hot paths of PasswordData, and the list control refresh, on
+synthetic databases of growing size. For each size a database and a CSV
+file of the same entries are generated (with a fixed seed, so every run
+sees the same data), and each operation is timed in a fresh interpreter so
+that its peak memory can be reported on its own. Usage:
+
+    python benchmarks/bench_scale.py [--sizes 1000,10000] [--runs 3]
+                                     [--json FILE] [--compare FILE]
+                                     [--dir DIR]
+
+Times are the median of the runs. Throughput is given for the operations
+that work through every entry. Peak memory is the most the process held,
+which includes the interpreter and any setup such as loading the database.
+
+--json writes the results in a form later runs can be compared against
+with --compare, which adds each time as a multiple of the earlier one.
+--dir keeps the generated files there and reuses them on the next run.
+The million entry size needs about 3 GB of memory and takes some minutes
+per operation, --sizes can leave it out.
+
+The generated files use a cheap key derivation setting, since deriving
+the key costs the same for any size and would hide the rest. Timing the
+list control needs wx and a display, without them it is skipped and the
+SortedView it is built on is timed instead.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'tests'))
+
+from helpers import cheap_kdf
+from PasswordData import PasswordData, Entry
+from sortedview import SortedView
+from bench_memory import resident_size
+
+SIZES = [1000, 10000, 100000, 1000000]
+
+PASSWORD = 'benchmark'
+SEED = 2014
+
+# Keys looked up by the get_many operation
+LOOKUPS = 1000
+
+# Calls timed together for operations too quick to time one at a time
+REPEAT = 10000
+
+COLUMNS = [('Location', 200), ('Username', 250), ('Password', 150),
+           ('Category', 100), ('Comments', 250)]
+
+SYLLABLES = ['ab', 'bo', 'ca', 'del', 'en', 'fi', 'go', 'ha', 'in', 'jo',
+             'ka', 'lo', 'ma', 'net', 'or', 'pa', 'qui', 'ra', 'so', 'tel',
+             'um', 'va', 'web', 'xo', 'yu', 'zen', 'bank', 'mail', 'shop',
+             'cloud', 'git', 'pay', 'box', 'hub', 'line', 'star', 'sky',
+             'data', 'port', 'link']
+DOMAINS = ['com', 'org', 'net', 'io', 'co.uk']
+CATEGORIES = ['Web', 'Email', 'Banking', 'Shopping', 'Work', 'Social', 
+              'Games', 'Servers', 'Wifi', 'Software', 'Travel', 'Other']
+CHARACTERS = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ' + \
+             '0123456789!@#$%^&*-_=+'
+
+###############################################################################
+class Skipped(Exception):
+    """ An operation cannot be timed here """
+    pass
+
+###############################################################################
+class Vault(object):
+    """ The generated files of one size, in a working folder """
+    def __init__(self, folder, size):
+        self.folder = folder
+        self.size = size
+        self.db = os.path.join(folder, 'vault-%d.db' % size)
+        self.csv = os.path.join(folder, 'vault-%d.csv' % size)
+        
+    #--------------------------------------------------------------------------
+    def scratch(self, name):
+        """ Path of a scratch file, removed if it exists """
+        path = os.path.join(self.folder, 'scratch-%d-%s' % (self.size, name))
+        if os.path.exists(path):
+            os.remove(path)
+        return path
+        
+    #--------------------------------------------------------------------------
+    def use_copy(self):
+        """
+        Work on a scratch copy of the database from now on, so that an
+        operation that saves leaves the generated file as it was
+        """
+        path = self.scratch('copy.db')
+        shutil.copyfile(self.db, path)
+        self.db = path
+        
+    #--------------------------------------------------------------------------
+    def clean(self):
+        """ Remove the scratch files """
+        prefix = 'scratch-%d-' % self.size
+        for name in os.listdir(self.folder):
+            if name.startswith(prefix):
+                os.remove(os.path.join(self.folder, name))
+                
+    #--------------------------------------------------------------------------
+    def exists(self):
+        return os.path.exists(self.db) and os.path.exists(self.csv)
+        
+    #--------------------------------------------------------------------------
+    def generate(self):
+        """
+        Write the database and CSV file. The database is compacted, so that
+        the entries are in its snapshot like those of a file that has been
+        in use, rather than all in the journal.
+        """
+        rng = random.Random(SEED)
+        data = PasswordData(PASSWORD, self.db, new=True)
+        
+        with open(self.csv, 'w') as f:
+            writer = csv.writer(f)
+            for i in range(self.size):
+                fields = make_fields(rng)
+                writer.writerow(fields)
+                data.AddEntry(Entry(*fields))
+                
+        data.Compact()
+        
+
+#------------------------------------------------------------------------------
+def make_fields(rng):
+    """ Name, username, password, category and comments of a random entry """
+    word = lambda n: ''.join(rng.choice(SYLLABLES) for i in range(n))
+    
+    name = '%s.%s' % (word(3), rng.choice(DOMAINS))
+    username = '%s%d' % (word(2), rng.randint(1, 999))
+    password = ''.join(rng.choice(CHARACTERS) for i in range(16))
+    category = rng.choice(CATEGORIES)
+    
+    if rng.random() < 0.25:
+        comments = ' '.join(word(2) for i in range(rng.randint(1, 8)))
+    else:
+        comments = ''
+        
+    return [name, username, password, category, comments]
+
+#------------------------------------------------------------------------------
+def load(vault):
+    """ The vault's database, loaded """
+    data = PasswordData(PASSWORD, vault.db)
+    if not data.valid:
+        raise RuntimeError(data.errMsg)
+    return data
+    
+#------------------------------------------------------------------------------
+def changed_copy(entry):
+    """ A copy of an entry with its username changed """
+    return Entry(entry.name, entry.username + 'x', entry.password, 
+                 entry.category, entry.comments)
+                 
+#------------------------------------------------------------------------------
+def first_entry(data):
+    return next(iter(data.entries.values()))
+    
+#------------------------------------------------------------------------------
+# Each operation does its untimed setup and returns (run, reset). run does
+# the timed work once, and reset, if not None, is called before every run.
+#------------------------------------------------------------------------------
+def op_load(vault):
+    """ Decrypt and parse the whole database """
+    return (lambda: load(vault)), None
+    
+#------------------------------------------------------------------------------
+def op_write(vault):
+    """ Rewrite the database file, copying the unchanged records """
+    data = load(vault)
+    return data.Write, None
+    
+#------------------------------------------------------------------------------
+def op_write_all(vault):
+    """ Rewrite the database under a new key, encrypting every record """
+    data = load(vault)
+    return (lambda: data.SaveChanges(newpassword=PASSWORD)), None
+    
+#------------------------------------------------------------------------------
+def op_save_one(vault):
+    """ Save one changed entry, appending it to the journal """
+    data = load(vault)
+    entry = first_entry(data)
+    
+    def reset():
+        data.UpdateEntry(entry.tag, changed_copy(entry))
+        
+    return data.SaveChanges, reset
+    
+#------------------------------------------------------------------------------
+def op_import_csv(vault):
+    """ Import the CSV file into an empty database """
+    state = {}
+    
+    def reset():
+        state['data'] = PasswordData(PASSWORD, vault.scratch('import.db'), 
+                                     new=True)
+                                     
+    return (lambda: state['data'].ImportCSV(vault.csv)), reset
+    
+#------------------------------------------------------------------------------
+def op_has_changed(vault):
+    """ Check for unsaved changes, with one entry changed """
+    data = load(vault)
+    entry = first_entry(data)
+    data.UpdateEntry(entry.tag, changed_copy(entry))
+    
+    def run():
+        for i in range(REPEAT):
+            data.HasChanged()
+            
+    return run, None
+    
+#------------------------------------------------------------------------------
+def op_categories(vault):
+    """ List the categories and the entries of each """
+    data = load(vault)
+    
+    def run():
+        for cat in data.GetCategories():
+            list(data.GetEntries(cat))
+            
+    return run, None
+    
+#------------------------------------------------------------------------------
+def op_filter(vault):
+    """ Type-ahead filter on a two letter prefix, with the index built """
+    data = load(vault)
+    data.Filter('warmup')
+    return (lambda: data.Filter('ba')), None
+    
+#------------------------------------------------------------------------------
+def op_search(vault):
+    """ Fuzzy search for a misspelled name, with the index already built """
+    data = load(vault)
+    data.Search('warmup')
+    return (lambda: data.Search('clodbankhub')), None
+    
+#------------------------------------------------------------------------------
+def op_get_many(vault):
+    """ Look up the passwords of LOOKUPS entries by name """
+    data = load(vault)
+    rng = random.Random(SEED)
+    names = [e.name for e in rng.sample(list(data.entries.values()), 
+                                        min(LOOKUPS, vault.size))]
+                                        
+    def run():
+        for key, found in data.GetMany(names):
+            for e in found:
+                e.reveal(False)
+                
+    return run, None
+    
+#------------------------------------------------------------------------------
+def op_view_fill(vault):
+    """ Fill an empty SortedView, as when the list is first shown """
+    entries = list(load(vault).entries.values())
+    state = {}
+    
+    def reset():
+        state['view'] = SortedView()
+        
+    return (lambda: state['view'].update(entries)), reset
+    
+#------------------------------------------------------------------------------
+def op_view_refresh(vault):
+    """ Update a full SortedView after one entry changed """
+    data = load(vault)
+    entry = first_entry(data)
+    view = SortedView()
+    view.update(data.entries.values())
+    
+    def reset():
+        data.UpdateEntry(entry.tag, changed_copy(entry))
+        
+    return (lambda: view.update(data.entries.values())), reset
+    
+#------------------------------------------------------------------------------
+def op_view_filter(vault):
+    """
+    Type a letter into the search box and clear it again: show the entries
+    matching a one letter prefix in a SortedView showing all of them, and
+    then all of them again
+    """
+    data = load(vault)
+    view = SortedView()
+    view.update(data.Filter(''), presorted=True)
+    data.Filter('warmup')
+    
+    def run():
+        view.update(data.Filter('b'), presorted=True)
+        view.update(data.Filter(''), presorted=True)
+        
+    return run, None
+    
+#------------------------------------------------------------------------------
+def op_gui_fill(vault):
+    """ ObjectListCtrl.update_objects with every entry, in a hidden frame """
+    ctrl, frame = make_list_ctrl()
+    entries = list(load(vault).entries.values())
+    state = {'ctrl': ctrl}
+    
+    def reset():
+        state['ctrl'].Destroy()
+        state['ctrl'] = make_list_ctrl(frame)[0]
+        
+    return (lambda: state['ctrl'].update_objects(entries)), reset
+    
+#------------------------------------------------------------------------------
+def op_gui_refresh(vault):
+    """ ObjectListCtrl.update_objects after one entry changed """
+    ctrl, frame = make_list_ctrl()
+    data = load(vault)
+    entry = first_entry(data)
+    ctrl.update_objects(data.entries.values())
+    
+    def reset():
+        data.UpdateEntry(entry.tag, changed_copy(entry))
+        
+    return (lambda: ctrl.update_objects(data.entries.values())), reset
+    
+#------------------------------------------------------------------------------
+def make_list_ctrl(frame=None):
+    """
+    An ObjectListCtrl like the main window's, in a frame that is never
+    shown, raising Skipped if there is no wx or no display
+    """
+    if sys.platform.startswith('linux') and not \
+       (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')):
+        raise Skipped('no display')
+        
+    try:
+        import wx
+        from controls import ObjectListCtrl
+    except ImportError:
+        raise Skipped('wx is not installed')
+        
+    if frame is None:
+        make_list_ctrl.app = wx.App(False)
+        frame = wx.Frame(None, size=(900, 440))
+        
+    ctrl = ObjectListCtrl(frame, id=wx.ID_ANY, size=(900, 440), cols=COLUMNS)
+    return ctrl, frame
+    
+    
+# Name, operation, whether it works through every entry (so that its
+# throughput means something) and the calls made by each run, which the time
+# is divided by
+OPERATIONS = [('load', op_load, True, 1),
+              ('write', op_write, True, 1),
+              ('write_all', op_write_all, True, 1),
+              ('save_one', op_save_one, False, 1),
+              ('import_csv', op_import_csv, True, 1),
+              ('has_changed', op_has_changed, False, REPEAT),
+              ('categories', op_categories, True, 1),
+              ('filter', op_filter, False, 1),
+              ('search', op_search, False, 1),
+              ('get_many', op_get_many, False, 1),
+              ('view_fill', op_view_fill, True, 1),
+              ('view_refresh', op_view_refresh, False, 1),
+              ('view_filter', op_view_filter, False, 2),
+              ('gui_fill', op_gui_fill, True, 1),
+              ('gui_refresh', op_gui_refresh, False, 1)]
+              
+#------------------------------------------------------------------------------
+def peak_size():
+    """ Most resident memory this process has used in bytes, or None """
+    try:
+        import resource
+    except ImportError:
+        return None
+        
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+    
+#------------------------------------------------------------------------------
+def child(args):
+    """ Time one operation on one size and print the result as JSON """
+    cheap_kdf()
+    vault = Vault(args.dir, args.size)
+    
+    if args.child == 'generate':
+        vault.generate()
+        return
+        
+    name, operation, perEntry, calls = \
+        [o for o in OPERATIONS if o[0] == args.child][0]
+    vault.use_copy()
+    base = resident_size()
+    
+    try:
+        run, reset = operation(vault)
+    except Skipped as e:
+        vault.clean()
+        print(json.dumps({'skipped': str(e)}))
+        return
+        
+    times = []
+    for i in range(args.runs):
+        if reset is not None:
+            reset()
+        start = default_timer()
+        run()
+        times.append((default_timer() - start) / calls)
+        
+    vault.clean()
+        
+    times.sort()
+    print(json.dumps({'seconds': times[len(times) // 2], 'times': times,
+                      'base_bytes': base, 'peak_bytes': peak_size()}))
+    
+#------------------------------------------------------------------------------
+def run_child(args, name, size):
+    """ Result of timing an operation in a fresh interpreter, as a dict """
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', name,
+           '--size', str(size), '--runs', str(args.runs), '--dir', args.dir]
+    out = subprocess.check_output(cmd).decode()
+    if name == 'generate':
+        return None
+    return json.loads(out.strip().splitlines()[-1])
+    
+#------------------------------------------------------------------------------
+def version():
+    """ Commit of the code being timed, if it is a git checkout """
+    try:
+        with open(os.devnull, 'w') as null:
+            out = subprocess.check_output(['git', 'describe', '--always', 
+                                           '--dirty'], stderr=null,
+                                          cwd=os.path.dirname(
+                                              os.path.abspath(__file__)))
+        return out.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+        
+#------------------------------------------------------------------------------
+def report(result, size, perEntry, old):
+    """ One row of the results table """
+    if 'skipped' in result:
+        return '%-14s %9d  skipped: %s' % (result['op'], size, 
+                                            result['skipped'])
+                                            
+    seconds = result['seconds']
+    if seconds >= 0.1:
+        spent = '%9.2f s ' % seconds
+    elif seconds >= 1e-4:
+        spent = '%9.2f ms' % (seconds * 1e3)
+    else:
+        spent = '%9.2f us' % (seconds * 1e6)
+        
+    if perEntry and seconds > 0:
+        rate = '%12.0f' % (size / seconds)
+    else:
+        rate = '%12s' % '-'
+        
+    if result['peak_bytes'] is None:
+        peak = '%9s' % 'n/a'
+    else:
+        peak = '%9.1f' % (result['peak_bytes'] / 1e6)
+        
+    row = '%-14s %9d %s %s %s' % (result['op'], size, spent, rate, peak)
+    
+    key = (result['op'], size)
+    if key in old and old[key].get('seconds'):
+        row += ' %8.2fx' % (seconds / old[key]['seconds'])
+        
+    return row
+    
+#------------------------------------------------------------------------------
+def parse_args():
+    parser = argparse.ArgumentParser(description='Time PasswordData and '+
+                                     'the entry list on generated databases')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES),
+                        help='comma separated numbers of entries')
+    parser.add_argument('--ops', default=','.join(o[0] for o in OPERATIONS),
+                        help='comma separated operations to time')
+    parser.add_argument('--runs', type=int, default=3, 
+                        help='runs of each operation (the median is shown)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--compare', help='results file of an earlier run')
+    parser.add_argument('--dir', help='folder for the generated files, '+
+                        'which are kept and reused')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+    
+#------------------------------------------------------------------------------
+def main():
+    args = parse_args()
+    if args.child:
+        child(args)
+        return
+        
+    sizes = [int(s) for s in args.sizes.split(',')]
+    names = args.ops.split(',')
+    perEntry = dict((o[0], o[2]) for o in OPERATIONS)
+    for name in names:
+        if name not in perEntry:
+            sys.exit('Unknown operation %s' % name)
+            
+    old = {}
+    if args.compare:
+        with open(args.compare) as f:
+            for r in json.load(f)['results']:
+                old[(r['op'], r['size'])] = r
+                
+    keep = args.dir is not None
+    if not keep:
+        args.dir = tempfile.mkdtemp(prefix='pwlocker-bench-')
+    elif not os.path.isdir(args.dir):
+        os.makedirs(args.dir)
+        
+    results = []
+    print('%d runs each, median' % args.runs)
+    print('%-14s %9s %12s %12s %9s' % ('operation', 'entries', 'time', 
+                                       'entries/s', 'peak MB') + 
+          (' %9s' % 'vs old' if old else ''))
+          
+    try:
+        for size in sizes:
+            if not Vault(args.dir, size).exists():
+                run_child(args, 'generate', size)
+                
+            for name in names:
+                result = {'op': name, 'size': size}
+                result.update(run_child(args, name, size))
+                results.append(result)
+                
+                print(report(result, size, perEntry[name], old))
+                sys.stdout.flush()
+    finally:
+        if not keep:
+            shutil.rmtree(args.dir)
+            
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'version': version(), 'time': time.time(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(), 
+                       'runs': args.runs, 'results': results}, 
+                      f, indent=1, sort_keys=True)
+            
+            
+if __name__ == '__main__':
+    main()
@@ -27,9 +27,14 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 
 import wx
+import multiprocessing
 import PasswordLocker
 
-app = wx.App()
-PasswordLocker.MainFrame()
-app.MainLoop()
+# Large files are decrypted by worker processes, which on Windows start by
+# importing this script, so the GUI must only be started by the main process
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    app = wx.App()
+    PasswordLocker.MainFrame()
+    app.MainLoop()
     
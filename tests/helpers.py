@@ -0,0 +1,72 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Helpers shared by the tests, and by the benchmarks where they fit. Importing
+this module puts the PasswordLocker folder on the path.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+import kdf
+from PasswordData import PasswordData, Entry
+
+# what DatabaseTest stores, unless a test case sets its own
+ENTRIES = [('GitHub', 'me', 'hunter2', 'Web', ''),
+           ('Bank', 'acct', 'secret', 'Money', ''),
+           ('Bank', 'joint', 'shared', 'Money', '')]
+
+#------------------------------------------------------------------------------
+def cheap_kdf():
+    """ Make new keys cheap to derive, the tests do not need a slow key """
+    kdf.TARGET_TIME = 0.001
+    kdf.MIN_ITERATIONS = 1
+    kdf.MIN_SCRYPT_LOG2N = 10
+    
+###############################################################################
+class DatabaseTest(unittest.TestCase):
+    """
+    Test case with a database file in a new folder, with the password
+    'password' and the fields of the entries in the class attribute 'entries'
+    """
+    entries = ENTRIES
+    
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'passwords.db')
+        
+        data = PasswordData('password', self.path, new=True)
+        for fields in self.entries:
+            data.AddEntry(Entry(*fields))
+        data.SaveChanges()
+        
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+        shutil.rmtree(self.folder)
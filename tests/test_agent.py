@@ -0,0 +1,204 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Tests of the agent in agent.py: the requests it answers, and the socket it
+listens on. Run from the top folder with
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import socket
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+from helpers import DatabaseTest, cheap_kdf
+from agent import *
+from sealed import Sealed
+from PasswordData import PasswordData, Entry
+
+cheap_kdf()
+
+###############################################################################
+class AgentTest(DatabaseTest):
+    """ Requests answered from an unlocked database """
+    def setUp(self):
+        DatabaseTest.setUp(self)
+        self.agent = Agent(PasswordData('password', self.path, lazy=True))
+        
+    #--------------------------------------------------------------------------
+    def ask(self, **req):
+        """ Value of a request, failing the test if it is refused """
+        response = self.agent.handle(req)
+        self.assertTrue(response['ok'], response.get('error'))
+        return response['value']
+        
+    #--------------------------------------------------------------------------
+    def refused(self, **req):
+        """ Error for a request, failing the test if it is answered """
+        response = self.agent.handle(req)
+        self.assertFalse(response['ok'])
+        return response['error']
+        
+    #--------------------------------------------------------------------------
+    def test_lookups(self):
+        self.assertEqual(self.ask(op='get', name='github'), 'hunter2')
+        self.assertEqual(self.ask(op='get', name='GitHub', field='username'),
+                         'me')
+        self.assertIn('2 entries', self.refused(op='get', name='bank'))
+        self.assertEqual(self.ask(op='get_many', keys=['github', 'nope']),
+                         [{'key': 'github', 'value': 'hunter2'},
+                          {'key': 'nope', 'error': 'No entry named nope'}])
+        self.assertEqual(self.ask(op='list'), 
+                         [['Bank', 'acct', 'Money'], 
+                          ['Bank', 'joint', 'Money'],
+                          ['GitHub', 'me', 'Web']])
+        self.assertEqual(self.ask(op='list', query='git'), 
+                         [['GitHub', 'me', 'Web']])
+        
+        # entries with the same name told apart by id
+        self.assertEqual(self.ask(op='list', query='bank', ids=True), 
+                         [[2, 'Bank', 'acct', 'Money'], 
+                          [3, 'Bank', 'joint', 'Money']])
+        self.assertEqual(self.ask(op='get_many', keys=[3, 9]),
+                         [{'key': 3, 'value': 'shared'},
+                          {'key': 9, 'error': 'No entry with id 9'}])
+        self.assertEqual(self.ask(op='search', query='gthub', limit=1), 
+                         [['GitHub', 'me', 'Web']])
+        
+    #--------------------------------------------------------------------------
+    def test_bad_requests(self):
+        self.assertEqual(self.refused(op='get', name='github', field='x'), 
+                         'Unknown field x')
+        self.assertEqual(self.refused(op='get'), 'Bad request')
+        self.assertEqual(self.refused(op='nope'), 'Unknown request nope')
+        self.assertIn('serves', self.refused(op='ping', db=self.folder))
+        self.assertEqual(self.refused(op='search', query=3), 'Bad request')
+        self.assertEqual(self.refused(op='list', query=['a']), 'Bad request')
+        self.assertEqual(self.refused(op='get', name=None), 'Bad request')
+        self.assertEqual(self.refused(op='get_many', keys=[{}]), 
+                         'Bad request')
+        self.assertEqual(self.refused(op='ping', db=1), 'Bad request')
+        
+    #--------------------------------------------------------------------------
+    def test_file_gone(self):
+        os.rename(self.path, self.path + '.moved')
+        self.assertIn('the agent is locked', 
+                      self.refused(op='get', name='github'))
+        self.assertTrue(self.ask(op='ping')['locked'])
+        
+    #--------------------------------------------------------------------------
+    def test_lock_and_unlock(self):
+        self.ask(op='lock')
+        self.assertTrue(self.ask(op='ping')['locked'])
+        self.assertEqual(self.refused(op='get', name='github'), 
+                         'The agent is locked')
+        
+        self.assertEqual(self.refused(op='unlock', password='wrong'), 
+                         'Incorrect password')
+        self.ask(op='unlock', password='password')
+        self.assertFalse(self.ask(op='ping')['locked'])
+        self.assertEqual(self.ask(op='get', name='github'), 'hunter2')
+        
+        # passwords stay sealed while the agent holds them
+        for e in self.agent._data.entries.values():
+            self.assertTrue(isinstance(e._password, Sealed))
+            
+    #--------------------------------------------------------------------------
+    def test_file_changed(self):
+        data = PasswordData('password', self.path)
+        data.AddEntry(Entry('Mail', 'me', 'letters', 'Web', ''))
+        data.SaveChanges()
+        self.assertEqual(self.ask(op='get', name='mail'), 'letters')
+        
+    #--------------------------------------------------------------------------
+    def test_idle(self):
+        self.agent.idleTimeout = 0
+        self.agent._lastUsed -= 1
+        self.agent.check_idle()
+        self.assertTrue(self.ask(op='ping')['locked'])
+        
+        
+###############################################################################
+class ServerTest(DatabaseTest):
+    """ The socket an agent listens on """
+    entries = []
+    
+    #--------------------------------------------------------------------------
+    def serve(self, path=None):
+        """ Server for a new agent, running on another thread """
+        server = make_server(Agent(PasswordData('password', self.path)), path)
+        thread = threading.Thread(target=run_server, args=(server,))
+        thread.start()
+        self.addCleanup(thread.join)
+        return server
+        
+    #--------------------------------------------------------------------------
+    def test_private_folder(self):
+        server = self.serve()
+        try:
+            folder = os.path.dirname(server.path)
+            self.assertEqual(os.stat(folder).st_mode & 0o077, 0)
+            self.assertFalse(request(server.path, {'op': 'ping'})['locked'])
+        finally:
+            request(server.path, {'op': 'stop'})
+            
+        close_server(server)
+        self.assertFalse(os.path.exists(folder))
+        self.assertRaises(AgentError, request, server.path, {'op': 'ping'})
+        
+    #--------------------------------------------------------------------------
+    def test_given_path(self):
+        path = os.path.join(self.folder, 'agent')
+        
+        # anything but a socket is left alone
+        with open(path, 'w') as f:
+            f.write('keep')
+        self.assertRaises(AgentError, make_server, None, path)
+        with open(path) as f:
+            self.assertEqual(f.read(), 'keep')
+        os.remove(path)
+        
+        # a socket no agent answers on is replaced
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        
+        server = self.serve(path)
+        try:
+            self.assertRaises(AgentError, make_server, None, path)
+        finally:
+            request(path, {'op': 'stop'})
+            
+        close_server(server)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.isdir(self.folder))
+        
+        
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Tests of the command line interface in cli.py, run in this process with
+stdin, stdout and stderr swapped for strings. Run from the top folder with
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import json
+import unittest
+from StringIO import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+from helpers import DatabaseTest, cheap_kdf
+import cli
+from PasswordData import PasswordData, Entry
+
+cheap_kdf()
+
+###############################################################################
+class CliTest(DatabaseTest):
+    """ Commands run against a database file """
+    def setUp(self):
+        DatabaseTest.setUp(self)
+        
+        self.environ = os.environ.copy()
+        os.environ[cli.PASSWORD_VARIABLE] = 'password'
+        os.environ.pop(cli.AGENT_VARIABLE, None)
+        
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
+        DatabaseTest.tearDown(self)
+        
+    #--------------------------------------------------------------------------
+    def run_cli(self, *argv, **kwargs):
+        """ Exit status, stdout lines and stderr of a command """
+        streams = sys.stdin, sys.stdout, sys.stderr
+        sys.stdin = StringIO(kwargs.get('stdin', ''))
+        sys.stdout, sys.stderr = StringIO(), StringIO()
+        try:
+            status = cli.main(['--db', self.path] + list(argv))
+            out, err = sys.stdout.getvalue(), sys.stderr.getvalue()
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = streams
+            
+        return status, out.splitlines(), err
+        
+    #--------------------------------------------------------------------------
+    def test_list_and_get(self):
+        status, out, err = self.run_cli('list')
+        self.assertEqual(status, 0)
+        self.assertEqual(out, ['Bank\tacct\tMoney', 'Bank\tjoint\tMoney',
+                               'GitHub\tme\tWeb'])
+        self.assertEqual(self.run_cli('list', 'git')[1], ['GitHub\tme\tWeb'])
+        self.assertEqual(self.run_cli('list', '-c', 'Web')[1], 
+                         ['GitHub\tme\tWeb'])
+        
+        self.assertEqual(self.run_cli('get', 'github'), (0, ['hunter2'], ''))
+        self.assertEqual(self.run_cli('get', 'github', '-f', 'username'), 
+                         (0, ['me'], ''))
+        
+        status, out, err = self.run_cli('get', 'bank')
+        self.assertEqual((status, out), (1, []))
+        self.assertIn('2 entries are named bank', err)
+        self.assertEqual(self.run_cli('get', 'nope')[0], 1)
+        
+    #--------------------------------------------------------------------------
+    def test_get_many(self):
+        status, out, err = self.run_cli('get-many', stdin='GitHub\n\nnope\n')
+        self.assertEqual(status, 1)
+        self.assertEqual([json.loads(l) for l in out],
+                         [{'key': 'GitHub', 'value': 'hunter2'},
+                          {'key': 'nope', 'error': 'No entry named nope'}])
+        self.assertEqual(err, '1 of 2 names did not match one entry\n')
+        
+        # a value that is not utf-8 is given in base64
+        data = PasswordData('password', self.path)
+        data.AddEntry(Entry('Raw', '', '\xff\xfe', '', ''))
+        data.SaveChanges()
+        status, out, err = self.run_cli('get-many', 'raw', 'github')
+        self.assertEqual(status, 0)
+        self.assertEqual([json.loads(l) for l in out],
+                         [{'key': 'raw', 'value': '//4=', 'base64': True},
+                          {'key': 'github', 'value': 'hunter2'}])
+        
+    #--------------------------------------------------------------------------
+    def test_add(self):
+        self.assertEqual(self.run_cli('add', 'Mail', 'me', '-p', 'letters', 
+                                      '-c', 'Web'), (0, [], ''))
+        self.assertEqual(self.run_cli('get', 'mail')[1], ['letters'])
+        
+        status, out, err = self.run_cli('add', 'Mail', 'me', '-p', 'letters',
+                                        '-c', 'Web')
+        self.assertEqual(status, 1)
+        self.assertIn('identical entry', err)
+        
+    #--------------------------------------------------------------------------
+    def test_csv(self):
+        csvFile = os.path.join(self.folder, 'entries.csv')
+        self.assertEqual(self.run_cli('export-csv', csvFile)[0], 0)
+        
+        # the copy has every entry already, and one more is added
+        with open(csvFile, 'a') as f:
+            f.write('Mail,me,letters,Web,\n')
+        status, out, err = self.run_cli('import-csv', csvFile)
+        self.assertEqual(status, 0)
+        self.assertEqual(err, 'Imported 1 entries\n')
+        self.assertEqual(len(self.run_cli('list')[1]), 4)
+        
+    #--------------------------------------------------------------------------
+    def test_rekey(self):
+        os.environ[cli.NEW_PASSWORD_VARIABLE] = 'other'
+        self.assertEqual(self.run_cli('rekey'), (0, [], ''))
+        
+        status, out, err = self.run_cli('get', 'github')
+        self.assertEqual(status, 1)
+        self.assertEqual(err, 'Incorrect password\n')
+        
+        os.environ[cli.PASSWORD_VARIABLE] = 'other'
+        self.assertEqual(self.run_cli('get', 'github')[1], ['hunter2'])
+        
+        os.environ[cli.NEW_PASSWORD_VARIABLE] = ''
+        self.assertEqual(self.run_cli('rekey')[0], 1)
+        
+    #--------------------------------------------------------------------------
+    def test_no_database(self):
+        self.path = ''
+        self.assertEqual(self.run_cli('list')[0], 2)
+        
+        self.path = os.path.join(self.folder, 'missing.db')
+        status, out, err = self.run_cli('list')
+        self.assertEqual(status, 1)
+        self.assertEqual(err, 'File could not be loaded\n')
+        
+    #--------------------------------------------------------------------------
+    def test_ids(self):
+        status, out, err = self.run_cli('list', 'bank', '--ids')
+        self.assertEqual(out, ['2\tBank\tacct\tMoney', 
+                               '3\tBank\tjoint\tMoney'])
+        
+        status, out, err = self.run_cli('get-many', '--ids', '3', '1')
+        self.assertEqual(status, 0)
+        self.assertEqual([json.loads(l) for l in out],
+                         [{'key': 3, 'value': 'shared'},
+                          {'key': 1, 'value': 'hunter2'}])
+        
+        status, out, err = self.run_cli('get-many', '--ids', '-f', 'username',
+                                        stdin='2\n9\n')
+        self.assertEqual(status, 1)
+        self.assertEqual([json.loads(l) for l in out],
+                         [{'key': 2, 'value': 'acct'},
+                          {'key': 9, 'error': 'No entry with id 9'}])
+        self.assertEqual(err, '1 of 2 ids did not match one entry\n')
+        
+        status, out, err = self.run_cli('get-many', '--ids', 'bank')
+        self.assertEqual(status, 1)
+        self.assertIn('whole numbers', err)
+        
+        # without --ids every key is a name
+        status, out, err = self.run_cli('get-many', '3')
+        self.assertEqual(status, 1)
+        self.assertEqual(json.loads(out[0])['error'], 'No entry named 3')
+        
+        
+if __name__ == '__main__':
+    unittest.main()
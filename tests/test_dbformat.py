@@ -0,0 +1,227 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+Tests of the version 2 file format in dbformat.py: records and the journal
+read back as written, whether streamed or read one at a time through the
+index. Run from the top folder with
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+import dbformat
+from kdf import KdfParams, PBKDF2
+from dbformat import *
+
+RECORDS = [(1, ['example.com', 'me', 'hunter2', 'Web', '']),
+           (2, ['bank', 'acct', 'p' * 100, 'Money', 'line 1\nline 2']),
+           (5, [chr(29) + chr(30), chr(30), chr(0) * 3, chr(29), '\xff\xfe'])]
+
+###############################################################################
+class DbFormatTest(unittest.TestCase):
+    """ Files written with write_db and append_journal, read by DbReader """
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'db')
+        self.kdf = KdfParams(PBKDF2, os.urandom(16), (1000, 0, 0))
+        self.key = self.kdf.derive('password')
+        
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        
+    #--------------------------------------------------------------------------
+    def write(self, records=RECORDS, nextId=6, chunkSize=CHUNK_SIZE):
+        """ Write a snapshot, returning where its journal starts """
+        with open(self.path, 'wb') as df:
+            return write_db(df, self.key, self.kdf, records, nextId, 
+                            chunkSize)
+            
+    #--------------------------------------------------------------------------
+    def append(self, ops, journalEnd):
+        """ Append a journal segment, returning the new end of the journal """
+        with open(self.path, 'r+b') as df:
+            return append_journal(df, self.key, ops, journalEnd)
+            
+    #--------------------------------------------------------------------------
+    def read(self, key=None, chunkSize=CHUNK_SIZE):
+        """ Every record as of the last save, and the next unused id """
+        with open(self.path, 'rb') as df:
+            reader = DbReader(df, key or self.key)
+            return list(reader.iter_current(chunkSize)), reader.next_id()
+            
+    #--------------------------------------------------------------------------
+    def flip(self, pos):
+        """ Change one bit of the file """
+        with open(self.path, 'r+b') as df:
+            df.seek(pos)
+            byte = df.read(1)
+            df.seek(pos)
+            df.write(chr(ord(byte) ^ 1))
+            
+    #--------------------------------------------------------------------------
+    def test_round_trip(self):
+        self.write()
+        records, nextId = self.read()
+        self.assertEqual(records, RECORDS)
+        self.assertEqual(nextId, 6)
+        
+        with open(self.path, 'rb') as df:
+            self.assertTrue(is_container(df))
+            self.assertEqual(df.read(len(MAGIC) + 1), MAGIC + chr(2))
+            df.seek(0)
+            self.assertEqual(read_kdf(df), self.kdf)
+            reader = DbReader(df, self.key)
+            self.assertEqual(len(reader), 3)
+            self.assertEqual(list(reader.read_records([5, 1])), 
+                             [RECORDS[2][1], RECORDS[0][1]])
+                             
+    #--------------------------------------------------------------------------
+    def test_small_chunks(self):
+        # records split across chunks, in writing and in streaming
+        self.write(chunkSize=16)
+        self.assertEqual(self.read(chunkSize=16), (RECORDS, 6))
+        
+    #--------------------------------------------------------------------------
+    def test_empty(self):
+        self.write([], 1)
+        self.assertEqual(self.read(), ([], 1))
+        
+    #--------------------------------------------------------------------------
+    def test_journal(self):
+        end = self.write()
+        end = self.append([(JOURNAL_ADD, 6, ['new', 'u', 'p', 'c', '']),
+                           (JOURNAL_UPDATE, 1, ['changed', 'u', 'p', 'c', ''])],
+                          end)
+        self.append([(JOURNAL_DELETE, 2, []),
+                     (JOURNAL_ADD, 7, [chr(30), chr(29), '', '', ''])], end)
+                     
+        records, nextId = self.read()
+        self.assertEqual(records, 
+                         [(1, ['changed', 'u', 'p', 'c', '']), RECORDS[2],
+                          (6, ['new', 'u', 'p', 'c', '']),
+                          (7, [chr(30), chr(29), '', '', ''])])
+        self.assertEqual(nextId, 8)
+        
+        with open(self.path, 'rb') as df:
+            reader = DbReader(df, self.key)
+            self.assertEqual(reader.read_record(6), ['new', 'u', 'p', 'c', ''])
+            self.assertRaises(KeyError, reader.read_record, 2)
+            self.assertEqual(reader.current_count(), 4)
+            
+    #--------------------------------------------------------------------------
+    def test_truncated_journal_segment_ignored(self):
+        end = self.write()
+        end = self.append([(JOURNAL_ADD, 6, ['kept', '', '', '', ''])], end)
+        self.append([(JOURNAL_ADD, 7, ['lost', '', '', '', ''])], end)
+        
+        with open(self.path, 'r+b') as df:
+            df.truncate(os.path.getsize(self.path) - 5)
+            
+        records, nextId = self.read()
+        self.assertEqual([r[0] for r in records], [1, 2, 5, 6])
+        
+        with open(self.path, 'rb') as df:
+            reader = DbReader(df, self.key)
+            reader.read_journal()
+            self.assertEqual(reader.journalEnd, end)
+            
+    #--------------------------------------------------------------------------
+    def test_wrong_key(self):
+        self.write()
+        self.assertRaises(WrongPasswordError, self.read, 
+                          self.kdf.derive('wrong'))
+                          
+    #--------------------------------------------------------------------------
+    def test_tampered_record(self):
+        self.write()
+        self.flip(HEADER_SIZE + 40)
+        self.assertRaises(CorruptFileError, self.read)
+        
+    #--------------------------------------------------------------------------
+    def test_tampered_header(self):
+        self.write()
+        # a byte of the salt, which only the header MAC protects
+        self.flip(20)
+        self.assertRaises(CorruptFileError, self.read)
+        
+    #--------------------------------------------------------------------------
+    def test_tampered_index(self):
+        journalStart = self.write()
+        self.flip(journalStart - 1)
+        self.assertRaises(CorruptFileError, self.read)
+        
+    #--------------------------------------------------------------------------
+    def test_tampered_journal(self):
+        end = self.write()
+        self.append([(JOURNAL_ADD, 6, ['new', '', '', '', ''])], end)
+        self.flip(os.path.getsize(self.path) - 40)
+        self.assertRaises(CorruptFileError, self.read)
+        
+    #--------------------------------------------------------------------------
+    def test_not_a_database(self):
+        with open(self.path, 'wb') as df:
+            df.write('x' * 100)
+            
+        with open(self.path, 'rb') as df:
+            self.assertFalse(is_container(df))
+            self.assertEqual(df.tell(), 0)
+            self.assertRaises(IOError, DbReader, df, self.key)
+            
+    #--------------------------------------------------------------------------
+    def test_parallel(self):
+        records = [(i, ['name %d' % i, 'u', 'p' * (i % 50), 'c', ''])
+                   for i in range(1, 1001)]
+        self.write(records, 1001)
+        
+        # any snapshot is decrypted by worker processes when asked for
+        parallelMin = dbformat.PARALLEL_MIN
+        dbformat.PARALLEL_MIN = 0
+        try:
+            with open(self.path, 'rb') as df:
+                reader = DbReader(df, self.key)
+                for workers in (1, 2, 3):
+                    self.assertEqual(list(reader.iter_records(2048, workers)),
+                                     records)
+                    
+            self.flip(os.path.getsize(self.path) // 2)
+            with open(self.path, 'rb') as df:
+                reader = DbReader(df, self.key)
+                self.assertRaises(CorruptFileError, list, 
+                                  reader.iter_records(2048, 2))
+        finally:
+            dbformat.PARALLEL_MIN = parallelMin
+        
+        
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Tests of the key derivation in kdf.py. Run from the top folder with
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import hashlib
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+import kdf
+from kdf import *
+
+###############################################################################
+class KdfTest(unittest.TestCase):
+    """ Keys derived from passwords, and the cost chosen for new files """
+    def setUp(self):
+        # keep key derivation cheap, the tests do not need a slow key
+        self.saved = kdf.TARGET_TIME, kdf.MIN_ITERATIONS, kdf.MIN_SCRYPT_LOG2N
+        kdf.TARGET_TIME = 0.001
+        kdf.MIN_ITERATIONS = 1
+        kdf.MIN_SCRYPT_LOG2N = 10
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+        kdf.TARGET_TIME, kdf.MIN_ITERATIONS, kdf.MIN_SCRYPT_LOG2N = self.saved
+
+    #--------------------------------------------------------------------------
+    def test_legacy(self):
+        params = KdfParams(LEGACY)
+        self.assertEqual(params.derive('password'),
+                         hashlib.sha256('password').digest())
+
+    #--------------------------------------------------------------------------
+    def test_derive(self):
+        for method in available():
+            params = new_params(method)
+            key = params.derive('password')
+            self.assertEqual(len(key), KEY_SIZE)
+            self.assertEqual(params.derive('password'), key)
+            self.assertEqual(params.derive(u'password'), key)
+            self.assertNotEqual(params.derive('Password'), key)
+
+            # a fresh salt gives a different key for the same password
+            other = new_params(method)
+            self.assertNotEqual(other, params)
+            self.assertNotEqual(other.derive('password'), key)
+
+            same = KdfParams(method, params.salt, params.cost)
+            self.assertEqual(same, params)
+            self.assertEqual(same.derive('password'), key)
+
+    #--------------------------------------------------------------------------
+    def test_unicode_password(self):
+        params = new_params(PBKDF2)
+        self.assertEqual(params.derive(u'caf\xe9'),
+                         params.derive(u'caf\xe9'.encode('utf-8')))
+
+    #--------------------------------------------------------------------------
+    def test_calibrate(self):
+        cost = calibrate(PBKDF2)
+        self.assertTrue(cost[0] >= kdf.MIN_ITERATIONS)
+        self.assertEqual(new_params(PBKDF2).cost, cost)
+
+        # a cost is only measured once for each target
+        self.assertTrue(calibrate(PBKDF2) is cost)
+
+        kdf.MIN_ITERATIONS = 10**9
+        self.assertEqual(calibrate(PBKDF2, 0.002)[0], 10**9)
+
+    #--------------------------------------------------------------------------
+    def test_unsupported(self):
+        self.assertRaises(IOError, KdfParams, 99)
+        self.assertRaises(ValueError, calibrate, LEGACY)
+
+
+if __name__ == '__main__':
+    unittest.main()
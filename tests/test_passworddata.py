@@ -0,0 +1,487 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+Tests of saving and loading with PasswordData: every field survives a save,
+changes are journaled and folded back in by a compaction, and files in the
+original format are read and upgraded. Run from the top folder with
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+from Crypto.Hash import SHA256
+from Crypto.Cipher import AES
+from Crypto import Random
+
+import kdf
+from helpers import cheap_kdf
+from PasswordData import *
+from dbformat import DbReader, is_container, read_kdf, HEADER_SIZE
+from sealed import Sealed
+
+cheap_kdf()
+
+FIELDS = [['example.com', 'me', 'hunter2', 'Web', ''],
+          ['bank', 'acct', 'p' * 100, 'Money', 'line 1\nline 2\n'],
+          ['tokens' + chr(29), chr(30) + 'u', chr(29) + chr(30), 
+           chr(30), chr(29)],
+          ['', '', '', '', ''],
+          [u'caf\xe9'.encode('utf-8'), '\xff\xfe', chr(0) * 4, 'Web', ',"']]
+
+#------------------------------------------------------------------------------
+def make_entries(fields=FIELDS):
+    return [Entry(*f) for f in fields]
+    
+#------------------------------------------------------------------------------
+def write_legacy(path, password, entries):
+    """ Write entries to a file in the original, single blob format """
+    es = TOKEN1.join([TOKEN2.join(e.col_strings()) for e in entries]) + TOKEN1
+    
+    iv = Random.new().read(AES.block_size)
+    encrypter = AES.new(SHA256.new(password).digest(), AES.MODE_CBC, iv)
+    
+    bs = AES.block_size
+    buff = (bs*(len(es) % bs > 0) - (len(es) % bs))*BUFFER
+    
+    with open(path, 'wb') as df:
+        df.write(iv)
+        df.write(encrypter.encrypt(es+buff))
+        
+###############################################################################
+class PasswordDataTest(unittest.TestCase):
+    """ Round trips of entries through db files """
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, 'passwords.db')
+        
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        
+    #--------------------------------------------------------------------------
+    def create(self, entries):
+        data = PasswordData('password', self.path, new=True)
+        for e in entries:
+            data.AddEntry(e)
+        data.SaveChanges()
+        return data
+        
+    #--------------------------------------------------------------------------
+    def load(self, password='password', lazy=True):
+        data = PasswordData(password, self.path, lazy=lazy)
+        self.assertTrue(data.valid)
+        return data
+        
+    #--------------------------------------------------------------------------
+    def fields(self, data):
+        """ The fields of every entry, in the order they were added """
+        return [e.record_strings() for e in 
+                sorted(data.entries.values(), key=lambda e: e.tag)]
+                
+    #--------------------------------------------------------------------------
+    def snapshot(self, data):
+        """ Number of records in the snapshot and whether a journal follows """
+        with open(self.path, 'rb') as df:
+            reader = DbReader(df, data.key)
+            reader.read_journal()
+            return len(reader), reader.journalEnd > reader.journalStart
+            
+    #--------------------------------------------------------------------------
+    def test_round_trip(self):
+        self.create(make_entries())
+        self.assertEqual(self.fields(self.load()), FIELDS)
+        self.assertEqual(self.fields(self.load(lazy=False)), FIELDS)
+        
+    #--------------------------------------------------------------------------
+    def test_read_entries(self):
+        self.create(make_entries())
+        data = self.load()
+        tags = sorted(data.entries)
+        read = data.ReadEntries([tags[4], tags[2]])
+        self.assertEqual([e.record_strings() for e in read], 
+                         [FIELDS[4], FIELDS[2]])
+                         
+    #--------------------------------------------------------------------------
+    def test_journal_then_compact(self):
+        self.create(make_entries(FIELDS[:2] * 3))
+        
+        data = self.load()
+        tags = sorted(data.entries)
+        data.AddEntry(Entry(*FIELDS[2]))
+        data.UpdateEntry(tags[0], Entry(*FIELDS[4]))
+        data.DeleteEntry(tags[1])
+        data.SaveChanges()
+        
+        expected = [FIELDS[4]] + FIELDS[:2] * 2 + [FIELDS[2]]
+        self.assertEqual(self.snapshot(data), (6, True))
+        self.assertEqual(self.fields(self.load()), expected)
+        
+        data = self.load()
+        data.Compact()
+        self.assertEqual(self.snapshot(data), (6, False))
+        self.assertEqual(self.fields(self.load()), expected)
+        
+    #--------------------------------------------------------------------------
+    def test_truncated_journal_ignored(self):
+        self.create(make_entries(FIELDS[:2] * 3))
+        
+        data = self.load()
+        data.AddEntry(Entry(*FIELDS[2]))
+        data.SaveChanges()
+        size = os.path.getsize(self.path)
+        data.AddEntry(Entry(*FIELDS[4]))
+        data.SaveChanges()
+        
+        with open(self.path, 'r+b') as df:
+            df.truncate(size + 10)
+            
+        self.assertEqual(self.fields(self.load()), 
+                         FIELDS[:2] * 3 + [FIELDS[2]])
+                         
+                         
+    #--------------------------------------------------------------------------
+    def test_import_csv_sealed(self):
+        csvFile = os.path.join(self.folder, 'entries.csv')
+        with open(csvFile, 'w') as f:
+            f.write('a,u,one,Web,\nb,u,two,Web,\n')
+            
+        data = PasswordData('password', self.path, new=True)
+        data.ImportCSV(csvFile)
+        self.assertEqual(sorted(e.password for e in data.entries.values()),
+                         ['one', 'two'])
+        self.assertTrue(all(isinstance(e._password, Sealed) 
+                            for e in data.entries.values()))
+        
+    #--------------------------------------------------------------------------
+    def test_is_duplicate_sealed(self):
+        self.create(make_entries())
+        data = self.load()
+        self.assertTrue(all(isinstance(e._password, Sealed) 
+                            for e in data.entries.values()))
+        
+        # same fields, the passwords are compared once unsealed
+        for f in FIELDS:
+            self.assertTrue(data.IsDuplicate(Entry(*f)))
+            
+            sealed = Entry(*f)
+            sealed.seal()
+            self.assertTrue(data.IsDuplicate(sealed))
+            
+        # same fields but another password
+        for f in FIELDS:
+            other = Entry(*f)
+            other.password = f[2] + 'x'
+            self.assertFalse(data.IsDuplicate(other))
+            
+        self.assertFalse(data.IsDuplicate(Entry('example.com', 'me', 
+                                                'hunter2', 'Money', '')))
+        
+    #--------------------------------------------------------------------------
+    def test_import_csv_duplicates(self):
+        self.create(make_entries(FIELDS[:1]))
+        csvFile = os.path.join(self.folder, 'entries.csv')
+        with open(csvFile, 'w') as f:
+            f.write('example.com,me,hunter2,Web,\n'
+                    'a,u,one,Web,\n'
+                    'a,u,one,Web,\n'
+                    'a,u,two,Web,\n'
+                    'example.com,me,hunter3,Web,\n'
+                    'a,u,one,Web,\n')
+        
+        # repeats of stored entries and of rows earlier in the file are left
+        # out, rows with another password are not
+        data = self.load()
+        data.ImportCSV(csvFile)
+        self.assertEqual(self.fields(data), 
+                         [FIELDS[0], ['a', 'u', 'one', 'Web', ''],
+                          ['a', 'u', 'two', 'Web', ''],
+                          ['example.com', 'me', 'hunter3', 'Web', '']])
+        
+    #--------------------------------------------------------------------------
+    def test_get_many(self):
+        data = self.create(make_entries(FIELDS[:2] * 2))
+        
+        found = list(data.GetMany(['EXAMPLE.com', 3, 'bank', 'nope', 99]))
+        self.assertEqual([k for k, es in found], 
+                         ['EXAMPLE.com', 3, 'bank', 'nope', 99])
+        self.assertEqual([sorted(e.tag for e in es) for k, es in found],
+                         [[1, 3], [3], [2, 4], [], []])
+        
+        # ids are never taken for names, even a name that looks like one
+        data.AddEntry(Entry('3', '', '', 'Web', ''))
+        found = list(data.GetMany([3, '3', 4], 'Web'))
+        self.assertEqual([[e.tag for e in es] for k, es in found], 
+                         [[3], [5], []])
+        
+    #--------------------------------------------------------------------------
+    def test_categories(self):
+        self.create(make_entries())
+        data = self.load()
+        tags = sorted(data.entries)
+        
+        def entries(cat):
+            return sorted(e.tag for e in data.GetEntries(cat))
+        
+        self.assertEqual(data.GetCategories(), 
+                         ['All', '', chr(30), 'Money', 'Web'])
+        self.assertEqual(entries('All'), tags)
+        self.assertEqual(entries('Web'), [tags[0], tags[4]])
+        self.assertEqual(entries('Money'), [tags[1]])
+        self.assertEqual(entries('Nope'), [])
+        
+        # a new category goes in its sorted place
+        data.AddEntry(Entry('x', '', '', 'Games', ''))
+        self.assertEqual(data.GetCategories(), 
+                         ['All', '', chr(30), 'Games', 'Money', 'Web'])
+        self.assertEqual(entries('Games'), [tags[-1] + 1])
+        
+        # and a category is gone once an update or delete empties it
+        data.UpdateEntry(tags[1], Entry(*FIELDS[1][:3] + ['Web', '']))
+        self.assertEqual(data.GetCategories(), 
+                         ['All', '', chr(30), 'Games', 'Web'])
+        self.assertEqual(entries('Money'), [])
+        self.assertEqual(entries('Web'), [tags[0], tags[1], tags[4]])
+        
+        data.DeleteEntry(tags[2])
+        self.assertEqual(data.GetCategories(), ['All', '', 'Games', 'Web'])
+        
+        # deleting one of several entries keeps the category
+        data.DeleteEntry(tags[0])
+        self.assertEqual(data.GetCategories(), ['All', '', 'Games', 'Web'])
+        self.assertEqual(entries('Web'), [tags[1], tags[4]])
+        
+    #--------------------------------------------------------------------------
+    def test_filter(self):
+        self.create(make_entries())
+        
+        for searchable in (False, True):
+            data = PasswordData(None, self.path, defer=True)
+            job = data.PrepareLoad('password', searchable)
+            job.Run(data.InsertLoaded)
+            data.FinishLoad(job)
+            self.assertEqual(job.search is not None, searchable)
+            self.assertEqual(job.fuzzy is not None, searchable)
+            
+            # every entry, in display order, for a query without words
+            self.assertEqual([e.tag for e in data.Filter(' ')],
+                             [3, 4, 2, 5, 1])
+            self.assertEqual([e.tag for e in data.Filter('', 'Web')], [5, 1])
+            self.assertEqual([e.tag for e in data.Filter('we')], [5, 1])
+            self.assertEqual([e.tag for e in data.Filter('me', 'Web')], [1])
+            
+            data.UpdateEntry(1, Entry('a', 'me', '', 'Web', ''))
+            data.DeleteEntry(5)
+            data.AddEntry(Entry('b', '', '', 'Web', ''))
+            self.assertEqual([e.tag for e in data.Filter('web')], [1, 6])
+            self.assertEqual([e.tag for e in data.Filter('example')], [])
+            self.assertEqual([e.tag for e in data.Search('bnak')], [2])
+        
+    #--------------------------------------------------------------------------
+    def test_load_job(self):
+        self.create(make_entries())
+        data = PasswordData(None, self.path, defer=True)
+        job = data.PrepareLoad('password')
+        job.batchSize = 2
+        
+        # the entries are handed over in batches, sealed, and nothing can be
+        # saved until the load is finished
+        sizes = []
+        def insert(batch):
+            sizes.append(len(batch))
+            self.assertTrue(all(isinstance(e._password, Sealed) 
+                                for e in batch))
+            data.InsertLoaded(batch)
+            
+        job.Run(insert)
+        self.assertEqual(sizes, [2, 2, 1])
+        self.assertEqual((job.count, job.total), (5, 5))
+        self.assertRaises(RuntimeError, data.PrepareSave)
+        
+        data.FinishLoad(job)
+        self.assertFalse(data.loading)
+        self.assertEqual(self.fields(data), FIELDS)
+        
+        # a cancelled job stops handing over entries
+        job = PasswordData(None, self.path, defer=True).PrepareLoad('password')
+        job.batchSize = 2
+        job.Run(lambda batch: job.Cancel())
+        self.assertEqual(job.count, 2)
+        
+    #--------------------------------------------------------------------------
+    def test_saved_by_another_program(self):
+        self.create(make_entries(FIELDS[:2] * 3))
+        
+        data = self.load()
+        other = self.load()
+        other.AddEntry(Entry(*FIELDS[2]))
+        other.Compact()
+        
+        # the journal here no longer belongs to the file, so it is rewritten
+        data.AddEntry(Entry(*FIELDS[4]))
+        data.SaveChanges()
+        self.assertEqual(self.fields(self.load()), 
+                         FIELDS[:2] * 3 + [FIELDS[4]])
+                         
+        # and a save already under way when the file changes is refused
+        other = self.load()
+        data.AddEntry(Entry(*FIELDS[3]))
+        job = data.PrepareSave()
+        other.AddEntry(Entry(*FIELDS[2]))
+        other.Compact()
+        
+        self.assertRaises(IOError, data._save, job)
+        self.assertTrue(data.HasChanged())
+        self.assertEqual(self.fields(self.load()), 
+                         FIELDS[:2] * 3 + [FIELDS[4], FIELDS[2]])
+                         
+    #--------------------------------------------------------------------------
+    def test_failed_save_as(self):
+        data = self.create(make_entries())
+        
+        # a new password for a file that could not be written stays there
+        dest = os.path.join(self.folder, 'missing', 'copy.db')
+        data.AddEntry(Entry(*FIELDS[0]))
+        self.assertRaises((IOError, OSError), data.SaveChanges, dest=dest,
+                          newpassword='other')
+        self.assertTrue(data.HasChanged())
+        
+        data.SaveChanges()
+        self.assertEqual(data.dbFile, self.path)
+        self.assertEqual(self.fields(self.load()), FIELDS + [FIELDS[0]])
+        self.assertFalse(PasswordData('other', self.path).valid)
+        
+    #--------------------------------------------------------------------------
+    def test_failed_password_change(self):
+        data = self.create(make_entries())
+        
+        def fail():
+            raise IOError('Disk full')
+        
+        # a new password for this file is kept for the next save
+        job = data.PrepareSave(newpassword='other')
+        job._write_file = fail
+        self.assertRaises(IOError, data._save, job)
+        self.assertIsNone(data._newPassword)
+        self.assertIsNotNone(data._newKey)
+        
+        data.SaveChanges()
+        self.assertEqual(self.fields(self.load('other')), FIELDS)
+        self.assertFalse(PasswordData('password', self.path).valid)
+        
+    #--------------------------------------------------------------------------
+    def test_save_through_link(self):
+        # the db file may be a link, like into a folder shared with a cloud
+        shared = os.path.join(self.folder, 'shared')
+        os.mkdir(shared)
+        target = os.path.join(shared, 'passwords.db')
+        os.symlink(target, self.path)
+        self.create(make_entries(FIELDS[:1]))
+        os.chmod(target, 0o640)
+        
+        data = self.load()
+        data.AddEntry(Entry(*FIELDS[1]))
+        data.SaveChanges()
+        data.Compact()
+        
+        self.assertTrue(os.path.islink(self.path))
+        self.assertEqual(os.stat(target).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(shared), ['passwords.db'])
+        self.assertEqual(self.fields(self.load()), FIELDS[:2])
+        
+    #--------------------------------------------------------------------------
+    def test_wrong_password(self):
+        self.create(make_entries())
+        data = PasswordData('wrong', self.path)
+        self.assertFalse(data.valid)
+        self.assertEqual(data.errMsg, 'Incorrect password')
+        
+    #--------------------------------------------------------------------------
+    def test_tampered_file(self):
+        self.create(make_entries())
+        size = os.path.getsize(self.path)
+        
+        # the salt changes the key, so the header MAC is altered instead
+        for pos in [HEADER_SIZE - 1, size // 2, size - 1]:
+            with open(self.path, 'r+b') as df:
+                df.seek(pos)
+                byte = df.read(1)
+                df.seek(pos)
+                df.write(chr(ord(byte) ^ 1))
+                
+            data = PasswordData('password', self.path)
+            self.assertFalse(data.valid)
+            self.assertEqual(data.errMsg, 
+                             'File is damaged or has been altered')
+                             
+            with open(self.path, 'r+b') as df:
+                df.seek(pos)
+                df.write(byte)
+                
+    #--------------------------------------------------------------------------
+    def test_legacy_upgrade(self):
+        # the original format cannot hold the separator characters
+        legacy = [f for f in FIELDS if not 
+                  any(c in ''.join(f) for c in (TOKEN1, TOKEN2, BUFFER))]
+        write_legacy(self.path, 'password', make_entries(legacy))
+        
+        # the salted key is left for the first save to derive
+        calls = []
+        calibrate = kdf.calibrate
+        kdf.calibrate = lambda *args: calls.append(args) or calibrate(*args)
+        try:
+            data = self.load()
+        finally:
+            kdf.calibrate = calibrate
+        self.assertEqual(calls, [])
+        self.assertEqual(self.fields(data), legacy)
+        self.assertEqual([e.col_strings() for e in data.ReadEntries([2])],
+                         legacy[1:2])
+        
+        # and the password for it is not kept in the clear until then
+        self.assertIsInstance(data._newPassword, Sealed)
+        self.assertNotIn('password', data._newPassword)
+        self.assertFalse(PasswordData('wrong', self.path).valid)
+        
+        data.AddEntry(Entry(*FIELDS[0]))
+        data.SaveChanges()
+        
+        with open(self.path, 'rb') as df:
+            self.assertTrue(is_container(df))
+            self.assertEqual(read_kdf(df).method, kdf.available()[-1])
+            
+        self.assertEqual(self.fields(self.load()), legacy + [FIELDS[0]])
+        self.assertFalse(PasswordData('wrong', self.path).valid)
+        
+        
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Tests of the passwords kept sealed in memory by sealed.py, and of entries
+loaded with them sealed. Run from the top folder with
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+from sealed import *
+from PasswordData import Entry
+
+VALUES = ['hunter2', '', 'p' * 100, '\0\xff', u'caf\xe9', 'x']
+
+###############################################################################
+class SecretStoreTest(unittest.TestCase):
+    """ Values sealed and unsealed by one store """
+    def setUp(self):
+        self.store = SecretStore(cacheSize=2)
+        
+    #--------------------------------------------------------------------------
+    def test_round_trip(self):
+        sealed = self.store.seal_many(VALUES)
+        self.assertEqual(len(sealed), len(VALUES))
+        
+        for value, s in zip(VALUES, sealed):
+            self.assertTrue(isinstance(s, Sealed))
+            self.assertEqual(self.store.unseal(s), to_bytes(value))
+            self.assertEqual(self.store.unseal(s, False), to_bytes(value))
+            
+        # long values are not kept in the clear
+        self.assertNotIn('p' * 16, ''.join(sealed))
+            
+    #--------------------------------------------------------------------------
+    def test_fresh_nonce(self):
+        a, = self.store.seal_many(['hunter2'])
+        b, = self.store.seal_many(['hunter2'])
+        self.assertNotEqual(a, b)
+        
+        # another store has another key
+        other = SecretStore()
+        self.assertNotEqual(other.unseal(a), 'hunter2')
+        
+    #--------------------------------------------------------------------------
+    def test_cache(self):
+        sealed = self.store.seal_many(VALUES[:3])
+        for s in sealed:
+            self.store.unseal(s)
+        self.assertEqual(list(self.store._cache), sealed[1:])
+        
+        # uncached unsealing leaves the cache alone
+        self.store.unseal(sealed[0], False)
+        self.assertEqual(list(self.store._cache), sealed[1:])
+        
+        self.store.unseal(sealed[1])
+        self.assertEqual(list(self.store._cache), [sealed[2], sealed[1]])
+        
+        self.store.clear()
+        self.assertEqual(list(self.store._cache), [])
+        self.assertEqual(self.store.unseal(sealed[2]), VALUES[2])
+        
+        
+###############################################################################
+class SealedEntryTest(unittest.TestCase):
+    """ Entries whose password is sealed """
+    def test_entry(self):
+        e = Entry('GitHub', 'me', 'hunter2', 'Web', '')
+        e.seal()
+        self.assertTrue(isinstance(e._password, Sealed))
+        self.assertEqual(e.password, 'hunter2')
+        self.assertEqual(e.reveal(False), 'hunter2')
+        
+        # sealing again keeps the same sealed value, so the same keys
+        keys = e.col_keys()
+        e.seal()
+        self.assertEqual(e.col_keys(), keys)
+        
+        # and a sealed password compares by its value
+        other = Entry('GitHub', 'me', 'hunter2', 'Web', '')
+        self.assertEqual(e, other)
+        
+        e.password = 'new'
+        self.assertFalse(isinstance(e._password, Sealed))
+        self.assertNotEqual(e, other)
+        
+    #--------------------------------------------------------------------------
+    def test_module_store(self):
+        sealed = seal_many(['a', 'b'])
+        self.assertEqual([unseal(s) for s in sealed], ['a', 'b'])
+        self.assertEqual(unseal(seal('c'), False), 'c')
+        clear_cache()
+        self.assertEqual(unseal(sealed[0]), 'a')
+        
+        
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Tests of the in-memory search indexes in search.py. Run from the top folder
+with
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+from search import *
+
+###############################################################################
+class SearchIndexTest(unittest.TestCase):
+    """ Word prefix lookups as entries are added and removed """
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add(1, ['GitHub', 'me@example.com', 'Web', ''])
+        self.index.add(2, ['Bank of Example', 'acct', 'Money', 'savings'])
+        self.index.add(3, [u'Caf\xe9'.encode('utf-8'), 'me', 'Food', ''])
+        
+    #--------------------------------------------------------------------------
+    def test_prefixes(self):
+        self.assertEqual(self.index.find('git'), set([1]))
+        self.assertEqual(self.index.find('EXAM'), set([1, 2]))
+        self.assertEqual(self.index.find('exam ban'), set([2]))
+        self.assertEqual(self.index.find('exam food'), set())
+        self.assertEqual(self.index.find(u'caf\xe9'), set([3]))
+        self.assertEqual(self.index.find('hub'), set())
+        
+    #--------------------------------------------------------------------------
+    def test_no_words_matches_all(self):
+        self.assertEqual(self.index.find(''), set([1, 2, 3]))
+        self.assertEqual(self.index.find(' - '), set([1, 2, 3]))
+        
+    #--------------------------------------------------------------------------
+    def test_add_and_remove(self):
+        self.index.remove(2)
+        self.assertEqual(self.index.find('exam'), set([1]))
+        self.assertEqual(self.index.find('bank'), set())
+        
+        # more new words than are merged into the sorted list one at a time
+        for tag in range(10, 10 + MERGE_LIMIT * 2):
+            self.index.add(tag, ['bank%d' % tag])
+        self.assertEqual(len(self.index.find('bank')), MERGE_LIMIT * 2)
+        
+        self.index.add(2, ['Bank of Example', '', '', ''])
+        self.assertEqual(len(self.index.find('bank')), MERGE_LIMIT * 2 + 1)
+        self.assertEqual(self.index.find('bank of'), set([2]))
+
+
+###############################################################################
+class FuzzyIndexTest(unittest.TestCase):
+    """ Ranking of entries by how closely they match a mistyped query """
+    NAMES = {1: 'Web GitHub', 2: 'Web GitLab', 3: 'Mail Gmail',
+             4: 'Money Bank of Example', 5: 'Servers build-01',
+             6: 'Servers build-02', 7: 'Web example.com'}
+
+    def setUp(self):
+        self.index = FuzzyIndex()
+        for tag, name in self.NAMES.items():
+            self.index.add(tag, name)
+
+    #--------------------------------------------------------------------------
+    def best(self, query):
+        """ Tag of the closest match, checking it is close enough """
+        results = self.index.search(query, 5)
+        self.assertTrue(results, query)
+        self.assertTrue(results[0][0] <= 1, query)
+        return results[0][1]
+
+    #--------------------------------------------------------------------------
+    def check_typos(self):
+        self.assertEqual(self.best('github'), 1)
+        self.assertEqual(self.best('gthub'), 1)
+        self.assertEqual(self.best('githb'), 1)
+        self.assertEqual(self.best('gitub'), 1)
+        self.assertEqual(self.best('GitHub'), 1)
+        self.assertEqual(self.best('gmial'), 3)
+        self.assertEqual(self.best('bnak'), 4)
+        self.assertEqual(self.best('bulid-01'), 5)
+        self.assertIn(self.best('exmaple'), [4, 7])
+
+    #--------------------------------------------------------------------------
+    def test_typos(self):
+        self.check_typos()
+
+    #--------------------------------------------------------------------------
+    def test_typos_among_common_trigrams(self):
+        # enough similar entries that most of the query trigrams are common
+        for tag in range(100, 400):
+            self.index.add(tag, 'Web site%d.example.com' % tag)
+            self.index.add(-tag, 'Servers node%d-build' % tag)
+        self.check_typos()
+
+    #--------------------------------------------------------------------------
+    def test_no_match(self):
+        self.assertEqual(self.index.search('zzzzzz', 5), [])
+        self.assertEqual(self.index.search('gi', 5), [])
+        self.assertEqual(self.index.search('', 5), [])
+
+    #--------------------------------------------------------------------------
+    def test_remove(self):
+        self.index.remove(1)
+        self.assertNotIn(1, [t for d, t in self.index.search('github', 5)])
+        self.index.add(1, 'Web GitHub')
+        self.assertEqual(self.best('gthub'), 1)
+
+    #--------------------------------------------------------------------------
+    def test_substring_distance(self):
+        self.assertEqual(substring_distance('hub', 'github'), 0)
+        self.assertEqual(substring_distance('gthub', 'github'), 1)
+        self.assertEqual(substring_distance('gmial', 'mail gmail'), 1)
+        self.assertEqual(substring_distance('bnak', 'bank'), 1)
+        self.assertEqual(substring_distance('xyz', 'bank'), 3)
+        self.assertTrue(substring_distance('zzzzzz', 'bank', 1) > 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
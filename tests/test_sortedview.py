@@ -0,0 +1,163 @@
+"""
+Copyright (c) 2014, Tyler Voskuilen
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+1. Redistributions of source code must retain the above copyright notice, this
+   list of conditions and the following disclaimer.
+2. Redistributions in binary form must reproduce the above copyright notice,
+   this list of conditions and the following disclaimer in the documentation
+   and/or other materials provided with the distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Tests of the rows of the entry list in sortedview.py, which do not need wx.
+Run from the top folder with
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'PasswordLocker'))
+
+from PasswordData import Entry
+from sortedview import *
+
+#------------------------------------------------------------------------------
+def make_entries(names):
+    return [Entry(n, 'user', 'password', 'Web', '', tag=i)
+            for i, n in enumerate(names)]
+    
+#------------------------------------------------------------------------------
+def shown(view):
+    """ Names in the rows of a view """
+    return [view[row].name for row in range(len(view))]
+    
+###############################################################################
+class DisplayOrderTest(unittest.TestCase):
+    """ Keys kept in display order as objects come and go """
+    def test_order(self):
+        entries = make_entries(['b', 'a', 'c', 'a'])
+        order = DisplayOrder(entries)
+        self.assertEqual(order.keys(), [('Web a', 1), ('Web a', 3), 
+                                        ('Web b', 0), ('Web c', 2)])
+        
+        order.remove(entries[0])
+        entries[0].name = 'z'
+        order.add(entries[0])
+        order.remove(entries[3])
+        self.assertEqual([t for n, t in order.keys()], [1, 2, 0])
+        
+    #--------------------------------------------------------------------------
+    def test_many_added(self):
+        entries = make_entries(['%05d' % (i * 7 % 1000) for i in range(1000)])
+        order = DisplayOrder(entries[:10])
+        order.keys()
+        for e in entries[10:]:
+            order.add(e)
+        order.remove(entries[500])
+        
+        keys = order.keys()
+        self.assertEqual(len(keys), 999)
+        self.assertEqual(keys, sorted(keys))
+        
+        
+###############################################################################
+class SortedViewTest(unittest.TestCase):
+    """ Updates of a view from lists of objects """
+    def test_presorted(self):
+        entries = make_entries(['c', 'a', 'b'])
+        view = SortedView()
+        view.update(entries)
+        self.assertEqual(shown(view), ['a', 'b', 'c'])
+        
+        # presorted input is shown in the order it is given in
+        view.set_objects(entries[1:], presorted=True)
+        self.assertEqual(shown(view), ['a', 'b'])
+        self.assertEqual(view.row_of(entries[2].tag), 1)
+        self.assertEqual(view.row_of(entries[0].tag), -1)
+        
+    #--------------------------------------------------------------------------
+    def test_diff(self):
+        entries = make_entries(['a', 'b', 'c', 'd', 'e'])
+        view = SortedView()
+        view.update(entries)
+        
+        # nothing changed, so no rows to redraw
+        self.assertEqual(view.update(entries), (None, []))
+        
+        # a change that keeps the row is redrawn in place
+        entries[2].username = 'other'
+        self.assertEqual(view.update(entries), (None, [2]))
+        
+        # the rows from the first one inserted, removed or moved on
+        added = Entry('bb', 'user', 'password', 'Web', '', tag=5)
+        self.assertEqual(view.update(entries + [added]), (2, []))
+        self.assertEqual(shown(view), ['a', 'b', 'bb', 'c', 'd', 'e'])
+        
+        self.assertEqual(view.update(entries[1:] + [added]), (0, []))
+        self.assertEqual(shown(view), ['b', 'bb', 'c', 'd', 'e'])
+        
+        entries[4].name = 'ba'
+        self.assertEqual(view.update(entries[1:] + [added]), (1, []))
+        self.assertEqual(shown(view), ['b', 'ba', 'bb', 'c', 'd'])
+        self.assertEqual(view.row_of(entries[4].tag), 1)
+        self.assertEqual(view.row_of(entries[3].tag), 4)
+        
+        # a replaced object with the same tag is shown in its place
+        replaced = Entry('c', 'new', 'password', 'Web', '', tag=2)
+        self.assertEqual(view.update([replaced] + entries[3:] + 
+                                     [entries[1], added]), (None, [3]))
+        self.assertTrue(view[3] is replaced)
+        
+    #--------------------------------------------------------------------------
+    def test_large_diff_refills(self):
+        entries = make_entries(['%04d' % i for i in range(1000)])
+        view = SortedView()
+        view.update(entries[:500])
+        
+        first, rows = view.update(entries[500:])
+        self.assertEqual((first, rows), (0, []))
+        self.assertEqual(shown(view), ['%04d' % i for i in range(500, 1000)])
+        self.assertEqual(view.row_of(entries[0].tag), -1)
+        self.assertRaises(IndexError, view.__getitem__, 500)
+        
+    #--------------------------------------------------------------------------
+    def test_filter_and_clear(self):
+        entries = make_entries(['%04d' % i for i in range(1000)])
+        order = DisplayOrder(entries)
+        everything = [entries[t] for n, t in order.keys()]
+        
+        view = SortedView()
+        view.update(everything, presorted=True)
+        view.update(everything[::10], presorted=True)
+        self.assertEqual(len(view), 100)
+        self.assertEqual(view.row_of(entries[1].tag), -1)
+        
+        # an entry changed while it was hidden is shown as it is now
+        entries[1].name = 'changed'
+        first, rows = view.update(everything, presorted=False)
+        self.assertEqual(first, 0)
+        self.assertEqual(len(view), 1000)
+        self.assertEqual(view[999].name, 'changed')
+        self.assertEqual(view.row_of(entries[1].tag), 999)
+        self.assertEqual(view.row_of(entries[2].tag), 1)
+        
+        
+if __name__ == '__main__':
+    unittest.main()